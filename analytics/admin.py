@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.db.models import Count
 from django.utils.html import format_html
-from .models import PageView, UserActivity, SearchQuery
+from .models import PageView, UserActivity, SearchQuery, SearchQueryCount
 
 @admin.register(PageView)
 class PageViewAdmin(admin.ModelAdmin):
@@ -55,3 +55,10 @@ class SearchQueryAdmin(admin.ModelAdmin):
         
         response.context_data.update(metrics)
         return response
+
+@admin.register(SearchQueryCount)
+class SearchQueryCountAdmin(admin.ModelAdmin):
+    list_display = ('query', 'hour', 'count')
+    list_filter = ('hour',)
+    search_fields = ('query',)
+    date_hierarchy = 'hour'
@@ -0,0 +1,278 @@
+import atexit
+import os
+import random
+import re
+import threading
+from collections import Counter, deque
+import logging
+
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .models import PageView, SearchQuery, SearchQueryCount
+from .trending import TrendingSearches
+
+logger = logging.getLogger(__name__)
+
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_query(query):
+    """Canonical form used to count searches: lower-cased, single-spaced"""
+    return WHITESPACE_RE.sub(' ', (query or '').strip().lower())[:255]
+
+
+class BufferedSink:
+    """In-process buffer that writes analytics rows in batches off the request path.
+
+    Items are queued in memory and handed to ``write`` by a daemon thread
+    once ``BATCH_SIZE`` items are pending or ``FLUSH_INTERVAL`` seconds have
+    passed. When ``MAX_PENDING`` items are queued new items are dropped and
+    counted in ``dropped``, so a slow database never backs up into requests.
+    A batch that fails to write is retried once as two halves, so one bad
+    row or a transient error loses at most half of it; rows that still fail
+    are counted in ``failed``. The buffer is flushed on interpreter exit.
+    """
+
+    BATCH_SIZE = 500
+    FLUSH_INTERVAL = 2.0
+    MAX_PENDING = 10000
+    THREAD_NAME = 'analytics-buffer'
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, batch_size=None, flush_interval=None, max_pending=None):
+        self.batch_size = batch_size or self.BATCH_SIZE
+        self.flush_interval = flush_interval or self.FLUSH_INTERVAL
+        self.max_pending = max_pending or self.MAX_PENDING
+        self.dropped = 0
+        self.failed = 0
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = None
+        self._pid = None
+
+    @classmethod
+    def get_instance(cls):
+        # Checked on cls itself so every subclass gets its own instance
+        if cls.__dict__.get('_instance') is None:
+            with cls._instance_lock:
+                if cls.__dict__.get('_instance') is None:
+                    cls._instance = cls()
+                    atexit.register(cls._instance.stop)
+        return cls._instance
+
+    def add(self, item, flush_when_full=False):
+        """Queue an item; returns False if it was dropped.
+
+        With ``flush_when_full`` the item is never dropped: once the queue is
+        full the caller writes the backlog synchronously instead.
+        """
+        self._ensure_worker()
+        with self._lock:
+            if len(self._pending) >= self.max_pending and not flush_when_full:
+                self.dropped += 1
+                return False
+            self._pending.append(item)
+            pending = len(self._pending)
+
+        if flush_when_full and pending >= self.max_pending:
+            self.flush()
+        elif pending >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    def write(self, batch):
+        raise NotImplementedError
+
+    def after_write(self, batch):
+        """Called with every batch once it is written"""
+
+    def flush(self):
+        """Write all pending items; returns the number written"""
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch = [
+                        self._pending.popleft()
+                        for _ in range(min(self.batch_size, len(self._pending)))
+                    ]
+                if not batch:
+                    break
+                try:
+                    self._write(batch)
+                    written += len(batch)
+                except Exception as e:
+                    logger.warning(f"Error writing {len(batch)} buffered rows, retrying in halves: {str(e)}")
+                    middle = (len(batch) + 1) // 2
+                    for part in (batch[:middle], batch[middle:]):
+                        if not part:
+                            continue
+                        try:
+                            self._write(part)
+                            written += len(part)
+                        except Exception as e:
+                            self.failed += len(part)
+                            logger.error(f"Error writing {len(part)} buffered rows: {str(e)}", exc_info=True)
+        return written
+
+    def _write(self, batch):
+        # A savepoint keeps a failed attempt from breaking an enclosing transaction
+        with transaction.atomic():
+            self.write(batch)
+        try:
+            self.after_write(batch)
+        except Exception as e:
+            logger.error(f"Error after writing {len(batch)} buffered rows: {str(e)}", exc_info=True)
+
+    def stop(self):
+        """Stop the worker thread and flush whatever is left"""
+        self._stopped = True
+        self._wakeup.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout=self.flush_interval * 2)
+        self.flush()
+
+    def _ensure_worker(self):
+        # Threads do not survive a fork (e.g. gunicorn or Celery prefork), so restart per process
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._stopped = False
+            self._thread = threading.Thread(
+                target=self._run,
+                name=self.THREAD_NAME,
+                daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+
+class SearchLogBuffer(BufferedSink):
+    """Buffered search logging with in-memory per-query counters.
+
+    Every search increments a counter keyed by (hour, normalized query)
+    before its log row is queued, so counts stay exact even when log rows
+    are dropped under backpressure. On each flush the counters are folded
+    into ``SearchQueryCount`` with one upsert per distinct query, and
+    the same counters feed the hourly trending buckets of TrendingSearches.
+    """
+
+    THREAD_NAME = 'search-log-buffer'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._counts = Counter()
+        self._counts_lock = threading.Lock()
+
+    def log(self, user_id, query, results_count):
+        now = timezone.now()
+        normalized = normalize_query(query)
+        if normalized:
+            hour = now.replace(minute=0, second=0, microsecond=0)
+            with self._counts_lock:
+                self._counts[(normalized, hour)] += 1
+
+        return self.add(SearchQuery(
+            user_id=user_id,
+            query=query[:255],
+            results_count=results_count,
+            timestamp=now
+        ))
+
+    def write(self, batch):
+        SearchQuery.objects.bulk_create(batch)
+
+    def flush(self):
+        written = super().flush()
+        self.flush_counts()
+        return written
+
+    def flush_counts(self):
+        """Add the counters accumulated since the last flush to SearchQueryCount"""
+        with self._counts_lock:
+            counts, self._counts = self._counts, Counter()
+        if not counts:
+            return 0
+
+        table = connection.ops.quote_name(SearchQueryCount._meta.db_table)
+        # ON CONFLICT ... DO UPDATE is supported by both PostgreSQL and SQLite
+        sql = (
+            f"INSERT INTO {table} (query, hour, count) VALUES (%s, %s, %s) "
+            f"ON CONFLICT (query, hour) DO UPDATE SET count = {table}.count + excluded.count"
+        )
+        params = [
+            (query, connection.ops.adapt_datetimefield_value(hour), count)
+            for (query, hour), count in counts.items()
+        ]
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.executemany(sql, params)
+        except Exception as e:
+            # Put the counts back so they are retried on the next flush
+            with self._counts_lock:
+                self._counts.update(counts)
+            logger.error(f"Error writing search counters: {str(e)}", exc_info=True)
+            return 0
+        
+        try:
+            TrendingSearches.record(counts)
+        except Exception as e:
+            logger.error(f"Error updating trending searches: {str(e)}", exc_info=True)
+        return len(params)
+
+
+class PageViewBuffer(BufferedSink):
+    """Buffered page-view tracking, sampled under backpressure.
+
+    Once ``SAMPLE_FROM`` of ``max_pending`` is queued, views are kept with a
+    probability falling linearly to zero at ``max_pending``, so the buffer
+    degrades smoothly instead of dropping everything at once; sampled-out
+    views are counted in ``sampled_out``. Rows are written with
+    ``bulk_create`` by the worker thread.
+    """
+
+    THREAD_NAME = 'page-view-buffer'
+    SAMPLE_FROM = 0.5
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sampled_out = 0
+
+    def track(self, user_id, ip_address, url, user_agent, referrer):
+        """Queue a page view; returns False if it was sampled out or dropped"""
+        pending = len(self._pending)
+        threshold = self.max_pending * self.SAMPLE_FROM
+        if pending >= threshold:
+            keep = (self.max_pending - pending) / (self.max_pending - threshold)
+            if random.random() >= keep:
+                self.sampled_out += 1
+                return False
+
+        return self.add(PageView(
+            user_id=user_id,
+            ip_address=ip_address,
+            url=url[:255],
+            user_agent=user_agent,
+            referrer=referrer[:200] if referrer else None,
+            timestamp=timezone.now()
+        ))
+
+    def write(self, batch):
+        PageView.objects.bulk_create(batch)
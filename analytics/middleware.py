@@ -1,21 +1,36 @@
-from .models import PageView
+import ipaddress
+
+from .buffers import PageViewBuffer
 from django.utils.deprecation import MiddlewareMixin
 
 class AnalyticsMiddleware(MiddlewareMixin):
+    """Record a page view per request through PageViewBuffer, without touching the database"""
+
     def process_request(self, request):
         if not request.path.startswith('/admin/') and not request.path.startswith('/static/'):
-            PageView.objects.create(
-                user=request.user if request.user.is_authenticated else None,
-                ip_address=self.get_client_ip(request),
+            ip_address = self.get_client_ip(request)
+            if not ip_address:
+                return
+            PageViewBuffer.get_instance().track(
+                user_id=request.user.id if request.user.is_authenticated else None,
+                ip_address=ip_address,
                 url=request.path,
                 user_agent=request.META.get('HTTP_USER_AGENT', ''),
                 referrer=request.META.get('HTTP_REFERER', None)
             )
     
     def get_client_ip(self, request):
+        # X-Forwarded-For is client controlled; a malformed entry would fail the whole bulk insert
         x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
         if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0]
-        else:
-            ip = request.META.get('REMOTE_ADDR')
-        return ip
+            ip = self.valid_ip(x_forwarded_for.split(',')[0])
+            if ip:
+                return ip
+        return self.valid_ip(request.META.get('REMOTE_ADDR'))
+    
+    @staticmethod
+    def valid_ip(value):
+        try:
+            return str(ipaddress.ip_address((value or '').strip()))
+        except ValueError:
+            return None
@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 
@@ -7,7 +8,7 @@ class PageView(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
     ip_address = models.GenericIPAddressField()
     url = models.CharField(max_length=255)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now)  # Request time, kept when writes are buffered
     user_agent = models.TextField()
     referrer = models.URLField(null=True, blank=True)
     
@@ -36,7 +37,7 @@ class SearchQuery(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
     query = models.CharField(max_length=255)
     results_count = models.IntegerField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now)  # Search time, kept when writes are buffered
     
     class Meta:
         ordering = ['-timestamp']
@@ -44,3 +45,18 @@ class SearchQuery(models.Model):
         
     def __str__(self):
         return f"{self.query} ({self.results_count} results)"
+
+class SearchQueryCount(models.Model):
+    # Hourly search counts per normalized query, aggregated in memory before writing
+    query = models.CharField(max_length=255)
+    hour = models.DateTimeField()
+    count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        unique_together = ('query', 'hour')
+        indexes = [
+            models.Index(fields=['hour']),
+        ]
+        
+    def __str__(self):
+        return f"{self.query} @ {self.hour}: {self.count}"
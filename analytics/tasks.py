@@ -4,7 +4,8 @@ from django.utils import timezone
 from datetime import timedelta
 from django.core.mail import send_mail
 from django.conf import settings
-from .models import PageView, UserActivity, SearchQuery
+from .models import PageView, UserActivity, SearchQuery, SearchQueryCount
+from .trending import TrendingSearches
 
 @shared_task
 def generate_daily_analytics_report():
@@ -77,19 +78,15 @@ def cleanup_old_analytics_data():
     
     PageView.objects.filter(timestamp__lt=cutoff_date).delete()
     SearchQuery.objects.filter(timestamp__lt=cutoff_date).delete()
+    SearchQueryCount.objects.filter(hour__lt=cutoff_date).delete()
     
 @shared_task
 def update_search_analytics():
-    """Update search analytics for trending searches"""
+    """Merge the closed hourly trending buckets into the 1h/24h/7d windows"""
     from django.core.cache import cache
     
-    # Get trending searches from the last 7 days
-    last_week = timezone.now() - timedelta(days=7)
-    trending_searches = SearchQuery.objects.filter(
-        timestamp__gte=last_week
-    ).values('query').annotate(
-        count=Count('id')
-    ).order_by('-count')[:20]
+    totals = TrendingSearches.rebuild_windows()
     
     # Cache the results
-    cache.set('trending_searches', list(trending_searches), 3600)  # Cache for 1 hour
+    cache.set('trending_searches', TrendingSearches.top('7d', limit=20), 3600)  # Cache for 1 hour
+    return totals
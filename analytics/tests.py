@@ -0,0 +1,225 @@
+import random
+from collections import Counter
+from datetime import timedelta
+from unittest import mock
+
+import pytest
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import OperationalError
+from django.test import RequestFactory
+from django.utils import timezone
+
+from analytics.buffers import PageViewBuffer, SearchLogBuffer
+from analytics.middleware import AnalyticsMiddleware
+from analytics.models import PageView, SearchQuery, SearchQueryCount
+from analytics.trending import SpaceSaving, TrendingSearches
+
+
+def skewed_stream(length, seed=7):
+    generator = random.Random(seed)
+    return [f'query {int(generator.paretovariate(1.2))}' for _ in range(length)]
+
+
+class TestSpaceSaving:
+    def test_counts_stay_within_error_bounds(self):
+        stream = skewed_stream(20000)
+        summary = SpaceSaving(50)
+        for query in stream:
+            summary.add(query)
+
+        exact = Counter(stream)
+        assert len(summary.items) <= 50
+        for query, (count, error) in summary.items.items():
+            assert count - error <= exact[query] <= count
+            assert error <= summary.total / summary.capacity
+
+    def test_heavy_hitters_are_always_tracked(self):
+        stream = skewed_stream(20000)
+        summary = SpaceSaving(50)
+        for query in stream:
+            summary.add(query)
+
+        threshold = len(stream) / 50
+        heavy = {query for query, count in Counter(stream).items() if count > threshold}
+        assert heavy <= set(summary.items)
+
+    def test_merged_summaries_keep_the_bound(self):
+        stream = skewed_stream(20000)
+        halves = SpaceSaving(50), SpaceSaving(50)
+        for position, query in enumerate(stream):
+            halves[position % 2].add(query)
+        merged = SpaceSaving(50).merge(halves[0]).merge(halves[1])
+
+        exact = Counter(stream)
+        assert merged.total == len(stream)
+        for query, (count, error) in merged.items.items():
+            assert count - error <= exact[query] <= count
+            assert error <= merged.total / merged.capacity
+        assert [item['query'] for item in merged.top(3)] == [query for query, _ in exact.most_common(3)]
+
+
+@pytest.mark.django_db
+class TestTrendingSearches:
+    @pytest.fixture(autouse=True)
+    def local_cache(self, settings):
+        settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        TrendingSearches._memo = {}
+        # LocMem storage is shared by every cache in the process, so buckets outlive a test
+        cache.clear()
+        yield
+        cache.clear()
+        TrendingSearches._memo = {}
+
+    def test_windows_merge_hourly_buckets(self):
+        now = timezone.now().replace(minute=0, second=0, microsecond=0)
+        TrendingSearches.record({
+            ('laptop', now): 5,
+            ('phone', now - timedelta(hours=2)): 7,
+            ('kettle', now - timedelta(days=3)): 20,
+        })
+        TrendingSearches.rebuild_windows()
+
+        assert [item['query'] for item in TrendingSearches.top('1h')] == ['laptop']
+        assert [item['query'] for item in TrendingSearches.top('24h')] == ['phone', 'laptop']
+        assert TrendingSearches.top('7d')[0] == {'query': 'kettle', 'count': 20, 'error': 0}
+
+    def test_missing_buckets_are_rebuilt_from_hourly_counts(self):
+        hour = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=5)
+        SearchQueryCount.objects.create(query='camera', hour=hour, count=4)
+        TrendingSearches.rebuild_windows()
+
+        assert TrendingSearches.top('24h') == [{'query': 'camera', 'count': 4, 'error': 0}]
+
+
+@pytest.mark.django_db
+class TestSearchLogBuffer:
+    @pytest.fixture
+    def buffer(self):
+        # A long interval keeps the worker idle so the tests decide when to flush
+        buffer = SearchLogBuffer(batch_size=1000, flush_interval=3600, max_pending=100)
+        yield buffer
+        buffer._pending.clear()
+        buffer.stop()
+        TrendingSearches._memo = {}
+
+    def counts(self):
+        return dict(SearchQueryCount.objects.values_list('query', 'count'))
+
+    def test_flush_writes_rows_and_upserts_counts(self, buffer):
+        for query in ('Red  Shoes', 'red shoes', 'bag'):
+            buffer.log(None, query, 3)
+        assert SearchQuery.objects.count() == 0
+
+        assert buffer.flush() == 3
+        assert SearchQuery.objects.count() == 3
+        assert self.counts() == {'red shoes': 2, 'bag': 1}
+
+        buffer.log(None, 'RED SHOES', 3)
+        buffer.flush()
+        assert self.counts() == {'red shoes': 3, 'bag': 1}
+        assert TrendingSearches.top('1h', 1) == [{'query': 'red shoes', 'count': 3, 'error': 0}]
+
+    def test_counts_stay_exact_when_rows_are_dropped(self, buffer):
+        buffer.max_pending = 2
+        accepted = [buffer.log(None, 'camera', 1) for _ in range(5)]
+
+        assert accepted == [True, True, False, False, False]
+        assert buffer.dropped == 3
+        buffer.flush()
+        assert SearchQuery.objects.count() == 2
+        assert self.counts() == {'camera': 5}
+
+    def test_failed_batch_is_retried_in_halves(self, buffer):
+        write = buffer.write
+
+        def reject_bad_rows(batch):
+            if any(row.query == 'bad' for row in batch):
+                raise ValueError('bad row')
+            write(batch)
+
+        for query in ('lamp', 'desk', 'bad', 'chair'):
+            buffer.log(None, query, 1)
+        with mock.patch.object(buffer, 'write', side_effect=reject_bad_rows):
+            assert buffer.flush() == 2
+
+        assert set(SearchQuery.objects.values_list('query', flat=True)) == {'lamp', 'desk'}
+        assert buffer.failed == 2
+        assert self.counts() == {'lamp': 1, 'desk': 1, 'bad': 1, 'chair': 1}
+
+    def test_transient_error_loses_nothing(self, buffer):
+        write = buffer.write
+        errors = [OperationalError('server closed the connection')]
+
+        def fail_once(batch):
+            if errors:
+                raise errors.pop()
+            write(batch)
+
+        for query in ('lamp', 'desk', 'chair'):
+            buffer.log(None, query, 1)
+        with mock.patch.object(buffer, 'write', side_effect=fail_once):
+            assert buffer.flush() == 3
+        assert SearchQuery.objects.count() == 3
+        assert buffer.failed == 0
+
+
+class TestPageViewTracking:
+    @pytest.fixture
+    def buffer(self):
+        # A long interval keeps the worker idle so the tests decide when to flush
+        buffer = PageViewBuffer(batch_size=1000, flush_interval=3600, max_pending=100)
+        yield buffer
+        buffer._pending.clear()
+        buffer.stop()
+
+    def track(self, buffer, url='/products/'):
+        return buffer.track(None, '127.0.0.1', url, 'pytest', None)
+
+    @pytest.mark.django_db
+    def test_views_are_written_in_bulk_on_flush(self, buffer):
+        for _ in range(3):
+            self.track(buffer)
+        assert PageView.objects.count() == 0
+
+        assert buffer.flush() == 3
+        assert PageView.objects.filter(url='/products/').count() == 3
+
+    def test_backpressure_samples_then_drops(self, buffer):
+        accepted = sum(self.track(buffer) for _ in range(1000))
+
+        assert accepted == len(buffer._pending) <= buffer.max_pending
+        assert len(buffer._pending) >= buffer.max_pending * PageViewBuffer.SAMPLE_FROM
+        assert buffer.sampled_out > 0
+        assert accepted + buffer.sampled_out + buffer.dropped == 1000
+
+    def test_middleware_queues_instead_of_writing(self):
+        request = RequestFactory().get('/products/', HTTP_X_FORWARDED_FOR='10.0.0.1, 10.0.0.2')
+        request.user = AnonymousUser()
+        admin_request = RequestFactory().get('/admin/')
+        admin_request.user = AnonymousUser()
+
+        with mock.patch('analytics.middleware.PageViewBuffer') as buffer:
+            middleware = AnalyticsMiddleware(lambda request: None)
+            middleware.process_request(request)
+            middleware.process_request(admin_request)
+
+        buffer.get_instance.return_value.track.assert_called_once_with(
+            user_id=None,
+            ip_address='10.0.0.1',
+            url='/products/',
+            user_agent='',
+            referrer=None
+        )
+
+    def test_invalid_forwarded_ip_falls_back_to_remote_addr(self):
+        middleware = AnalyticsMiddleware(lambda request: None)
+        spoofed = RequestFactory().get('/', HTTP_X_FORWARDED_FOR='<script>, 10.0.0.2', REMOTE_ADDR='10.0.0.9')
+        assert middleware.get_client_ip(spoofed) == '10.0.0.9'
+
+        request = RequestFactory().get('/', HTTP_X_FORWARDED_FOR='unknown', REMOTE_ADDR='')
+        request.user = AnonymousUser()
+        assert middleware.get_client_ip(request) is None
+        with mock.patch('analytics.middleware.PageViewBuffer') as buffer:
+            middleware.process_request(request)
+        buffer.get_instance.return_value.track.assert_not_called()
@@ -0,0 +1,218 @@
+import heapq
+import time
+import uuid
+from datetime import timedelta
+import logging
+
+from django.core.cache import cache
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import SearchQueryCount
+
+logger = logging.getLogger(__name__)
+
+
+class SpaceSaving:
+    """Space-Saving heavy-hitters summary holding at most ``capacity`` items.
+
+    Every tracked item has a ``count`` and an ``error``: its true frequency
+    lies in ``[count - error, count]``. When the summary is full, a new item
+    replaces the one with the smallest count and inherits that count as its
+    error. After ``total`` occurrences any error is at most
+    ``total / capacity``, and every item occurring more often than that is
+    guaranteed to be tracked.
+
+    Summaries merge (``merge``) with the same bound over the combined total,
+    which is what hourly buckets and windows rely on.
+    """
+
+    def __init__(self, capacity, items=None, total=0):
+        self.capacity = capacity
+        self.total = total
+        self.items = dict(items or {})  # item -> [count, error]
+        self._heap = None
+
+    def add(self, item, count=1):
+        self.total += count
+        entry = self.items.get(item)
+        if entry is not None:
+            entry[0] += count
+        elif len(self.items) < self.capacity:
+            entry = self.items[item] = [count, 0]
+        else:
+            floor, evicted = self._pop_min()
+            del self.items[evicted]
+            entry = self.items[item] = [floor + count, floor]
+        if self._heap is not None:
+            heapq.heappush(self._heap, (entry[0], item))
+
+    def _pop_min(self):
+        # Lazy min-heap: stale entries (count changed since pushed) are skipped
+        if self._heap is None or len(self._heap) > 4 * self.capacity:
+            self._heap = [(count, item) for item, (count, _) in self.items.items()]
+            heapq.heapify(self._heap)
+        while True:
+            count, item = heapq.heappop(self._heap)
+            entry = self.items.get(item)
+            if entry is not None and entry[0] == count:
+                return count, item
+
+    def min_count(self):
+        """Largest possible frequency of an untracked item"""
+        if len(self.items) < self.capacity:
+            return 0
+        return min(count for count, _ in self.items.values())
+
+    def merge(self, other):
+        """Fold ``other`` into this summary (Agarwal et al., mergeable summaries)"""
+        own_floor, other_floor = self.min_count(), other.min_count()
+        merged = {}
+        for item in self.items.keys() | other.items.keys():
+            count, error = self.items.get(item, (own_floor, own_floor))
+            other_count, other_error = other.items.get(item, (other_floor, other_floor))
+            merged[item] = [count + other_count, error + other_error]
+        if len(merged) > self.capacity:
+            merged = dict(heapq.nlargest(self.capacity, merged.items(), key=lambda pair: pair[1][0]))
+        self.items = merged
+        self.total += other.total
+        self._heap = None
+        return self
+
+    def top(self, limit):
+        """``limit`` heaviest items as dicts, in O(capacity)"""
+        best = heapq.nlargest(limit, self.items.items(), key=lambda pair: (pair[1][0], -pair[1][1]))
+        return [
+            {'query': item, 'count': count, 'error': error}
+            for item, (count, error) in best
+        ]
+
+    def to_dict(self):
+        return {'capacity': self.capacity, 'total': self.total, 'items': self.items}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['capacity'], data['items'], data['total'])
+
+
+class TrendingSearches:
+    """Trending searches from hourly Space-Saving buckets kept in the cache.
+
+    SearchLogBuffer folds its per-query counters into the bucket of the
+    current hour on every flush (``record``). Once an hour ``rebuild_windows``
+    merges the closed buckets into one summary per window; a read merges
+    the window with the current hour's bucket, so it touches two
+    ``CAPACITY``-bounded summaries whatever the traffic. Results are kept in
+    process memory for ``MEMO_TTL`` seconds.
+
+    Each count is an upper bound on the true number of searches, at most
+    ``error`` too high, and ``error`` never exceeds the window total divided
+    by ``CAPACITY``. Windows cover the current hour plus the given number of
+    closed hours. Buckets missing from the cache (e.g. after an eviction) are
+    rebuilt from the exact ``SearchQueryCount`` rows of that hour.
+    """
+
+    CAPACITY = 1000
+    WINDOWS = {'1h': 1, '24h': 24, '7d': 168}
+    KEY_PREFIX = 'search:trending'
+    BUCKET_TTL = 8 * 24 * 3600
+    WINDOW_TTL = 2 * 3600
+    LOCK_TTL = 5
+    LOCK_WAIT = 1.0
+    MEMO_TTL = 10
+
+    _memo = {}
+
+    @classmethod
+    def _hour(cls, moment=None):
+        return (moment or timezone.now()).replace(minute=0, second=0, microsecond=0)
+
+    @classmethod
+    def bucket_key(cls, hour):
+        return f'{cls.KEY_PREFIX}:hour:{hour:%Y%m%d%H}'
+
+    @classmethod
+    def window_key(cls, window):
+        return f'{cls.KEY_PREFIX}:window:{window}'
+
+    @classmethod
+    def record(cls, counts):
+        """Add ``{(query, hour): count}`` counters to their hourly buckets"""
+        by_hour = {}
+        for (query, hour), count in counts.items():
+            by_hour.setdefault(hour, {})[query] = count
+
+        for hour, queries in by_hour.items():
+            key = cls.bucket_key(hour)
+            lock_key = f'{key}:lock'
+            token = uuid.uuid4().hex
+            deadline = time.monotonic() + cls.LOCK_WAIT
+            while not cache.add(lock_key, token, cls.LOCK_TTL):
+                if time.monotonic() > deadline:
+                    logger.warning(f"Timed out locking trending bucket {key}; updating without the lock")
+                    break
+                time.sleep(0.01)
+            try:
+                data = cache.get(key)
+                summary = SpaceSaving.from_dict(data) if data else SpaceSaving(cls.CAPACITY)
+                for query, count in sorted(queries.items(), key=lambda pair: -pair[1]):
+                    summary.add(query, count)
+                cache.set(key, summary.to_dict(), cls.BUCKET_TTL)
+            finally:
+                if cache.get(lock_key) == token:
+                    cache.delete(lock_key)
+
+    @classmethod
+    def _load_bucket(cls, hour, data):
+        if data:
+            return SpaceSaving.from_dict(data)
+        # Rebuild from the exact hourly rows; the kept minimum bounds what was cut off
+        counts = SearchQueryCount.objects.filter(hour=hour)
+        rows = counts.order_by('-count').values_list('query', 'count')[:cls.CAPACITY]
+        summary = SpaceSaving(
+            cls.CAPACITY,
+            {query: [count, 0] for query, count in rows},
+            counts.aggregate(total=Sum('count'))['total'] or 0
+        )
+        cache.set(cls.bucket_key(hour), summary.to_dict(), cls.BUCKET_TTL)
+        return summary
+
+    @classmethod
+    def rebuild_windows(cls):
+        """Merge the closed hourly buckets into each window's summary; run hourly"""
+        current = cls._hour()
+        hours = [current - timedelta(hours=offset) for offset in range(1, max(cls.WINDOWS.values()) + 1)]
+        cached = cache.get_many([cls.bucket_key(hour) for hour in hours])
+        ends = {length: window for window, length in cls.WINDOWS.items()}
+
+        summary = SpaceSaving(cls.CAPACITY)
+        windows = {}
+        for length, hour in enumerate(hours, start=1):
+            summary.merge(cls._load_bucket(hour, cached.get(cls.bucket_key(hour))))
+            if length in ends:
+                # merge() replaces ``items`` rather than mutating it, so the snapshot stays intact
+                windows[cls.window_key(ends[length])] = summary.to_dict()
+        cache.set_many(windows, cls.WINDOW_TTL)
+        cls._memo = {}
+        return {window: windows[cls.window_key(window)]['total'] for window in cls.WINDOWS}
+
+    @classmethod
+    def top(cls, window='7d', limit=10):
+        """The ``limit`` most searched queries of ``window`` with counts and error bounds"""
+        if window not in cls.WINDOWS:
+            raise ValueError(f"Unknown trending window {window!r}; expected one of {', '.join(cls.WINDOWS)}")
+
+        memo = cls._memo.get(window)
+        if memo is not None and time.monotonic() - memo[0] < cls.MEMO_TTL and len(memo[1]) >= limit:
+            return memo[1][:limit]
+
+        current_key = cls.bucket_key(cls._hour())
+        cached = cache.get_many([cls.window_key(window), current_key])
+        summary = SpaceSaving(cls.CAPACITY)
+        for key in (cls.window_key(window), current_key):
+            if cached.get(key):
+                summary.merge(SpaceSaving.from_dict(cached[key]))
+
+        results = summary.top(max(limit, 20))
+        cls._memo[window] = (time.monotonic(), results)
+        return results[:limit]
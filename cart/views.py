@@ -2,6 +2,7 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.views.decorators.http import require_POST
 from django.http import JsonResponse
 from products.models import Product
+from recommendations.services import RecommendationService
 from .cart import Cart
 
 @require_POST
@@ -46,4 +47,10 @@ def cart_update(request, product_id):
 
 def cart_detail(request):
     cart = Cart(request)
-    return render(request, 'cart/detail.html', {'cart': cart}) 
\ No newline at end of file
+    bought_together = RecommendationService.get_bought_together_for_cart(
+        [int(product_id) for product_id in cart.cart.keys()]
+    )
+    return render(request, 'cart/detail.html', {
+        'cart': cart,
+        'bought_together': bought_together,
+    }) 
\ No newline at end of file
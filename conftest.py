@@ -0,0 +1,20 @@
+import pytest
+
+from recommendations.ann import ProductVectorIndex
+from recommendations.factorization import ALSModel
+from search.backends import reset_backend
+
+
+@pytest.fixture(autouse=True)
+def index_dirs(settings, tmp_path):
+    """Saving a product writes to the on-disk indexes; keep them out of BASE_DIR/var"""
+    settings.RECOMMENDATION_ANN_INDEX_DIR = tmp_path / 'product_index'
+    settings.RECOMMENDATION_ALS_MODEL_DIR = tmp_path / 'als_model'
+    settings.SEARCH_BM25_INDEX_DIR = tmp_path / 'search_index'
+    ProductVectorIndex._instance = None
+    ALSModel._instance = None
+    reset_backend()
+    yield
+    ProductVectorIndex._instance = None
+    ALSModel._instance = None
+    reset_backend()
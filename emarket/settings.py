@@ -62,6 +62,7 @@ INSTALLED_APPS = [
     'analytics.apps.AnalyticsConfig',
     'search.apps.SearchConfig',
     'forecasting.apps.ForecastingConfig',
+    'recommendations.apps.RecommendationsConfig',
 ]
 
 MIDDLEWARE = [
@@ -72,6 +73,7 @@ MIDDLEWARE = [
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'analytics.middleware.AnalyticsMiddleware',  # Buffered, no database write per request
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'emarket.middleware.RequestLoggingMiddleware',
     'emarket.middleware.SecurityHeadersMiddleware',
@@ -189,6 +191,15 @@ FORECAST_MONITORING = {
     'min_history_days': 30,
 }
 
+# Recommendation Settings
+RECOMMENDATION_ANN_INDEX_DIR = BASE_DIR / 'var' / 'product_index'
+RECOMMENDATION_ALS_MODEL_DIR = BASE_DIR / 'var' / 'als_model'
+RECOMMENDATION_STRATEGY = 'similarity'  # or 'als' once the model is trained
+
+# Search Settings
+SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', '')  # 'postgres', 'bm25' or empty to pick by database
+SEARCH_BM25_INDEX_DIR = BASE_DIR / 'var' / 'search_index'
+
 # Cache settings
 CACHES = {
     "default": {
@@ -214,6 +225,38 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'forecasting.tasks.cleanup_old_forecasts',
         'schedule': crontab(hour=1, minute=0),  # Daily at 1 AM
     },
+    'refresh-user-recommendations': {
+        'task': 'recommendations.tasks.refresh_all_user_recommendations',
+        'schedule': crontab(hour=2, minute=0),  # Daily at 2 AM
+    },
+    'compact-interactions': {
+        'task': 'recommendations.tasks.compact_interactions',
+        'schedule': crontab(hour=3, minute=0),  # Daily at 3 AM
+    },
+    'compact-product-index': {
+        'task': 'recommendations.tasks.compact_product_index',
+        'schedule': crontab(minute=30),  # Hourly; rebuilds only past the delta size cap
+    },
+    'mine-copurchases': {
+        'task': 'recommendations.tasks.mine_copurchases',
+        'schedule': crontab(minute=15),  # Hourly
+    },
+    'update-trending-searches': {
+        'task': 'analytics.tasks.update_search_analytics',
+        'schedule': crontab(minute=1),  # Hourly, just after the hour closes
+    },
+    'update-related-products': {
+        'task': 'search.tasks.update_related_products',
+        'schedule': crontab(minute=45),  # Hourly
+    },
+    'compact-search-index': {
+        'task': 'search.tasks.compact_search_index',
+        'schedule': crontab(minute=40),  # Hourly; rebuilds only past the delta size cap
+    },
+    'rebuild-related-products': {
+        'task': 'search.tasks.rebuild_related_products',
+        'schedule': crontab(hour=4, minute=0),  # Daily at 4 AM
+    },
 }
 
 # Security Settings
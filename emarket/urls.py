@@ -29,6 +29,7 @@ urlpatterns = [
     path('api/account/', include('account.urls')),
     path('api/support/', include('support.urls')),
     path('api/forecasting/', include('forecasting.urls')),
+    path('api/search/', include('search.urls')),
     
     # Frontend URLs
     path('', views.home, name='home'),
@@ -3,7 +3,8 @@ from .models import (
     SalesHistory,
     ForecastModel,
     SalesForecast,
-    SeasonalityPattern
+    SeasonalityPattern,
+    SeriesProfile
 )
 
 @admin.register(SalesHistory)
@@ -26,9 +27,10 @@ class SalesForecastAdmin(admin.ModelAdmin):
         'warehouse',
         'date',
         'forecasted_quantity',
+        'published',
         'created_at'
     )
-    list_filter = ('warehouse', 'date', 'created_at')
+    list_filter = ('warehouse', 'published', 'date', 'created_at')
     search_fields = ('product__name', 'warehouse__name')
     date_hierarchy = 'date'
 
@@ -37,3 +39,9 @@ class SeasonalityPatternAdmin(admin.ModelAdmin):
     list_display = ('product', 'pattern_type', 'last_updated')
     list_filter = ('pattern_type', 'last_updated')
     search_fields = ('product__name',)
+
+@admin.register(SeriesProfile)
+class SeriesProfileAdmin(admin.ModelAdmin):
+    list_display = ('product', 'warehouse', 'length', 'last_date', 'last_updated')
+    list_filter = ('warehouse', 'last_updated')
+    search_fields = ('product__name', 'warehouse__name')
@@ -0,0 +1,157 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from statsmodels.tsa.arima.model import ARIMA
+from statsmodels.tsa.stattools import adfuller
+from django.utils import timezone
+import logging
+
+logger = logging.getLogger(__name__)
+
+Order = Tuple[int, int, int]
+
+
+def _fit_aic(values: np.ndarray, order: Order) -> Tuple[Order, float]:
+    """Fit a single ARIMA candidate and return its AIC (runs in a worker process)"""
+    try:
+        fitted = ARIMA(values, order=order, enforce_stationarity=False).fit()
+        aic = float(fitted.aic)
+        return order, aic if np.isfinite(aic) else float('inf')
+    except Exception:
+        return order, float('inf')
+
+
+class ArimaOrderSearch:
+    """Bounded (p, d, q) search for ARIMA with AIC-based pruning.
+
+    The differencing order is chosen up front with repeated ADF tests, so only
+    the (p, q) plane is searched. Candidates are evaluated in waves of equal
+    complexity (p + q); a candidate is only expanded when its AIC is within
+    ``aic_tolerance`` of the best seen so far, and the search stops once a
+    whole wave fails to improve on the best AIC.
+    """
+
+    MAX_P = 3
+    MAX_D = 2
+    MAX_Q = 3
+    AIC_TOLERANCE = 2.0
+    MAX_WORKERS = 4
+    DRIFT_Z_THRESHOLD = 3.0  # Mean shift (in stds) that triggers a new search
+    DRIFT_WINDOW_DAYS = 30
+
+    def __init__(self, series: pd.Series, max_p: int = None, max_d: int = None,
+                 max_q: int = None, max_workers: int = None):
+        self.values = np.asarray(series, dtype=float)
+        self.max_p = self.MAX_P if max_p is None else max_p
+        self.max_d = self.MAX_D if max_d is None else max_d
+        self.max_q = self.MAX_Q if max_q is None else max_q
+        self.max_workers = max_workers or self.MAX_WORKERS
+        self.scores: Dict[Order, float] = {}
+
+    def search(self) -> Optional[Dict]:
+        """Run the search and return the selected order with its AIC"""
+        try:
+            if len(self.values) < 2:
+                return None
+
+            d = self._select_differencing()
+            best_aic = float('inf')
+            frontier = [(0, d, 0)]
+            visited = set(frontier)
+
+            while frontier:
+                wave_best = float('inf')
+                for order, aic in self._evaluate(frontier):
+                    self.scores[order] = aic
+                    wave_best = min(wave_best, aic)
+
+                improved = wave_best < best_aic
+                best_aic = min(best_aic, wave_best)
+                if not improved:
+                    break
+
+                # Only expand candidates that are still competitive
+                next_frontier = []
+                for (p, _, q) in frontier:
+                    if self.scores[(p, d, q)] > best_aic + self.AIC_TOLERANCE:
+                        continue
+                    for child in ((p + 1, d, q), (p, d, q + 1)):
+                        if child[0] > self.max_p or child[2] > self.max_q or child in visited:
+                            continue
+                        visited.add(child)
+                        next_frontier.append(child)
+                frontier = next_frontier
+
+            if not np.isfinite(best_aic):
+                return None
+
+            best_order = min(self.scores, key=self.scores.get)
+            return {
+                'order': list(best_order),
+                'aic': best_aic,
+                'candidates_evaluated': len(self.scores),
+            }
+
+        except Exception as e:
+            logger.error(f"Error in ARIMA order search: {str(e)}", exc_info=True)
+            return None
+
+    def _select_differencing(self) -> int:
+        """Pick the smallest d for which the ADF test indicates stationarity"""
+        values = self.values
+        for d in range(self.max_d + 1):
+            try:
+                if len(values) < 10 or adfuller(values)[1] < 0.05:
+                    return d
+            except Exception:
+                return d
+            values = np.diff(values)
+        return self.max_d
+
+    def _evaluate(self, orders: List[Order]) -> List[Tuple[Order, float]]:
+        """Fit a wave of candidates on a process pool, serially as a fallback"""
+        if len(orders) == 1 or self.max_workers <= 1:
+            return [_fit_aic(self.values, order) for order in orders]
+
+        try:
+            workers = min(self.max_workers, len(orders))
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                return list(executor.map(
+                    _fit_aic,
+                    [self.values] * len(orders),
+                    orders
+                ))
+        except (OSError, AssertionError, RuntimeError) as e:
+            # Daemonic workers (e.g. Celery prefork) cannot spawn children
+            logger.warning(f"Process pool unavailable, fitting serially: {str(e)}")
+            return [_fit_aic(self.values, order) for order in orders]
+
+    @staticmethod
+    def describe_series(series: pd.Series) -> Dict[str, float]:
+        """Summary statistics stored alongside the order for drift checks"""
+        return {
+            'history_mean': float(series.mean()),
+            'history_std': float(series.std() or 0.0),
+            'history_length': int(len(series)),
+            'selected_at': timezone.now().isoformat(),
+        }
+
+    @classmethod
+    def has_drifted(cls, series: pd.Series, parameters: Dict,
+                    accuracy_metrics: Dict = None, mape_threshold: float = None) -> bool:
+        """Check whether a previously selected order should be re-searched"""
+        if not parameters.get('order'):
+            return True
+
+        if mape_threshold is not None and accuracy_metrics:
+            if accuracy_metrics.get('mape', 0) > mape_threshold:
+                return True
+
+        recent = series.tail(cls.DRIFT_WINDOW_DAYS)
+        std = parameters.get('history_std') or float(series.std() or 0.0)
+        if std == 0 or recent.empty:
+            return False
+
+        shift = abs(float(recent.mean()) - parameters.get('history_mean', 0.0)) / std
+        return shift > cls.DRIFT_Z_THRESHOLD
@@ -4,6 +4,7 @@ from typing import Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
 from django.core.exceptions import ValidationError
 from django.utils import timezone
+from statsmodels.tsa.seasonal import seasonal_decompose
 import logging
 
 logger = logging.getLogger(__name__)
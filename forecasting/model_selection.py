@@ -7,14 +7,17 @@ import logging
 from .models import ForecastModel
 from .services import ForecastingService
 from .data_validation import DataValidator, DataPreprocessor
+from .profiling import SeriesProfiler
 
 logger = logging.getLogger(__name__)
 
 class ModelSelector:
     """Automated model selection for forecasting"""
     
-    def __init__(self, data: pd.DataFrame):
+    def __init__(self, data: pd.DataFrame, product=None, warehouse=None):
         self.data = data
+        self.product = product
+        self.warehouse = warehouse
         self.validator = DataValidator(data)
         self.preprocessor = DataPreprocessor()
         self.best_model: Optional[Dict] = None
@@ -56,6 +59,16 @@ class ModelSelector:
         data: pd.DataFrame
     ) -> Dict[str, any]:
         """Analyze characteristics of the data"""
+        if self.product is not None and self.warehouse is not None:
+            characteristics = SeriesProfiler(
+                self.product,
+                self.warehouse,
+                self._check_trend,
+                self._check_stationarity
+            ).get_characteristics(data)
+            if characteristics:
+                return characteristics
+        
         try:
             characteristics = {}
             
@@ -70,13 +83,9 @@ class ModelSelector:
             ]
             
             # Check for trend
-            trend, seasonal, residual = self.preprocessor.decompose_time_series(
-                data
-            )
-            if trend is not None:
-                characteristics['has_trend'] = abs(
-                    trend.iloc[-1] - trend.iloc[0]
-                ) > (trend.std() * 2)
+            has_trend = self._check_trend(data)
+            if has_trend is not None:
+                characteristics['has_trend'] = has_trend
             
             # Check for stationarity
             characteristics['is_stationary'] = self._check_stationarity(data)
@@ -242,6 +251,16 @@ class ModelSelector:
             logger.error(f"Error selecting model: {str(e)}", exc_info=True)
             return None
     
+    def _check_trend(self, data: pd.DataFrame) -> Optional[bool]:
+        """Check if the time series has a significant trend"""
+        trend, seasonal, residual = self.preprocessor.decompose_time_series(
+            data
+        )
+        if trend is None:
+            return None
+        
+        return abs(trend.iloc[-1] - trend.iloc[0]) > (trend.std() * 2)
+    
     def _check_stationarity(self, data: pd.DataFrame) -> bool:
         """Check if the time series is stationary"""
         try:
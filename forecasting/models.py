@@ -43,6 +43,7 @@ class SalesForecast(models.Model):
     confidence_interval_lower = models.IntegerField()
     confidence_interval_upper = models.IntegerField()
     model = models.ForeignKey(ForecastModel, on_delete=models.CASCADE)
+    published = models.BooleanField(default=False)  # Served to downstream systems
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -50,6 +51,7 @@ class SalesForecast(models.Model):
         indexes = [
             models.Index(fields=['product', 'date']),
             models.Index(fields=['warehouse', 'date']),
+            models.Index(fields=['product', 'warehouse', 'published', 'date']),
         ]
 
 class SeasonalityPattern(models.Model):
@@ -67,3 +69,17 @@ class SeasonalityPattern(models.Model):
     
     class Meta:
         unique_together = ('product', 'pattern_type')
+
+class SeriesProfile(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE)
+    fingerprint = models.CharField(max_length=64)  # Hash of the profiled history
+    length = models.IntegerField()
+    last_date = models.DateField(null=True, blank=True)
+    characteristics = models.JSONField()  # Store seasonality, trend, stationarity, gaps, size
+    lag_statistics = models.JSONField(default=dict)  # Running sums for incremental autocorrelation
+    full_analysis_length = models.IntegerField(default=0)  # Length at last trend/stationarity run
+    last_updated = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ('product', 'warehouse')
@@ -0,0 +1,193 @@
+from typing import Callable, Dict, List, Optional
+import hashlib
+import numpy as np
+import pandas as pd
+import logging
+from .models import SeriesProfile
+
+logger = logging.getLogger(__name__)
+
+
+class SeriesProfiler:
+    """Persisted data-characteristics profile for a product/warehouse series.
+
+    The profile is keyed by a fingerprint of the (cleaned) history. An
+    unchanged series is served straight from the stored profile; a series that
+    only had rows appended is updated incrementally:
+
+    * seasonality scores come from running lag sums, so only new rows are read
+    * the gap flag and data size are updated from the appended tail
+    * trend and stationarity are carried over until the series has grown by
+      ``REFRESH_FRACTION`` since they were last computed
+
+    Any other change to the history triggers a full rebuild.
+    """
+
+    SEASONALITY_LAGS = [7, 30, 365]
+    SEASONALITY_THRESHOLD = 0.5
+    REFRESH_FRACTION = 0.1
+
+    def __init__(
+        self,
+        product,
+        warehouse,
+        trend_check: Callable[[pd.DataFrame], Optional[bool]],
+        stationarity_check: Callable[[pd.DataFrame], bool]
+    ):
+        self.product = product
+        self.warehouse = warehouse
+        self.trend_check = trend_check
+        self.stationarity_check = stationarity_check
+
+    def get_characteristics(self, data: pd.DataFrame) -> Dict[str, any]:
+        """Return the characteristics for ``data``, reusing stored work"""
+        try:
+            values = data['quantity_sold'].to_numpy(dtype=float)
+            profile = SeriesProfile.objects.filter(
+                product=self.product,
+                warehouse=self.warehouse
+            ).first()
+
+            if profile and len(values) >= profile.length and \
+               self.fingerprint(data.iloc[:profile.length]) == profile.fingerprint:
+                if len(values) == profile.length:
+                    return profile.characteristics
+                return self._update(profile, data, values)
+
+            return self._rebuild(profile, data, values)
+
+        except Exception as e:
+            logger.error(f"Error loading series profile: {str(e)}", exc_info=True)
+            return {}
+
+    @staticmethod
+    def fingerprint(data: pd.DataFrame) -> str:
+        """Hash of the dates and values of a series"""
+        digest = hashlib.sha256()
+        digest.update(pd.DatetimeIndex(data.index).asi8.tobytes())
+        digest.update(data['quantity_sold'].to_numpy(dtype=float).tobytes())
+        return digest.hexdigest()
+
+    def _rebuild(self, profile, data, values) -> Dict[str, any]:
+        """Compute the full profile from scratch"""
+        lag_statistics = {
+            str(lag): self._accumulate(self._empty_lag_stats(), values, 0, lag)
+            for lag in self.SEASONALITY_LAGS
+        }
+        characteristics = {
+            'has_trend': self._trend(data),
+            'is_stationary': bool(self.stationarity_check(data)),
+            'data_size': len(values),
+            'has_gaps': self._has_gaps(data.index),
+        }
+        characteristics.update(self._seasonality(lag_statistics, len(values)))
+
+        if profile is None:
+            profile = SeriesProfile(product=self.product, warehouse=self.warehouse)
+        self._save(profile, data, characteristics, lag_statistics, len(values))
+        return characteristics
+
+    def _update(self, profile, data, values) -> Dict[str, any]:
+        """Fold appended rows into an existing profile"""
+        start = profile.length
+        lag_statistics = {
+            str(lag): self._accumulate(
+                profile.lag_statistics.get(str(lag), self._empty_lag_stats()),
+                values,
+                start,
+                lag
+            )
+            for lag in self.SEASONALITY_LAGS
+        }
+
+        characteristics = dict(profile.characteristics)
+        characteristics['data_size'] = len(values)
+        characteristics['has_gaps'] = bool(
+            characteristics.get('has_gaps') or
+            self._has_gaps(data.index[start - 1:])
+        )
+        characteristics.update(self._seasonality(lag_statistics, len(values)))
+
+        full_analysis_length = profile.full_analysis_length
+        if len(values) - full_analysis_length > full_analysis_length * self.REFRESH_FRACTION:
+            characteristics['has_trend'] = self._trend(data)
+            characteristics['is_stationary'] = bool(self.stationarity_check(data))
+            full_analysis_length = len(values)
+
+        self._save(profile, data, characteristics, lag_statistics, full_analysis_length)
+        return characteristics
+
+    def _save(self, profile, data, characteristics, lag_statistics, full_analysis_length):
+        profile.fingerprint = self.fingerprint(data)
+        profile.length = len(data)
+        profile.last_date = pd.Timestamp(data.index.max()).date()
+        profile.characteristics = characteristics
+        profile.lag_statistics = lag_statistics
+        profile.full_analysis_length = full_analysis_length
+        profile.save()
+
+    def _trend(self, data) -> bool:
+        trend = self.trend_check(data)
+        return bool(trend) if trend is not None else False
+
+    def _seasonality(self, lag_statistics, size) -> Dict[str, any]:
+        """Seasonality scores matching ``DataPreprocessor.detect_seasonality``"""
+        scores = {}
+        for lag in self.SEASONALITY_LAGS:
+            if size >= lag * 2:
+                score = self._correlation(lag_statistics[str(lag)])
+                if score is not None:
+                    scores[f'{lag}_day'] = score
+
+        periods: List[str] = [
+            period for period, score in scores.items()
+            if score > self.SEASONALITY_THRESHOLD
+        ]
+        return {
+            'seasonality_scores': scores,
+            'has_seasonality': bool(periods),
+            'seasonality_periods': periods,
+        }
+
+    @staticmethod
+    def _has_gaps(index) -> bool:
+        if len(index) < 2:
+            return False
+        return bool(
+            pd.DatetimeIndex(index).to_series().diff().max() > pd.Timedelta(days=1)
+        )
+
+    @staticmethod
+    def _empty_lag_stats() -> Dict[str, float]:
+        return {'n': 0, 'sx': 0.0, 'sy': 0.0, 'sxx': 0.0, 'syy': 0.0, 'sxy': 0.0}
+
+    @staticmethod
+    def _accumulate(stats, values, start, lag) -> Dict[str, float]:
+        """Add the (x[t - lag], x[t]) pairs for t >= start to the running sums"""
+        first = max(start, lag)
+        if first >= len(values):
+            return dict(stats)
+
+        x = values[first - lag:len(values) - lag]
+        y = values[first:]
+        return {
+            'n': stats['n'] + len(y),
+            'sx': stats['sx'] + float(x.sum()),
+            'sy': stats['sy'] + float(y.sum()),
+            'sxx': stats['sxx'] + float(np.dot(x, x)),
+            'syy': stats['syy'] + float(np.dot(y, y)),
+            'sxy': stats['sxy'] + float(np.dot(x, y)),
+        }
+
+    @staticmethod
+    def _correlation(stats) -> Optional[float]:
+        """Pearson correlation from running sums (same as ``Series.autocorr``)"""
+        n = stats['n']
+        if n < 2:
+            return None
+        cov = stats['sxy'] - stats['sx'] * stats['sy'] / n
+        var_x = stats['sxx'] - stats['sx'] ** 2 / n
+        var_y = stats['syy'] - stats['sy'] ** 2 / n
+        if var_x <= 0 or var_y <= 0:
+            return None
+        return float(cov / np.sqrt(var_x * var_y))
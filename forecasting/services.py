@@ -9,15 +9,19 @@ from datetime import timedelta
 from django.db.models import Avg, Sum
 from django.core.cache import cache
 from django.conf import settings
+from django.db import transaction
 import logging
 
 from .models import SalesHistory, ForecastModel, SalesForecast, SeasonalityPattern
+from .arima_search import ArimaOrderSearch
 
 logger = logging.getLogger(__name__)
 
 class ForecastingService:
     CACHE_TTL = 3600  # 1 hour cache
     MIN_HISTORY_DAYS = 30  # Minimum days of history needed
+    DEFAULT_ARIMA_ORDER = (1, 1, 1)  # Used when no order has been searched
+    MAX_SERVING_DAYS = 90  # Longest horizon served by get_published_forecasts
     
     @classmethod
     def generate_forecast(cls, product, warehouse, days_ahead=30, algorithm='exp_smoothing'):
@@ -59,8 +63,12 @@ class ForecastingService:
             )
             
             # Generate forecast based on algorithm
-            forecast_method = getattr(cls, f'_{algorithm}_forecast')
-            forecasted_values = forecast_method(ts_data, days_ahead)
+            if algorithm == 'arima':
+                order = cls._resolve_arima_order(model, ts_data)
+                forecasted_values = cls._arima_forecast(ts_data, days_ahead, order=order)
+            else:
+                forecast_method = getattr(cls, f'_{algorithm}_forecast')
+                forecasted_values = forecast_method(ts_data, days_ahead)
             
             if not forecasted_values:
                 logger.error(f"Failed to generate forecast for product {product.id}")
@@ -102,6 +110,88 @@ class ForecastingService:
             logger.error(f"Error generating forecast: {str(e)}", exc_info=True)
             return None
     
+    @staticmethod
+    def publish_forecast(forecasts):
+        """Mark a generated forecast as the one served to downstream systems"""
+        if not forecasts:
+            return 0
+        
+        first = forecasts[0]
+        dates = [forecast.date for forecast in forecasts]
+        with transaction.atomic():
+            SalesForecast.objects.filter(
+                product=first.product,
+                warehouse=first.warehouse,
+                date__in=dates,
+                published=True
+            ).exclude(model=first.model).update(published=False)
+            
+            return SalesForecast.objects.filter(
+                product=first.product,
+                warehouse=first.warehouse,
+                date__in=dates,
+                model=first.model
+            ).update(published=True)
+    
+    @classmethod
+    def get_published_forecasts(cls, product_ids, warehouse_ids=None, days=30, start_date=None):
+        """Read published forecasts for many series in one query.
+        
+        Never fits a model. Returns a columnar payload with one entry per
+        product/warehouse series; ``quantity``, ``lower`` and ``upper`` hold
+        one value per day from ``start_date`` (``None`` where nothing is
+        published).
+        """
+        days = max(1, min(int(days), cls.MAX_SERVING_DAYS))
+        start_date = start_date or timezone.now().date()
+        end_date = start_date + timedelta(days=days)
+        
+        rows = SalesForecast.objects.filter(
+            product_id__in=product_ids,
+            published=True,
+            date__gte=start_date,
+            date__lt=end_date
+        )
+        if warehouse_ids:
+            rows = rows.filter(warehouse_id__in=warehouse_ids)
+        
+        # Later rows win when several runs published the same day
+        rows = rows.order_by('product_id', 'warehouse_id', 'date', 'created_at').values_list(
+            'product_id',
+            'warehouse_id',
+            'date',
+            'forecasted_quantity',
+            'confidence_interval_lower',
+            'confidence_interval_upper'
+        )
+        
+        columns = {
+            'product_id': [],
+            'warehouse_id': [],
+            'quantity': [],
+            'lower': [],
+            'upper': [],
+        }
+        series_key = None
+        for product_id, warehouse_id, date, quantity, lower, upper in rows.iterator():
+            if (product_id, warehouse_id) != series_key:
+                series_key = (product_id, warehouse_id)
+                columns['product_id'].append(product_id)
+                columns['warehouse_id'].append(warehouse_id)
+                for name in ('quantity', 'lower', 'upper'):
+                    columns[name].append([None] * days)
+            
+            offset = (date - start_date).days
+            columns['quantity'][-1][offset] = quantity
+            columns['lower'][-1][offset] = lower
+            columns['upper'][-1][offset] = upper
+        
+        return {
+            'start_date': start_date.isoformat(),
+            'days': days,
+            **columns,
+        }
+    
     @staticmethod
     def _exp_smoothing_forecast(data, days_ahead):
         """Generate forecast using Exponential Smoothing"""
@@ -118,23 +208,48 @@ class ForecastingService:
             )
             fitted_model = model.fit(optimized=True)
             
-            forecast = fitted_model.forecast(days_ahead)
-            confidence_intervals = fitted_model.get_prediction(
-                start=len(data),
-                end=len(data) + days_ahead - 1
-            ).conf_int()
+            forecast = np.asarray(fitted_model.forecast(days_ahead))
+            # Holt-Winters results carry no prediction intervals; use the residual spread
+            margin = 1.96 * np.std(np.asarray(fitted_model.resid))
             
             return list(zip(
                 forecast,
-                confidence_intervals[:, 0],
-                confidence_intervals[:, 1]
+                forecast - margin,
+                forecast + margin
             ))
         except Exception as e:
             logger.error(f"Error in exp_smoothing_forecast: {str(e)}", exc_info=True)
             return None
     
+    @classmethod
+    def _resolve_arima_order(cls, model, data):
+        """Reuse the stored ARIMA order unless the series has drifted"""
+        series = data['quantity_sold']
+        parameters = model.parameters or {}
+        mape_threshold = getattr(settings, 'FORECAST_MONITORING', {}).get('mape_threshold')
+        
+        if not ArimaOrderSearch.has_drifted(
+            series, parameters, model.accuracy_metrics, mape_threshold
+        ):
+            return tuple(parameters['order'])
+        
+        result = ArimaOrderSearch(series).search()
+        if not result:
+            return tuple(parameters.get('order') or cls.DEFAULT_ARIMA_ORDER)
+        
+        model.parameters = {
+            **parameters,
+            **result,
+            **ArimaOrderSearch.describe_series(series),
+        }
+        logger.info(
+            f"Selected ARIMA order {result['order']} for product {model.product_id} "
+            f"({result['candidates_evaluated']} candidates)"
+        )
+        return tuple(result['order'])
+    
     @staticmethod
-    def _arima_forecast(data, days_ahead):
+    def _arima_forecast(data, days_ahead, order=None):
         """Generate forecast using ARIMA"""
         try:
             if len(data) < 2:
@@ -142,15 +257,15 @@ class ForecastingService:
                 
             model = ARIMA(
                 data['quantity_sold'],
-                order=(1, 1, 1),
+                order=order or ForecastingService.DEFAULT_ARIMA_ORDER,
                 enforce_stationarity=False
             )
             fitted_model = model.fit()
             
-            forecast = fitted_model.forecast(days_ahead)
-            confidence_intervals = fitted_model.get_forecast(
+            forecast = np.asarray(fitted_model.forecast(days_ahead))
+            confidence_intervals = np.asarray(fitted_model.get_forecast(
                 days_ahead
-            ).conf_int()
+            ).conf_int())
             
             return list(zip(
                 forecast,
@@ -233,9 +348,9 @@ class ForecastingService:
             return None
         
         # Daily pattern
-        daily_pattern = history.values('date__weekday').annotate(
+        daily_pattern = history.values('date__week_day').annotate(
             avg_sales=Avg('quantity_sold')
-        ).order_by('date__weekday')
+        ).order_by('date__week_day')
         
         # Monthly pattern
         monthly_pattern = history.values('date__month').annotate(
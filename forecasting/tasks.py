@@ -4,6 +4,7 @@ from datetime import timedelta
 from django.db.models import Count
 from products.models import Product
 from inventory.models import Warehouse
+from .models import SalesForecast
 from .services import ForecastingService
 
 @shared_task
@@ -49,6 +50,8 @@ def update_product_forecast(product_id, warehouse_id):
                     best_forecast = forecast
         
         if best_forecast:
+            ForecastingService.publish_forecast(best_forecast)
+            
             # Update inventory reorder points based on forecast
             update_reorder_points.delay(product.id, warehouse.id)
             
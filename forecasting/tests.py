@@ -1,17 +1,33 @@
 import pytest
+from django.core.cache import cache
 from django.utils import timezone
 from datetime import timedelta
 import numpy as np
-from .models import SalesHistory, ForecastModel, SalesForecast
+import pandas as pd
+from unittest import mock
+from .models import SalesHistory, ForecastModel, SalesForecast, SeriesProfile
 from .services import ForecastingService
-from products.models import Product
+from .views import _etag_matches
+from .arima_search import ArimaOrderSearch
+from .profiling import SeriesProfiler
+from products.models import Category, Product
 from inventory.models import Warehouse
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    # Forecasts are cached by product and warehouse id, which repeat across tests
+    cache.clear()
+    yield
+    cache.clear()
+
 @pytest.fixture
 def sample_data(db):
     # Create test product and warehouse
+    category = Category.objects.create(name='Test Category', slug='test-category')
     product = Product.objects.create(
+        category=category,
         name='Test Product',
+        slug='test-product',
         price=100.00
     )
     warehouse = Warehouse.objects.create(
@@ -84,6 +100,66 @@ class TestForecastingService:
         for forecast in forecasts:
             assert 0 <= forecast.forecasted_quantity <= 1000  # Adjust range as needed
     
+    def test_arima_order_is_searched_and_reused(self, sample_data):
+        product = sample_data['product']
+        warehouse = sample_data['warehouse']
+        
+        ForecastingService.generate_forecast(
+            product,
+            warehouse,
+            days_ahead=30,
+            algorithm='arima'
+        )
+        
+        model = ForecastModel.objects.get(
+            product=product,
+            warehouse=warehouse,
+            algorithm='arima'
+        )
+        assert len(model.parameters['order']) == 3
+        assert model.parameters['order'][0] <= ArimaOrderSearch.MAX_P
+        assert model.parameters['order'][2] <= ArimaOrderSearch.MAX_Q
+        
+        # A second run on unchanged data must not search again
+        history = pd.DataFrame(list(
+            SalesHistory.objects.filter(
+                product=product,
+                warehouse=warehouse
+            ).order_by('date').values('date', 'quantity_sold')
+        )).set_index('date')
+        with mock.patch.object(ArimaOrderSearch, 'search') as search:
+            order = ForecastingService._resolve_arima_order(model, history)
+            search.assert_not_called()
+        assert list(order) == model.parameters['order']
+    
+    def test_get_published_forecasts(self, sample_data):
+        product = sample_data['product']
+        warehouse = sample_data['warehouse']
+        
+        forecasts = ForecastingService.generate_forecast(
+            product,
+            warehouse,
+            days_ahead=30,
+            algorithm='exp_smoothing'
+        )
+        
+        # Unpublished forecasts are never served
+        payload = ForecastingService.get_published_forecasts([product.id])
+        assert payload['product_id'] == []
+        
+        ForecastingService.publish_forecast(forecasts)
+        with mock.patch.object(ForecastingService, 'generate_forecast') as generate:
+            payload = ForecastingService.get_published_forecasts(
+                [product.id],
+                warehouse_ids=[warehouse.id],
+                days=30
+            )
+            generate.assert_not_called()
+        
+        assert payload['product_id'] == [product.id]
+        assert payload['warehouse_id'] == [warehouse.id]
+        assert payload['quantity'][0] == [f.forecasted_quantity for f in forecasts]
+    
     def test_seasonality_analysis(self, sample_data):
         product = sample_data['product']
         
@@ -131,8 +207,11 @@ class TestForecastingService:
     
     def test_no_history_forecast(self, db):
         # Test forecasting with no historical data
+        category = Category.objects.create(name='New Category', slug='new-category')
         product = Product.objects.create(
+            category=category,
             name='New Product',
+            slug='new-product',
             price=100.00
         )
         warehouse = Warehouse.objects.create(
@@ -150,3 +229,55 @@ class TestForecastingService:
         )
         
         assert forecast is None
+
+@pytest.mark.django_db
+class TestSeriesProfiler:
+    def _history(self, product, warehouse):
+        return pd.DataFrame(list(
+            SalesHistory.objects.filter(
+                product=product,
+                warehouse=warehouse
+            ).order_by('date').values('date', 'quantity_sold')
+        )).set_index('date')
+    
+    def test_incremental_update_matches_rebuild(self, sample_data):
+        product = sample_data['product']
+        warehouse = sample_data['warehouse']
+        data = self._history(product, warehouse)
+        stationarity = mock.Mock(return_value=False)
+        profiler = SeriesProfiler(product, warehouse, lambda d: True, stationarity)
+        
+        profiler.get_characteristics(data.iloc[:85])
+        assert stationarity.call_count == 1
+        
+        # Unchanged history is served from the stored profile
+        profiler.get_characteristics(data.iloc[:85])
+        assert stationarity.call_count == 1
+        
+        # Appending a few rows updates seasonality without a full analysis
+        incremental = profiler.get_characteristics(data)
+        assert stationarity.call_count == 1
+        assert incremental['data_size'] == 90
+        
+        SeriesProfile.objects.all().delete()
+        rebuilt = profiler.get_characteristics(data)
+        assert rebuilt['seasonality_scores'].keys() == incremental['seasonality_scores'].keys()
+        for period, score in rebuilt['seasonality_scores'].items():
+            assert score == pytest.approx(incremental['seasonality_scores'][period])
+            assert score == pytest.approx(
+                data['quantity_sold'].autocorr(lag=int(period.split('_')[0]))
+            )
+
+@pytest.mark.parametrize('header, matches', [
+    ('"abc"', True),
+    ('W/"abc"', True),
+    ('"xyz", W/"abc"', True),
+    ('*', True),
+    ('"abcd"', False),
+    ('"ab"', False),
+    ('"xyz"', False),
+    (None, False),
+    ('', False),
+])
+def test_etag_matching(header, matches):
+    assert _etag_matches('"abc"', header) is matches
@@ -9,6 +9,11 @@ urlpatterns = [
         views.generate_forecast,
         name='generate_forecast'
     ),
+    path(
+        'forecast/published/',
+        views.published_forecasts,
+        name='published_forecasts'
+    ),
     path(
         'forecast/monitor/',
         views.monitor_forecasts,
@@ -4,7 +4,11 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 from django.utils import timezone
+from django.utils.cache import parse_etags
+from django.utils.http import quote_etag
 from datetime import timedelta
+import hashlib
+import json
 import pandas as pd
 
 from products.models import Product
@@ -51,7 +55,7 @@ def generate_forecast(request, product_id, warehouse_id):
         cleaned_data = validator.clean_data()
         
         # Select best model
-        selector = ModelSelector(cleaned_data)
+        selector = ModelSelector(cleaned_data, product=product, warehouse=warehouse)
         best_model = selector.select_best_model()
         
         if not best_model:
@@ -95,6 +99,67 @@ def generate_forecast(request, product_id, warehouse_id):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+MAX_BULK_PRODUCTS = 5000
+
+def _parse_id_list(value):
+    """Accept a JSON list or a comma-separated string of ids"""
+    if value in (None, ''):
+        return []
+    if isinstance(value, str):
+        value = value.split(',')
+    return [int(item) for item in value]
+
+def _etag_matches(etag, if_none_match):
+    """Weak comparison of ``etag`` with the tags of an If-None-Match header"""
+    if not if_none_match:
+        return False
+    tags = parse_etags(if_none_match)
+    if tags == ['*']:
+        return True
+    return etag in {tag[2:] if tag.startswith('W/') else tag for tag in tags}
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsAuthenticated])
+def published_forecasts(request):
+    """Bulk read of published forecasts; never triggers a model fit"""
+    params = request.data if request.method == 'POST' else request.query_params
+    try:
+        product_ids = _parse_id_list(params.get('product_ids'))
+        warehouse_ids = _parse_id_list(params.get('warehouse_ids'))
+        days = int(params.get('days', 30))
+    except (TypeError, ValueError):
+        return Response(
+            {"error": "product_ids, warehouse_ids and days must be integers"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    if not product_ids:
+        return Response(
+            {"error": "product_ids is required"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if len(product_ids) > MAX_BULK_PRODUCTS:
+        return Response(
+            {"error": f"At most {MAX_BULK_PRODUCTS} product_ids per request"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    payload = ForecastingService.get_published_forecasts(
+        product_ids,
+        warehouse_ids=warehouse_ids,
+        days=days
+    )
+    
+    etag = quote_etag(hashlib.md5(
+        json.dumps(payload, sort_keys=True, separators=(',', ':')).encode()
+    ).hexdigest())
+    if _etag_matches(etag, request.headers.get('If-None-Match')):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = Response(payload)
+    response['ETag'] = etag
+    return response
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def monitor_forecasts(request):
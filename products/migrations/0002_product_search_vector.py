@@ -0,0 +1,43 @@
+import django.contrib.postgres.search
+import search.models
+from django.db import migrations
+
+
+def populate_search_vectors(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    from django.contrib.postgres.search import SearchVector
+    from django.db.models import CharField, Value
+
+    Category = apps.get_model("products", "Category")
+    Product = apps.get_model("products", "Product")
+    for category in Category.objects.only("id", "name").iterator():
+        Product.objects.filter(category_id=category.id).update(
+            search_vector=(
+                SearchVector("name", weight="A")
+                + SearchVector("description", weight="B")
+                + SearchVector(Value(category.name, output_field=CharField()), weight="C")
+            )
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("products", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=search.models.PortableGinIndex(
+                fields=["search_vector"], name="products_pr_search__98d711_gin"
+            ),
+        ),
+        migrations.RunPython(populate_search_vectors, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.urls import reverse
+from search.models import SearchableModel
 
 class Category(models.Model):
     name = models.CharField(max_length=200)
@@ -17,7 +18,7 @@ class Category(models.Model):
     def get_absolute_url(self):
         return reverse('products:category', args=[self.slug])
 
-class Product(models.Model):
+class Product(SearchableModel):
     category = models.ForeignKey(Category, related_name='products', on_delete=models.CASCADE)
     name = models.CharField(max_length=200)
     slug = models.SlugField(max_length=200)
@@ -28,7 +29,8 @@ class Product(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
-    class Meta:
+    class Meta(SearchableModel.Meta):
+        # Inherits the GIN index on search_vector
         ordering = ['name']
 
     def __str__(self):
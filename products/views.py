@@ -2,6 +2,8 @@ from django.shortcuts import render, get_object_or_404
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.db.models import Q
 from .models import Product, Category
+from recommendations.services import RecommendationService
+from search.services import SearchService
 
 def product_list(request):
     category_slug = request.GET.get('category')
@@ -24,8 +26,11 @@ def product_list(request):
     if max_price:
         products = products.filter(price__lte=max_price)
 
-    # Search filter
+    # Search filter, with misspelled words corrected first
     if search:
+        corrected = SearchService.search_terms(search)
+        if corrected != SearchService.normalize_terms(search):
+            search = ' '.join(corrected)
         products = products.filter(
             Q(name__icontains=search) |
             Q(description__icontains=search) |
@@ -62,10 +67,11 @@ def product_list(request):
 
 def product_detail(request, slug):
     product = get_object_or_404(Product, slug=slug, available=True)
-    related_products = Product.objects.filter(category=product.category).exclude(id=product.id)[:4]
+    related_products = SearchService.get_related_products(product, limit=4)
     
     context = {
         'product': product,
         'related_products': related_products,
+        'bought_together': RecommendationService.get_bought_together(product),
     }
     return render(request, 'products/detail.html', context) 
\ No newline at end of file
@@ -0,0 +1,331 @@
+import re
+import threading
+import zlib
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+import logging
+
+from .segments import SegmentStore
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+class ProductEmbedder:
+    """Hashed bag-of-words vectors built from a product's text fields.
+
+    Needs nothing but the product row, so a vector can be computed the moment
+    a product is created (interaction-based vectors would still be empty).
+    """
+
+    DIMENSIONS = 128
+    FIELD_WEIGHTS = (
+        ('name', 2.0),
+        ('category', 1.0),
+        ('description', 0.5),
+    )
+
+    def __init__(self, dimensions=None):
+        self.dimensions = dimensions or self.DIMENSIONS
+
+    def embed(self, product):
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for field, weight in self.FIELD_WEIGHTS:
+            if field == 'category':
+                text = product.category.name if product.category_id else ''
+            else:
+                text = getattr(product, field, '') or ''
+
+            for token in TOKEN_RE.findall(text.lower()):
+                digest = zlib.crc32(token.encode())
+                sign = 1.0 if digest & 1 else -1.0
+                vector[(digest >> 1) % self.dimensions] += sign * weight
+
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+
+class ProductVectorIndex:
+    """In-process random-projection LSH index over product vectors.
+
+    On-disk layout (``RECOMMENDATION_ANN_INDEX_DIR``, see SegmentStore)::
+
+        CURRENT                live segment and delta logs to replay
+        <segment>/ids.npy      int64 product ids of the base snapshot
+        <segment>/vectors.npy  float32 L2-normalised vectors, memory-mapped on load
+        <segment>/planes.npy   float32 random hyperplanes shared by all tables
+        delta*.bin             append-only (id, vector) records written on insert;
+                               an all-zero vector marks a deletion
+
+    Each of ``NUM_TABLES`` tables hashes a vector to ``NUM_BITS`` sign bits.
+    Per table the codes are kept sorted so buckets are found with
+    ``searchsorted``; queries also probe every code one bit away. Candidates
+    are re-ranked exactly by dot product. Rows inserted since the last build
+    live in the delta and are scanned exhaustively until the next build;
+    ``compact`` rebuilds once the delta outgrows ``DELTA_COMPACT_BYTES``.
+    """
+
+    NUM_TABLES = 8
+    NUM_BITS = 12
+    SEED = 42
+    BUILD_CHUNK_SIZE = 65536
+    DELTA_COMPACT_BYTES = 8 * 1024 * 1024  # About 16k records at 128 dimensions
+    EXACT_SEARCH_MAX = 2048  # Smaller snapshots are scanned in full; buckets would be nearly empty
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, path=None, dimensions=None):
+        self.path = Path(path or getattr(
+            settings,
+            'RECOMMENDATION_ANN_INDEX_DIR',
+            Path(settings.BASE_DIR) / 'var' / 'product_index'
+        ))
+        self.store = SegmentStore(self.path, initial_delta='delta.bin')
+        self.dimensions = dimensions or ProductEmbedder.DIMENSIONS
+        self._record_dtype = np.dtype([
+            ('id', '<i8'),
+            ('vector', '<f4', (self.dimensions,)),
+        ])
+        self._bit_masks = (1 << np.arange(self.NUM_BITS)).astype(np.uint32)
+        self._lock = threading.Lock()
+        self._reset()
+
+    @classmethod
+    def get_instance(cls):
+        """Per-process index, loaded lazily and refreshed from the delta"""
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    instance = cls()
+                    instance.load()
+                    cls._instance = instance
+        cls._instance.refresh()
+        return cls._instance
+
+    def _reset(self):
+        self.planes = np.random.default_rng(self.SEED).standard_normal(
+            (self.dimensions, self.NUM_TABLES * self.NUM_BITS)
+        ).astype(np.float32)
+        self.ids = np.empty(0, dtype=np.int64)
+        self.vectors = np.empty((0, self.dimensions), dtype=np.float32)
+        self._id_order = np.empty(0, dtype=np.int64)
+        self._sorted_codes = [np.empty(0, dtype=np.uint32)] * self.NUM_TABLES
+        self._code_order = [np.empty(0, dtype=np.int64)] * self.NUM_TABLES
+        self._delta = {}
+        self._stale = set()
+        self._delta_ids = np.empty(0, dtype=np.int64)
+        self._delta_vectors = np.empty((0, self.dimensions), dtype=np.float32)
+        self._deltas = []
+        self._delta_offsets = {}
+        self._pointer = None
+
+    # Building and persistence
+
+    @classmethod
+    def build(cls, products=None, path=None):
+        """Embed all products and publish a fresh base snapshot"""
+        from products.models import Product
+
+        if products is None:
+            products = Product.objects.select_related('category')
+
+        index = cls(path=path)
+        # Inserts made from here on go to a new delta log, replayed on top of the snapshot
+        since = index.store.rotate()
+
+        embedder = ProductEmbedder(index.dimensions)
+        ids, vectors = [], []
+        for product in products.iterator():
+            ids.append(product.id)
+            vectors.append(embedder.embed(product))
+
+        directory = index.store.new_segment()
+        arrays = {
+            'ids.npy': np.asarray(ids, dtype=np.int64),
+            'vectors.npy': np.asarray(vectors, dtype=np.float32).reshape(-1, index.dimensions),
+            'planes.npy': index.planes,
+        }
+        for name, array in arrays.items():
+            with open(directory / name, 'wb') as f:
+                np.save(f, array)
+        index.store.publish(directory, since)
+
+        index.load()
+        logger.info(f"Built product vector index with {len(ids)} products at {directory}")
+        return index
+
+    @classmethod
+    def compact(cls, path=None, max_delta_bytes=None):
+        """Rebuild the snapshot if the delta logs have outgrown their cap; returns the new index or None"""
+        index = cls(path=path)
+        _, pointer = index.store.read()
+        size = index.store.pending_bytes(pointer)
+        if size <= (max_delta_bytes or cls.DELTA_COMPACT_BYTES):
+            return None
+
+        logger.info(f"Compacting product vector index: delta logs hold {size} bytes")
+        return cls.build(path=path)
+
+    def load(self):
+        """Load the live snapshot and replay its delta logs"""
+        with self._lock:
+            self._reset()
+            self._pointer, pointer = self.store.read()
+            self._deltas = pointer['deltas']
+            self._delta_offsets = dict(pointer.get('offsets', {}))
+            directory = self.store.segment_path(pointer)
+            if directory is not None:
+                self.ids = np.load(directory / 'ids.npy')
+                self.vectors = np.load(directory / 'vectors.npy', mmap_mode='r')
+                self.planes = np.load(directory / 'planes.npy')
+                self._id_order = np.argsort(self.ids, kind='stable')
+                self._build_tables()
+            self._replay_delta()
+
+    def refresh(self):
+        """Pick up inserts made by other processes, or a rebuilt snapshot"""
+        if self.store.read()[0] != self._pointer:
+            self.load()
+            return
+        with self._lock:
+            self._replay_delta()
+
+    def _build_tables(self):
+        codes = np.empty((len(self.ids), self.NUM_TABLES), dtype=np.uint32)
+        for start in range(0, len(self.ids), self.BUILD_CHUNK_SIZE):
+            chunk = np.asarray(self.vectors[start:start + self.BUILD_CHUNK_SIZE])
+            codes[start:start + len(chunk)] = self._hash(chunk)
+
+        self._code_order = []
+        self._sorted_codes = []
+        for table in range(self.NUM_TABLES):
+            order = np.argsort(codes[:, table], kind='stable')
+            self._code_order.append(order)
+            self._sorted_codes.append(codes[order, table])
+
+    def _replay_delta(self):
+        records = []
+        for name in self._deltas:
+            offset = self._delta_offsets.get(name, 0)
+            data = self.store.read_delta(name, offset)
+            # Ignore a record that is still being written
+            usable = len(data) - len(data) % self._record_dtype.itemsize
+            if usable:
+                records.append(np.frombuffer(data[:usable], dtype=self._record_dtype))
+                self._delta_offsets[name] = offset + usable
+        if not records:
+            return
+
+        for record in np.concatenate(records):
+            product_id = int(record['id'])
+            self._stale.add(product_id)
+            if np.any(record['vector']):
+                self._delta[product_id] = np.array(record['vector'])
+            else:
+                self._delta.pop(product_id, None)
+
+        self._delta_ids = np.fromiter(self._delta.keys(), dtype=np.int64, count=len(self._delta))
+        self._delta_vectors = (
+            np.stack(list(self._delta.values())) if self._delta
+            else np.empty((0, self.dimensions), dtype=np.float32)
+        )
+
+    def _append(self, product_id, vector):
+        record = np.zeros(1, dtype=self._record_dtype)
+        record['id'] = product_id
+        record['vector'] = vector
+        # Single small O_APPEND write, so concurrent writers do not interleave
+        self.store.append(record.tobytes())
+        self.refresh()
+
+    def add(self, product_id, vector):
+        """Insert or replace a product's vector"""
+        self._append(product_id, np.asarray(vector, dtype=np.float32))
+
+    def add_product(self, product):
+        self.add(product.id, ProductEmbedder(self.dimensions).embed(product))
+
+    def remove(self, product_id):
+        self._append(product_id, np.zeros(self.dimensions, dtype=np.float32))
+
+    # Queries
+
+    def _hash(self, vectors):
+        bits = (vectors @ self.planes) > 0
+        bits = bits.reshape(len(vectors), self.NUM_TABLES, self.NUM_BITS)
+        return (bits * self._bit_masks).sum(axis=2).astype(np.uint32)
+
+    def _probe(self, vector):
+        if not len(self.ids):
+            return np.empty(0, dtype=np.int64)
+        if len(self.ids) <= self.EXACT_SEARCH_MAX:
+            return np.arange(len(self.ids))
+
+        codes = self._hash(vector[None, :])[0]
+        candidates = []
+        for table in range(self.NUM_TABLES):
+            probes = np.concatenate(([codes[table]], codes[table] ^ self._bit_masks))
+            sorted_codes = self._sorted_codes[table]
+            left = np.searchsorted(sorted_codes, probes, side='left')
+            right = np.searchsorted(sorted_codes, probes, side='right')
+            for lo, hi in zip(left, right):
+                if hi > lo:
+                    candidates.append(self._code_order[table][lo:hi])
+
+        if not candidates:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(candidates))
+
+    def get_vector(self, product_id):
+        if product_id in self._delta:
+            return self._delta[product_id]
+        if product_id in self._stale or not len(self.ids):
+            return None
+        position = np.searchsorted(self.ids, product_id, sorter=self._id_order)
+        if position < len(self.ids):
+            row = self._id_order[position]
+            if self.ids[row] == product_id:
+                return np.asarray(self.vectors[row])
+        return None
+
+    def query(self, vector, k=10, exclude=()):
+        """Return up to k (product_id, score) pairs most similar to vector"""
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return []
+        vector = vector / norm
+
+        rows = self._probe(vector)
+        ids = self.ids[rows]
+        scores = np.asarray(self.vectors[rows]) @ vector if len(rows) else np.empty(0, dtype=np.float32)
+
+        if self._stale:
+            fresh = ~np.isin(ids, np.fromiter(self._stale, dtype=np.int64))
+            ids, scores = ids[fresh], scores[fresh]
+        if len(self._delta_ids):
+            ids = np.concatenate((ids, self._delta_ids))
+            scores = np.concatenate((scores, self._delta_vectors @ vector))
+        if exclude:
+            keep = ~np.isin(ids, np.asarray(list(exclude), dtype=np.int64))
+            ids, scores = ids[keep], scores[keep]
+
+        if len(scores) > k:
+            best = np.argpartition(-scores, k - 1)[:k]
+            ids, scores = ids[best], scores[best]
+        order = np.argsort(-scores)
+        return [(int(ids[i]), float(scores[i])) for i in order]
+
+    def similar_to(self, product, k=10):
+        """Products most similar to ``product`` (a Product or its id)"""
+        product_id = getattr(product, 'id', product)
+        vector = self.get_vector(product_id)
+        if vector is None and hasattr(product, 'name'):
+            vector = ProductEmbedder(self.dimensions).embed(product)
+        if vector is None:
+            return []
+        return self.query(vector, k=k, exclude={product_id})
@@ -0,0 +1,289 @@
+import json
+from array import array
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import logging
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from django.db import transaction
+from django.utils import timezone
+
+from products.models import Product
+from .factorization import ALSModel
+from .models import ProductSimilarity, UserProductScore, UserRecommendation
+from .services import RecommendationService
+
+logger = logging.getLogger(__name__)
+
+# Scoring state shared with forked workers (inherited copy-on-write, never pickled)
+_STATE = {}
+
+
+def _top_n(columns, values, exclude, limit):
+    keep = ~np.isin(columns, exclude) & np.isfinite(values) & (values > 0)
+    columns, values = columns[keep], values[keep]
+    if len(values) > limit:
+        best = np.argpartition(-values, limit - 1)[:limit]
+        columns, values = columns[best], values[best]
+    return columns[np.argsort(-values)]
+
+
+def _score_chunk(bounds):
+    """Score users [start, end) of the loaded matrix; runs in a worker"""
+    start, end = bounds
+    user_items = _STATE['user_items'][start:end]
+    item_ids = _STATE['item_ids']
+    user_ids = _STATE['user_ids'][start:end]
+    limit = _STATE['limit']
+    results = []
+
+    if _STATE['strategy'] == 'als':
+        user_rows = _STATE['als_user_rows'][start:end]
+        known = user_rows >= 0
+        scores = np.zeros((end - start, len(item_ids)), dtype=np.float32)
+        if known.any():
+            scores[known] = np.asarray(_STATE['als_user_factors'][user_rows[known]]) @ _STATE['als_item_factors'].T
+        for offset in range(end - start):
+            if not known[offset]:
+                results.append((int(user_ids[offset]), []))
+                continue
+            seen = user_items.indices[user_items.indptr[offset]:user_items.indptr[offset + 1]]
+            columns = _top_n(np.arange(len(item_ids)), scores[offset], seen, limit)
+            results.append((int(user_ids[offset]), item_ids[columns].tolist()))
+        return results
+
+    # Item-based CF: every interacted item votes for its stored neighbours
+    scores = (user_items @ _STATE['similarity']).tocsr()
+    for offset in range(end - start):
+        row = slice(scores.indptr[offset], scores.indptr[offset + 1])
+        seen = user_items.indices[user_items.indptr[offset]:user_items.indptr[offset + 1]]
+        columns = _top_n(scores.indices[row], scores.data[row], seen, limit)
+        results.append((int(user_ids[offset]), item_ids[columns].tolist()))
+    return results
+
+
+class BatchRecommender:
+    """Score recommendations for every user in one pass.
+
+    Interaction scores, stored similarities (or ALS factors) and the set of
+    available products are loaded once into sparse/dense arrays. Users are
+    then scored in chunks with matrix products, spread over a forked process
+    pool, and results are yielded in order as ``(user_id, product_ids)`` so
+    they can be streamed to a file or table without holding them all. Users
+    without any scored product are yielded with an empty list.
+    """
+
+    CHUNK_SIZE = 1000
+    ALS_CHUNK_SIZE = 32  # Dense chunk x catalogue score matrix per task
+    STRATEGIES = ('similarity', 'als')
+
+    def __init__(self, strategy='similarity', limit=10, chunk_size=None, workers=None):
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f"Unknown strategy: {strategy}")
+        self.strategy = strategy
+        self.limit = limit
+        default_chunk = self.ALS_CHUNK_SIZE if strategy == 'als' else self.CHUNK_SIZE
+        self.chunk_size = chunk_size or default_chunk
+        self.workers = workers or os.cpu_count() or 1
+        self.stats = {}
+
+    def load(self):
+        """Load everything needed for scoring with a handful of queries"""
+        started = time.perf_counter()
+        item_ids = np.fromiter(
+            Product.objects.filter(available=True).order_by('id').values_list('id', flat=True),
+            dtype=np.int64
+        )
+
+        # Per-user scores, rescaled so each user's strongest product is 1
+        users, products, scores = self._columns(
+            UserProductScore.objects.values_list('user_id', 'product_id', 'score')
+        )
+
+        user_ids, user_index = np.unique(users, return_inverse=True)
+        item_index, known = self._index(item_ids, products)
+        user_items = csr_matrix(
+            (scores[known], (user_index[known], item_index[known])),
+            shape=(len(user_ids), len(item_ids))
+        )
+        row_max = np.asarray(user_items.max(axis=1).todense()).ravel()
+        row_max[row_max == 0] = 1.0
+        user_items = csr_matrix(
+            user_items.multiply(1.0 / row_max[:, None]), dtype=np.float32
+        )
+
+        _STATE.clear()
+        _STATE.update({
+            'strategy': self.strategy,
+            'limit': self.limit,
+            'item_ids': item_ids,
+            'user_ids': user_ids,
+            'user_items': user_items,
+        })
+
+        if self.strategy == 'als':
+            self._load_als(item_ids, user_ids)
+        else:
+            self._load_similarity(item_ids)
+
+        self.stats = {
+            'users': int(len(user_ids)),
+            'items': int(len(item_ids)),
+            'load_seconds': round(time.perf_counter() - started, 3),
+        }
+        logger.info(f"Loaded batch recommendation data: {self.stats}")
+
+    @staticmethod
+    def _columns(rows):
+        """Read (id, id, float) rows into compact arrays without per-row tuples"""
+        first, second, values = array('q'), array('q'), array('d')
+        for a, b, value in rows.iterator():
+            first.append(a)
+            second.append(b)
+            values.append(value)
+        return (
+            np.frombuffer(first, dtype=np.int64),
+            np.frombuffer(second, dtype=np.int64),
+            np.frombuffer(values, dtype=np.float64),
+        )
+
+    @staticmethod
+    def _index(item_ids, product_ids):
+        positions = np.minimum(np.searchsorted(item_ids, product_ids), max(len(item_ids) - 1, 0))
+        known = (item_ids[positions] == product_ids) if len(item_ids) else np.zeros(len(product_ids), bool)
+        return positions, known
+
+    def _load_similarity(self, item_ids):
+        product_a, product_b, similarity = self._columns(
+            ProductSimilarity.objects.values_list('product_a_id', 'product_b_id', 'similarity_score')
+        )
+        a_index, a_known = self._index(item_ids, product_a)
+        b_index, b_known = self._index(item_ids, product_b)
+        known = a_known & b_known
+        _STATE['similarity'] = csr_matrix(
+            (similarity[known].astype(np.float32), (a_index[known], b_index[known])),
+            shape=(len(item_ids), len(item_ids))
+        )
+
+    def _load_als(self, item_ids, user_ids):
+        model = ALSModel.get_instance()
+        if not model.is_trained:
+            raise ValueError("ALS model has not been trained")
+
+        # Restrict the catalogue to available products the model knows
+        item_positions, item_known = self._index(model.item_ids, item_ids)
+        _STATE['item_ids'] = item_ids[item_known]
+        _STATE['user_items'] = _STATE['user_items'][:, np.flatnonzero(item_known)].tocsr()
+        _STATE['als_item_factors'] = np.ascontiguousarray(model.item_factors[item_positions[item_known]])
+        _STATE['als_user_factors'] = model.user_factors
+
+        user_positions, user_known = self._index(model.user_ids, user_ids)
+        _STATE['als_user_rows'] = np.where(user_known, user_positions, -1)
+
+    def run(self, limit=None):
+        """Yield (user_id, product_ids) for every user with scores, in user order"""
+        if 'users' not in self.stats:
+            self.load()
+        # Set before the pool forks so workers inherit it
+        _STATE['limit'] = limit or self.limit
+
+        started = time.perf_counter()
+        total = len(_STATE['user_ids'])
+        chunks = [
+            (start, min(start + self.chunk_size, total))
+            for start in range(0, total, self.chunk_size)
+        ]
+        scored = 0
+
+        if self.workers <= 1 or len(chunks) <= 1:
+            for bounds in chunks:
+                for result in _score_chunk(bounds):
+                    scored += 1
+                    yield result
+        else:
+            context = multiprocessing.get_context('fork')
+            with ProcessPoolExecutor(max_workers=self.workers, mp_context=context) as executor:
+                # Keep a bounded window of chunks in flight so results stream
+                window = self.workers * 2
+                pending = [executor.submit(_score_chunk, bounds) for bounds in chunks[:window]]
+                next_chunk = window
+                while pending:
+                    future = pending.pop(0)
+                    if next_chunk < len(chunks):
+                        pending.append(executor.submit(_score_chunk, chunks[next_chunk]))
+                        next_chunk += 1
+                    for result in future.result():
+                        scored += 1
+                        yield result
+
+        self.stats.update({
+            'scored_users': scored,
+            'scoring_seconds': round(time.perf_counter() - started, 3),
+        })
+
+    def write_jsonl(self, path):
+        """Stream results to a JSON-lines file; returns the number of users"""
+        count = 0
+        with open(path, 'w') as output:
+            for user_id, product_ids in self.run():
+                if not product_ids:
+                    continue
+                output.write(json.dumps({'user_id': user_id, 'product_ids': product_ids}))
+                output.write('\n')
+                count += 1
+        return count
+
+    def write_table(self, batch_size=1000):
+        """Stream results into the materialized UserRecommendation table.
+
+        Rows match what ``RecommendationService.materialize_recommendations``
+        stores: ``MATERIALIZED_LIMIT`` products per user, filtered against the
+        user's preferences and topped up with popular products. Users left
+        with no products lose their stored rows.
+        """
+        limit = RecommendationService.MATERIALIZED_LIMIT
+        count = 0
+        batch = []
+        # Over-fetch like the per-user path, since preferences filter candidates out
+        for result in self.run(limit=limit * 3):
+            batch.append(result)
+            if len(batch) >= batch_size:
+                count += self._store(batch, limit)
+                batch = []
+        if batch:
+            count += self._store(batch, limit)
+        return count
+
+    @staticmethod
+    def _store(batch, limit):
+        user_ids = [user_id for user_id, _ in batch]
+        products = Product.objects.in_bulk({
+            product_id for _, product_ids in batch for product_id in product_ids
+        })
+        preference_filters = RecommendationService._load_preference_filters(user_ids)
+
+        computed_at = timezone.now()
+        rows = []
+        for user_id, product_ids in batch:
+            recommendations = RecommendationService._filter_recommendations(
+                (products[product_id] for product_id in product_ids if product_id in products),
+                preference_filters.get(user_id),
+                limit
+            )
+            rows.extend(
+                UserRecommendation(
+                    user_id=user_id,
+                    product=product,
+                    rank=rank,
+                    computed_at=computed_at
+                )
+                for rank, product in enumerate(recommendations)
+            )
+
+        with transaction.atomic():
+            UserRecommendation.objects.filter(user_id__in=user_ids).delete()
+            UserRecommendation.objects.bulk_create(rows)
+        return len(batch)
@@ -0,0 +1,176 @@
+from collections import defaultdict
+from datetime import timedelta
+import logging
+
+import numpy as np
+from scipy.sparse import csr_matrix, triu
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from orders.models import Order, OrderItem
+from .models import CoPurchaseCount, FrequentlyBoughtTogether, MiningWatermark
+
+logger = logging.getLogger(__name__)
+
+
+class CoPurchaseMiner:
+    """Incremental "frequently bought together" mining from order baskets.
+
+    Orders past the stored watermark are turned into a binary basket matrix
+    ``B`` (orders x products). The upper triangle of ``B.T @ B`` holds the
+    co-purchase counts of those orders (the diagonal being the number of
+    orders containing each product) and is added to ``CoPurchaseCount`` with
+    one upsert. Only products that appear in the new orders have their lists
+    recomputed, using
+
+    * confidence(a -> b) = n_ab / n_a
+    * lift(a, b) = n_ab * N / (n_a * n_b)
+
+    Pairs need ``MIN_PAIR_COUNT`` co-purchases and a lift above 1 (bought
+    together more often than chance) and are ranked by confidence. Orders
+    cancelled after they were mined stay counted.
+
+    The watermark is an order id, so mining stops at the first order younger
+    than ``SETTLE_SECONDS``: by then every order with a lower id has
+    committed, and one that committed late is not skipped. Orders are
+    written together with their items, so a settled basket is complete.
+    """
+
+    WATERMARK = 'copurchase'
+    ORDER_BATCH_SIZE = 5000
+    REFRESH_BATCH_SIZE = 500
+    MIN_PAIR_COUNT = 3
+    TOP_K = 10
+    SETTLE_SECONDS = 600
+
+    @classmethod
+    def update(cls):
+        """Fold orders past the watermark into the counts; returns orders processed"""
+        watermark, _ = MiningWatermark.objects.get_or_create(name=cls.WATERMARK)
+        settled = timezone.now() - timedelta(seconds=cls.SETTLE_SECONDS)
+        # Stop at the first unsettled order so the watermark never passes it
+        first_unsettled = Order.objects.filter(
+            id__gt=watermark.last_id,
+            created__gte=settled
+        ).order_by('id').values_list('id', flat=True).first()
+        new_items = OrderItem.objects.exclude(order__status='cancelled')
+        if first_unsettled is not None:
+            new_items = new_items.filter(order_id__lt=first_unsettled)
+        processed = 0
+
+        while True:
+            order_ids = list(
+                new_items.filter(
+                    order_id__gt=watermark.last_id
+                ).order_by('order_id').values_list('order_id', flat=True).distinct()[:cls.ORDER_BATCH_SIZE]
+            )
+            if not order_ids:
+                break
+
+            items = list(
+                OrderItem.objects.filter(
+                    order_id__in=order_ids
+                ).values_list('order_id', 'product_id')
+            )
+            touched = cls._add_counts(items, watermark, len(order_ids), order_ids[-1])
+            for start in range(0, len(touched), cls.REFRESH_BATCH_SIZE):
+                cls.refresh_products(touched[start:start + cls.REFRESH_BATCH_SIZE], watermark.total)
+            processed += len(order_ids)
+
+        logger.info(f"Mined {processed} new orders for co-purchases")
+        return processed
+
+    @classmethod
+    def _add_counts(cls, items, watermark, order_count, last_order_id):
+        orders = np.fromiter((order_id for order_id, _ in items), dtype=np.int64, count=len(items))
+        products = np.fromiter((product_id for _, product_id in items), dtype=np.int64, count=len(items))
+        order_ids, order_index = np.unique(orders, return_inverse=True)
+        product_ids, product_index = np.unique(products, return_inverse=True)
+
+        baskets = csr_matrix(
+            (np.ones(len(items), dtype=np.int32), (order_index, product_index)),
+            shape=(len(order_ids), len(product_ids))
+        )
+        baskets.data[:] = 1  # Several lines of one product count once per order
+        counts = triu(baskets.T @ baskets).tocoo()
+
+        table = connection.ops.quote_name(CoPurchaseCount._meta.db_table)
+        sql = (
+            f"INSERT INTO {table} (product_a_id, product_b_id, count) VALUES (%s, %s, %s) "
+            f"ON CONFLICT (product_a_id, product_b_id) DO UPDATE SET "
+            f"count = {table}.count + excluded.count"
+        )
+        params = [
+            (int(product_ids[a]), int(product_ids[b]), int(count))
+            for a, b, count in zip(counts.row, counts.col, counts.data)
+        ]
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(sql, params)
+            watermark.last_id = last_order_id
+            watermark.total += order_count
+            watermark.save()
+
+        return product_ids.tolist()
+
+    @classmethod
+    def refresh_products(cls, product_ids, total_orders=None):
+        """Recompute the bought-together lists of the given products"""
+        if not product_ids:
+            return
+        if total_orders is None:
+            total_orders = MiningWatermark.objects.filter(
+                name=cls.WATERMARK
+            ).values_list('total', flat=True).first() or 0
+
+        targets = set(product_ids)
+        pairs = defaultdict(list)
+        for a, b, count in CoPurchaseCount.objects.filter(
+            Q(product_a_id__in=targets) | Q(product_b_id__in=targets),
+            count__gte=cls.MIN_PAIR_COUNT
+        ).exclude(
+            product_a=F('product_b')
+        ).values_list('product_a_id', 'product_b_id', 'count').iterator():
+            if a in targets:
+                pairs[a].append((b, count))
+            if b in targets:
+                pairs[b].append((a, count))
+
+        involved = targets.union(other for related in pairs.values() for other, _ in related)
+        order_counts = dict(
+            CoPurchaseCount.objects.filter(
+                product_a_id__in=involved,
+                product_a=F('product_b')
+            ).values_list('product_a_id', 'count')
+        )
+
+        rows = []
+        for product_id in targets:
+            n_a = order_counts.get(product_id)
+            if not n_a:
+                continue
+            scored = []
+            for other, n_ab in pairs.get(product_id, ()):
+                n_b = order_counts.get(other)
+                if not n_b:
+                    continue
+                lift = n_ab * total_orders / (n_a * n_b)
+                if lift > 1.0:
+                    scored.append((n_ab / n_a, lift, other))
+            scored.sort(reverse=True)
+
+            rows.extend(
+                FrequentlyBoughtTogether(
+                    product_id=product_id,
+                    related_id=other,
+                    rank=rank,
+                    confidence=confidence,
+                    lift=lift
+                )
+                for rank, (confidence, lift, other) in enumerate(scored[:cls.TOP_K])
+            )
+
+        with transaction.atomic():
+            FrequentlyBoughtTogether.objects.filter(product_id__in=targets).delete()
+            FrequentlyBoughtTogether.objects.bulk_create(rows)
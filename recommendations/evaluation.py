@@ -0,0 +1,380 @@
+import tempfile
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+import logging
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from products.models import Category, Product
+from .batch import _top_n
+from .factorization import ALSModel, ImplicitALSTrainer
+from .models import UserProductInteraction
+from .scoring import InteractionScoreStore
+from .services import RecommendationService
+from .similarity import ItemItemSimilarityBuilder, load_interaction_matrix
+
+logger = logging.getLogger(__name__)
+
+
+class RecommendationEvaluator:
+    """Offline quality evaluation on a time split of the interaction log.
+
+    Interactions before the cutoff (by default the timestamp that leaves
+    ``test_fraction`` of the events after it) train each strategy in memory;
+    products a user interacted with after the cutoff, and had not seen
+    before it, are the relevant set. Users without training history cannot
+    be scored by any strategy and are only counted.
+
+    Reported per strategy: mean precision@k and recall@k over evaluated
+    users, and catalogue coverage (distinct recommended products over
+    products in the training data). Nothing is written to the database.
+    """
+
+    STRATEGIES = ('popular', 'similarity', 'als')
+    K = 10
+    TEST_FRACTION = 0.2
+
+    def __init__(self, k=None, test_fraction=None, cutoff=None, strategies=None, max_users=None):
+        self.k = k or self.K
+        self.test_fraction = test_fraction or self.TEST_FRACTION
+        self.cutoff = cutoff
+        self.strategies = strategies or self.STRATEGIES
+        self.max_users = max_users
+
+        unknown = set(self.strategies) - set(self.STRATEGIES)
+        if unknown:
+            raise ValueError(f"Unknown strategies: {', '.join(sorted(unknown))}")
+
+    def split(self):
+        """Return the cutoff timestamp, computing it from the log if needed"""
+        if self.cutoff is None:
+            timestamps = UserProductInteraction.objects.order_by('timestamp').values_list('timestamp', flat=True)
+            total = timestamps.count()
+            if total < 2:
+                raise ValueError("Not enough interactions to split")
+            self.cutoff = timestamps[min(int(total * (1 - self.test_fraction)), total - 1)]
+        return self.cutoff
+
+    def evaluate(self):
+        cutoff = self.split()
+        train = UserProductInteraction.objects.filter(timestamp__lt=cutoff)
+        matrix, user_ids, item_ids = load_interaction_matrix(train)
+        if matrix.nnz == 0:
+            raise ValueError("No interactions before the cutoff")
+
+        relevant = self._load_relevant(cutoff, matrix, user_ids, item_ids)
+        rows = np.fromiter(sorted(relevant), dtype=np.int64, count=len(relevant))
+        if self.max_users and len(rows) > self.max_users:
+            rows = np.sort(np.random.default_rng(0).choice(rows, self.max_users, replace=False))
+
+        report = {
+            'cutoff': cutoff.isoformat(),
+            'k': self.k,
+            'train_interactions': int(train.count()),
+            'train_users': int(len(user_ids)),
+            'train_items': int(len(item_ids)),
+            'evaluated_users': int(len(rows)),
+            'cold_users': self._count_cold_users(cutoff, user_ids),
+            'strategies': {},
+        }
+
+        with tempfile.TemporaryDirectory(prefix='recommendation-eval-') as workdir:
+            for strategy in self.strategies:
+                started = time.perf_counter()
+                recommend = getattr(self, f'_{strategy}_recommender')(train, matrix, user_ids, item_ids, workdir)
+                result = self._score(recommend(rows), relevant, len(item_ids))
+                result['seconds'] = round(time.perf_counter() - started, 3)
+                report['strategies'][strategy] = result
+                logger.info(f"Evaluated {strategy} recommendations: {result}")
+
+        return report
+
+    def _load_relevant(self, cutoff, matrix, user_ids, item_ids):
+        """Map matrix rows to the sets of item columns first seen after the cutoff"""
+        relevant = {}
+        test_rows = UserProductInteraction.objects.filter(
+            timestamp__gte=cutoff
+        ).values_list('user_id', 'product_id').distinct()
+
+        for user_id, product_id in test_rows.iterator():
+            row = np.searchsorted(user_ids, user_id)
+            column = np.searchsorted(item_ids, product_id)
+            if row >= len(user_ids) or user_ids[row] != user_id:
+                continue
+            if column >= len(item_ids) or item_ids[column] != product_id:
+                # Unseen in training: counts towards recall but can never be hit.
+                # Negative ids cannot collide with (non-negative) column numbers.
+                relevant.setdefault(int(row), set()).add(-product_id)
+                continue
+            relevant.setdefault(int(row), set()).add(int(column))
+
+        for row in list(relevant):
+            seen = set(matrix.indices[matrix.indptr[row]:matrix.indptr[row + 1]].tolist())
+            relevant[row] -= seen
+            if not relevant[row]:
+                del relevant[row]
+        return relevant
+
+    @staticmethod
+    def _count_cold_users(cutoff, user_ids):
+        test_users = np.fromiter(
+            UserProductInteraction.objects.filter(
+                timestamp__gte=cutoff
+            ).values_list('user_id', flat=True).distinct(),
+            dtype=np.int64
+        )
+        return int((~np.isin(test_users, user_ids)).sum())
+
+    def _score(self, recommendations, relevant, catalogue_size):
+        precision = recall = 0.0
+        recommended = set()
+        for row, columns in recommendations.items():
+            columns = list(columns)[:self.k]
+            hits = len(relevant[row].intersection(columns))
+            precision += hits / self.k
+            recall += hits / len(relevant[row])
+            recommended.update(columns)
+
+        users = len(recommendations) or 1
+        return {
+            f'precision@{self.k}': round(precision / users, 4),
+            f'recall@{self.k}': round(recall / users, 4),
+            'coverage': round(len(recommended) / catalogue_size, 4) if catalogue_size else 0.0,
+        }
+
+    # Strategies: each returns rows -> {row: [item columns, best first]}
+
+    def _popular_recommender(self, train, matrix, user_ids, item_ids, workdir):
+        popularity = np.asarray((matrix > 0).sum(axis=0)).ravel().astype(np.float64)
+        columns = np.arange(len(item_ids))
+
+        def recommend(rows):
+            return {
+                int(row): _top_n(
+                    columns, popularity,
+                    matrix.indices[matrix.indptr[row]:matrix.indptr[row + 1]],
+                    self.k
+                ).tolist()
+                for row in rows
+            }
+        return recommend
+
+    def _similarity_recommender(self, train, matrix, user_ids, item_ids, workdir):
+        builder = ItemItemSimilarityBuilder(top_k=RecommendationService.SIMILARITY_TOP_K)
+        sources, targets, scores = [], [], []
+        for product_id, neighbors in builder.build(matrix, item_ids):
+            source = np.searchsorted(item_ids, product_id)
+            for neighbor_id, score in neighbors:
+                sources.append(source)
+                targets.append(np.searchsorted(item_ids, neighbor_id))
+                scores.append(score)
+        similarity = csr_matrix(
+            (np.asarray(scores, dtype=np.float32), (sources, targets)),
+            shape=(len(item_ids), len(item_ids))
+        )
+
+        def recommend(rows):
+            results = {}
+            for start in range(0, len(rows), 1000):
+                chunk = rows[start:start + 1000]
+                user_items = matrix[chunk]
+                chunk_scores = (user_items @ similarity).tocsr()
+                for offset, row in enumerate(chunk):
+                    span = slice(chunk_scores.indptr[offset], chunk_scores.indptr[offset + 1])
+                    seen = user_items.indices[user_items.indptr[offset]:user_items.indptr[offset + 1]]
+                    results[int(row)] = _top_n(
+                        chunk_scores.indices[span], chunk_scores.data[span], seen, self.k
+                    ).tolist()
+            return results
+        return recommend
+
+    def _als_recommender(self, train, matrix, user_ids, item_ids, workdir):
+        ImplicitALSTrainer(path=workdir).train(train)
+        model = ALSModel(path=workdir)
+        column_of = {int(product_id): column for column, product_id in enumerate(item_ids)}
+
+        def recommend(rows):
+            results = {}
+            for row in rows:
+                seen = item_ids[matrix.indices[matrix.indptr[row]:matrix.indptr[row + 1]]]
+                ranked = model.recommend(int(user_ids[row]), k=self.k, exclude=seen.tolist())
+                results[int(row)] = [column_of[product_id] for product_id, _ in ranked]
+            return results
+        return recommend
+
+
+class RecommendationBenchmark:
+    """Latency and throughput of RecommendationService on synthetic data.
+
+    Generates users, categories, products and interactions inside a
+    transaction that is rolled back at the end, so it can be pointed at a
+    development database. Each user favours one category and product
+    popularity follows a Zipf law, which gives the strategies real structure
+    to find when ``evaluate`` is set. Rows are bulk-inserted, so no signals
+    fire and the on-disk vector index is left alone. Similarities are built
+    from the synthetic interactions only, so stored neighbour lists of real
+    products are never rewritten or locked.
+
+    Measured:
+
+    * ``update_product_similarities`` wall time and interactions/products
+      per second;
+    * ``get_personalized_recommendations`` p50/p99 latency for a sample of
+      users, cold (first call, which materializes) and warm.
+    """
+
+    USERS = 1000
+    PRODUCTS = 500
+    CATEGORIES = 20
+    INTERACTIONS = 20000
+    LATENCY_SAMPLES = 200
+    HISTORY_DAYS = 180
+    CATEGORY_AFFINITY = 0.8
+    ZIPF_EXPONENT = 1.1
+    BATCH_SIZE = 5000
+
+    def __init__(self, users=None, products=None, categories=None, interactions=None,
+                 latency_samples=None, seed=42):
+        self.users = users or self.USERS
+        self.products = products or self.PRODUCTS
+        self.categories = min(categories or self.CATEGORIES, self.products)
+        self.interactions = interactions or self.INTERACTIONS
+        self.latency_samples = latency_samples or self.LATENCY_SAMPLES
+        self.rng = np.random.default_rng(seed)
+        self.user_ids = np.empty(0, dtype=np.int64)
+        self.token = None
+
+    def run(self, evaluate=False, **evaluator_options):
+        with transaction.atomic():
+            try:
+                report = {'dataset': self.generate()}
+                if evaluate:
+                    report['evaluation'] = RecommendationEvaluator(**evaluator_options).evaluate()
+                report['update_product_similarities'] = self.measure_similarity_update()
+                report['get_personalized_recommendations'] = self.measure_latency()
+            finally:
+                transaction.set_rollback(True)
+                # The cached popular list may name synthetic products that no longer exist
+                cache.delete(RecommendationService.popular_cache_key(RecommendationService.MATERIALIZED_LIMIT * 3))
+        return report
+
+    def generate(self):
+        token = self.token = uuid.uuid4().hex[:8]
+        categories = Category.objects.bulk_create([
+            Category(name=f'Synthetic category {i}', slug=f'synthetic-{token}-{i}')
+            for i in range(self.categories)
+        ])
+        category_of = self.rng.integers(0, self.categories, self.products)
+        products = Product.objects.bulk_create([
+            Product(
+                category_id=categories[category_of[i]].id,
+                name=f'Synthetic product {i}',
+                slug=f'synthetic-{token}-{i}',
+                price=Decimal(int(self.rng.integers(100, 50000))) / 100
+            )
+            for i in range(self.products)
+        ], batch_size=self.BATCH_SIZE)
+        users = get_user_model().objects.bulk_create([
+            get_user_model()(
+                username=f'synthetic-{token}-{i}',
+                email=f'synthetic-{token}-{i}@example.com'
+            )
+            for i in range(self.users)
+        ], batch_size=self.BATCH_SIZE)
+
+        # Postgres and SQLite both return primary keys from bulk_create
+        product_ids = np.asarray([product.id for product in products], dtype=np.int64)
+        user_ids = self.user_ids = np.asarray([user.id for user in users], dtype=np.int64)
+        by_category = [np.flatnonzero(category_of == c) for c in range(self.categories)]
+        favourite = self.rng.integers(0, self.categories, self.users)
+        everything = np.arange(self.products)
+
+        # Popularity rank is shuffled so it is independent of categories
+        popularity = 1.0 / np.arange(1, self.products + 1) ** self.ZIPF_EXPONENT
+        popularity = popularity[self.rng.permutation(self.products)]
+
+        types = list(RecommendationService.INTERACTION_WEIGHTS.items())
+        type_probabilities = np.asarray([0.6, 0.15, 0.1, 0.1, 0.05])[:len(types)]
+        type_probabilities /= type_probabilities.sum()
+        now = timezone.now()
+
+        written = 0
+        while written < self.interactions:
+            size = min(self.BATCH_SIZE, self.interactions - written)
+            users_batch = self.rng.integers(0, self.users, size)
+            in_favourite = self.rng.random(size) < self.CATEGORY_AFFINITY
+            pools = np.where(in_favourite, favourite[users_batch], -1)
+            chosen = np.empty(size, dtype=np.int64)
+            for category in np.unique(pools):
+                mask = pools == category
+                pool = by_category[category] if category >= 0 else everything
+                if not len(pool):
+                    pool = everything
+                weights = popularity[pool]
+                chosen[mask] = pool[self.rng.choice(len(pool), mask.sum(), p=weights / weights.sum())]
+            kinds = self.rng.choice(len(types), size, p=type_probabilities)
+            ages = self.rng.random(size) * self.HISTORY_DAYS * 86400
+
+            batch = [
+                UserProductInteraction(
+                    user_id=int(user_ids[users_batch[i]]),
+                    product_id=int(product_ids[chosen[i]]),
+                    interaction_type=types[kinds[i]][0],
+                    weight=types[kinds[i]][1],
+                    timestamp=now - timedelta(seconds=float(ages[i]))
+                )
+                for i in range(size)
+            ]
+            with transaction.atomic():
+                UserProductInteraction.objects.bulk_create(batch)
+                InteractionScoreStore.apply(batch)
+            written += size
+
+        return {
+            'users': self.users,
+            'products': self.products,
+            'categories': self.categories,
+            'interactions': written,
+        }
+
+    def measure_similarity_update(self):
+        synthetic = UserProductInteraction.objects.filter(product__slug__startswith=f'synthetic-{self.token}-')
+        interactions = synthetic.count()
+        products = self.products
+        started = time.perf_counter()
+        RecommendationService.update_product_similarities(interactions=synthetic)
+        seconds = time.perf_counter() - started
+        return {
+            'seconds': round(seconds, 3),
+            'interactions_per_second': round(interactions / seconds, 1) if seconds else None,
+            'products_per_second': round(products / seconds, 1) if seconds else None,
+        }
+
+    def measure_latency(self):
+        sample = self.rng.choice(self.user_ids, min(self.latency_samples, len(self.user_ids)), replace=False)
+        users = get_user_model().objects.in_bulk(sample.tolist())
+        timings = {'cold': [], 'warm': []}
+
+        for user_id in sample:
+            user = users[int(user_id)]
+            for phase in ('cold', 'warm'):
+                started = time.perf_counter()
+                RecommendationService.get_personalized_recommendations(user)
+                timings[phase].append((time.perf_counter() - started) * 1000)
+
+        return {
+            phase: {
+                'samples': len(values),
+                'p50_ms': round(float(np.percentile(values, 50)), 3),
+                'p99_ms': round(float(np.percentile(values, 99)), 3),
+                'max_ms': round(max(values), 3),
+            }
+            for phase, values in timings.items()
+        }
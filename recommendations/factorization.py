@@ -0,0 +1,226 @@
+import resource
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+import logging
+
+from .segments import SegmentStore
+from .similarity import load_interaction_matrix
+
+logger = logging.getLogger(__name__)
+
+
+def _default_model_dir():
+    return Path(getattr(
+        settings,
+        'RECOMMENDATION_ALS_MODEL_DIR',
+        Path(settings.BASE_DIR) / 'var' / 'als_model'
+    ))
+
+
+class ImplicitALSTrainer:
+    """Implicit-feedback ALS (Hu, Koren & Volinsky) solved with conjugate gradient.
+
+    Confidence is ``1 + alpha * weight`` of the aggregated interaction
+    weights. Each half-step runs ``cg_steps`` conjugate-gradient iterations per
+    row, warm-started from the previous factors, instead of an exact solve
+    (Takacs et al.), so the cost is linear in the number of interactions.
+
+    Factors are written straight into memory-mapped float32 ``.npy`` files,
+    so the trained model never has to fit in RAM twice. Each run writes a new
+    segment directory and switches the ``CURRENT`` pointer (SegmentStore) to
+    it once every file is complete, so readers never mix two runs.
+    """
+
+    FACTORS = 64
+    REGULARIZATION = 0.01
+    ALPHA = 40.0
+    ITERATIONS = 15
+    CG_STEPS = 3
+    SEED = 42
+
+    def __init__(self, factors=None, regularization=None, alpha=None,
+                 iterations=None, cg_steps=None, path=None):
+        self.factors = factors or self.FACTORS
+        self.regularization = self.REGULARIZATION if regularization is None else regularization
+        self.alpha = alpha or self.ALPHA
+        self.iterations = iterations or self.ITERATIONS
+        self.cg_steps = cg_steps or self.CG_STEPS
+        self.path = Path(path) if path else _default_model_dir()
+
+    def train(self, interactions=None):
+        """Train on UserProductInteraction weights; returns training stats"""
+        started = time.perf_counter()
+        matrix, user_ids, item_ids = load_interaction_matrix(interactions)
+        load_seconds = time.perf_counter() - started
+        if matrix.nnz == 0:
+            logger.warning("No interactions to train on")
+            return None
+
+        confidence = matrix.copy()
+        confidence.data = 1.0 + self.alpha * confidence.data
+        confidence_t = confidence.T.tocsr()
+
+        store = SegmentStore(self.path)
+        directory = store.new_segment()
+        user_factors = self._open_factors(directory / 'user_factors.npy', len(user_ids))
+        item_factors = self._open_factors(directory / 'item_factors.npy', len(item_ids))
+
+        for iteration in range(self.iterations):
+            self._least_squares_cg(confidence, user_factors, item_factors)
+            self._least_squares_cg(confidence_t, item_factors, user_factors)
+            logger.debug(f"ALS iteration {iteration + 1}/{self.iterations} done")
+
+        user_factors.flush()
+        item_factors.flush()
+        del user_factors, item_factors
+
+        for name, array in (('user_ids.npy', user_ids), ('item_ids.npy', item_ids)):
+            with open(directory / name, 'wb') as f:
+                np.save(f, array)
+        store.publish(directory)
+
+        stats = {
+            'users': int(len(user_ids)),
+            'items': int(len(item_ids)),
+            'interactions': int(matrix.nnz),
+            'factors': self.factors,
+            'iterations': self.iterations,
+            'load_seconds': round(load_seconds, 3),
+            'training_seconds': round(time.perf_counter() - started - load_seconds, 3),
+            'factor_megabytes': round(
+                (len(user_ids) + len(item_ids)) * self.factors * 4 / 2 ** 20, 2
+            ),
+            # ru_maxrss is reported in kilobytes on Linux
+            'peak_rss_megabytes': round(
+                resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2
+            ),
+        }
+        logger.info(f"Trained implicit ALS model: {stats}")
+        return stats
+
+    def _open_factors(self, path, rows):
+        factors = np.lib.format.open_memmap(
+            path,
+            mode='w+',
+            dtype=np.float32,
+            shape=(rows, self.factors)
+        )
+        rng = np.random.default_rng(self.SEED)
+        factors[:] = rng.standard_normal((rows, self.factors), dtype=np.float32) * 0.01
+        return factors
+
+    def _least_squares_cg(self, confidence, X, Y):
+        """Update every row of X given fixed Y, using a few CG steps per row"""
+        YtY = (Y.T @ Y).astype(np.float32) + self.regularization * np.eye(self.factors, dtype=np.float32)
+        indptr, indices, data = confidence.indptr, confidence.indices, confidence.data
+
+        for row in range(X.shape[0]):
+            columns = indices[indptr[row]:indptr[row + 1]]
+            if not len(columns):
+                continue
+            weights = data[indptr[row]:indptr[row + 1]]
+            Yi = np.asarray(Y[columns])
+            x = np.array(X[row])
+
+            # r = b - A x with A = YtY + Yi^T (C - I) Yi and b = Yi^T C p
+            r = Yi.T @ (weights - (weights - 1.0) * (Yi @ x)) - YtY @ x
+            p = r.copy()
+            rsold = r @ r
+            for _ in range(self.cg_steps):
+                if rsold < 1e-20:
+                    break
+                Ap = YtY @ p + Yi.T @ ((weights - 1.0) * (Yi @ p))
+                step = rsold / (p @ Ap)
+                x += step * p
+                r -= step * Ap
+                rsnew = r @ r
+                p = r + (rsnew / rsold) * p
+                rsold = rsnew
+
+            X[row] = x
+
+
+class ALSModel:
+    """Read-only view of trained factors, memory-mapped from disk"""
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else _default_model_dir()
+        self.store = SegmentStore(self.path)
+        self._pointer = None
+        self.load()
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        cls._instance.refresh()
+        return cls._instance
+
+    def load(self):
+        self._pointer, pointer = self.store.read()
+        directory = self.store.segment_path(pointer)
+        if directory is None:
+            self.user_ids = self.item_ids = np.empty(0, dtype=np.int64)
+            self.user_factors = self.item_factors = None
+            return
+
+        self.user_ids = np.load(directory / 'user_ids.npy')
+        self.item_ids = np.load(directory / 'item_ids.npy')
+        self.user_factors = np.load(directory / 'user_factors.npy', mmap_mode='r')
+        self.item_factors = np.load(directory / 'item_factors.npy', mmap_mode='r')
+
+    def refresh(self):
+        """Switch to a newly trained model once its pointer is published"""
+        if self.store.read()[0] != self._pointer:
+            self.load()
+
+    @property
+    def is_trained(self):
+        return self.item_factors is not None
+
+    def _user_row(self, user_id):
+        # ids come out of np.unique, so they are sorted
+        position = np.searchsorted(self.user_ids, user_id)
+        if position < len(self.user_ids) and self.user_ids[position] == user_id:
+            return position
+        return None
+
+    def score(self, user_id, product_ids):
+        """Scores for candidate products; -inf for unknown products, None for unknown users"""
+        row = self._user_row(user_id) if self.is_trained else None
+        if row is None:
+            return None
+        product_ids = np.asarray(product_ids, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.item_ids, product_ids), len(self.item_ids) - 1)
+        known = self.item_ids[positions] == product_ids
+        scores = np.full(len(product_ids), -np.inf, dtype=np.float32)
+        scores[known] = np.asarray(self.item_factors[positions[known]]) @ np.asarray(self.user_factors[row])
+        return scores
+
+    def recommend(self, user_id, k=10, exclude=()):
+        """Top-k (product_id, score) pairs for a user over the whole catalogue"""
+        row = self._user_row(user_id) if self.is_trained else None
+        if row is None:
+            return []
+
+        scores = np.asarray(self.item_factors) @ np.asarray(self.user_factors[row])
+        if exclude:
+            excluded = np.isin(self.item_ids, np.asarray(list(exclude), dtype=np.int64))
+            scores[excluded] = -np.inf
+
+        k = min(k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [
+            (int(self.item_ids[i]), float(scores[i]))
+            for i in best if np.isfinite(scores[i])
+        ]
@@ -0,0 +1,81 @@
+import time
+import logging
+
+from django.db import transaction
+from django.utils import timezone
+
+from analytics.buffers import BufferedSink
+from .models import UserProductInteraction
+from .scoring import InteractionScoreStore
+
+logger = logging.getLogger(__name__)
+
+
+class InteractionBuffer(BufferedSink):
+    """Buffered interaction inserts, written with ``bulk_create`` off the request path.
+
+    Repeated events of a ``COALESCE_TYPES`` type for the same user and
+    product within ``COALESCE_WINDOW`` seconds are dropped. Each batch is
+    folded into InteractionScoreStore in the transaction that inserts it, so
+    a row is never committed without its score; every written batch is then
+    passed to the callables in ``flush_listeners``.
+
+    Backpressure: when ``MAX_PENDING`` events are queued, coalescable events
+    (views) are shed and counted, while everything else is flushed
+    synchronously by the caller.
+    """
+
+    THREAD_NAME = 'interaction-buffer'
+    COALESCE_WINDOW = 300
+    COALESCE_TYPES = ('view',)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.flush_listeners = []
+        self._last_seen = {}
+
+    def record(self, user_id, product_id, interaction_type, weight):
+        """Queue an interaction; returns False if it was coalesced or shed"""
+        if interaction_type in self.COALESCE_TYPES:
+            now = time.monotonic()
+            key = (user_id, product_id, interaction_type)
+            with self._lock:
+                last_seen = self._last_seen.get(key)
+                if last_seen is not None and now - last_seen < self.COALESCE_WINDOW:
+                    return False
+                if len(self._pending) >= self.max_pending:
+                    self.dropped += 1
+                    return False
+                self._last_seen[key] = now
+
+        return self.add(UserProductInteraction(
+            user_id=user_id,
+            product_id=product_id,
+            interaction_type=interaction_type,
+            weight=weight,
+            timestamp=timezone.now()
+        ), flush_when_full=True)
+
+    def write(self, batch):
+        with transaction.atomic():
+            UserProductInteraction.objects.bulk_create(batch)
+            InteractionScoreStore.apply(batch)
+
+    def after_write(self, batch):
+        for listener in self.flush_listeners:
+            try:
+                listener(batch)
+            except Exception as e:
+                logger.error(f"Error in interaction flush listener: {str(e)}", exc_info=True)
+
+    def flush(self):
+        written = super().flush()
+        self._prune_last_seen()
+        return written
+
+    def _prune_last_seen(self):
+        cutoff = time.monotonic() - self.COALESCE_WINDOW
+        with self._lock:
+            expired = [key for key, seen in self._last_seen.items() if seen < cutoff]
+            for key in expired:
+                del self._last_seen[key]
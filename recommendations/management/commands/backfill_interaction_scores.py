@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from recommendations.models import MiningWatermark
+from recommendations.scoring import InteractionScoreStore
+
+
+class Command(BaseCommand):
+    help = 'Build the decayed interaction scores from the raw interaction history (run once per deployment)'
+
+    def handle(self, *args, **options):
+        if MiningWatermark.objects.filter(name=InteractionScoreStore.WATERMARK).exists():
+            self.stdout.write(self.style.WARNING('Interaction scores were already backfilled'))
+            return
+
+        scores = InteractionScoreStore.backfill()
+        self.stdout.write(self.style.SUCCESS(f'Backfilled {scores} interaction scores'))
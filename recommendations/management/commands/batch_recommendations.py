@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recommendations.batch import BatchRecommender
+
+
+class Command(BaseCommand):
+    help = 'Score recommendations for all users in bulk (e.g. for email campaigns)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--strategy', choices=BatchRecommender.STRATEGIES, default='similarity')
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=10,
+            help='Products per user in --output files; --table stores the materialized list size'
+        )
+        parser.add_argument('--chunk-size', type=int, help='Users scored per task')
+        parser.add_argument('--workers', type=int, help='Worker processes (defaults to CPU count)')
+        parser.add_argument('--output', help='Write JSON lines {"user_id", "product_ids"} to this file')
+        parser.add_argument(
+            '--table',
+            action='store_true',
+            help='Write into the materialized UserRecommendation table'
+        )
+
+    def handle(self, *args, **options):
+        if bool(options.get('output')) == options['table']:
+            raise CommandError('Pass exactly one of --output or --table')
+
+        try:
+            recommender = BatchRecommender(
+                strategy=options['strategy'],
+                limit=options['limit'],
+                chunk_size=options.get('chunk_size'),
+                workers=options.get('workers'),
+            )
+            recommender.load()
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if options['table']:
+            recommender.write_table()
+        else:
+            recommender.write_jsonl(options['output'])
+
+        for key, value in recommender.stats.items():
+            self.stdout.write(f'{key}: {value}')
+        self.stdout.write(self.style.SUCCESS('Batch recommendations written'))
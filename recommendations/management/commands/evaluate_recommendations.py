@@ -0,0 +1,65 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recommendations.evaluation import RecommendationBenchmark, RecommendationEvaluator
+
+
+class Command(BaseCommand):
+    help = 'Evaluate recommendation quality on a time split and benchmark serving latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--k', type=int, default=RecommendationEvaluator.K)
+        parser.add_argument(
+            '--test-fraction',
+            type=float,
+            default=RecommendationEvaluator.TEST_FRACTION,
+            help='Share of the most recent interactions held out for testing'
+        )
+        parser.add_argument(
+            '--strategies',
+            nargs='+',
+            choices=RecommendationEvaluator.STRATEGIES,
+            default=list(RecommendationEvaluator.STRATEGIES)
+        )
+        parser.add_argument('--max-users', type=int, help='Evaluate a random sample of this many users')
+        parser.add_argument(
+            '--benchmark',
+            action='store_true',
+            help='Generate a synthetic dataset (rolled back afterwards), evaluate on it and measure latency'
+        )
+        parser.add_argument('--users', type=int, default=RecommendationBenchmark.USERS)
+        parser.add_argument('--products', type=int, default=RecommendationBenchmark.PRODUCTS)
+        parser.add_argument('--categories', type=int, default=RecommendationBenchmark.CATEGORIES)
+        parser.add_argument('--interactions', type=int, default=RecommendationBenchmark.INTERACTIONS)
+        parser.add_argument('--latency-samples', type=int, default=RecommendationBenchmark.LATENCY_SAMPLES)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        try:
+            if options['benchmark']:
+                report = RecommendationBenchmark(
+                    users=options['users'],
+                    products=options['products'],
+                    categories=options['categories'],
+                    interactions=options['interactions'],
+                    latency_samples=options['latency_samples'],
+                    seed=options['seed'],
+                ).run(
+                    evaluate=True,
+                    k=options['k'],
+                    test_fraction=options['test_fraction'],
+                    strategies=options['strategies'],
+                    max_users=options.get('max_users'),
+                )
+            else:
+                report = RecommendationEvaluator(
+                    k=options['k'],
+                    test_fraction=options['test_fraction'],
+                    strategies=options['strategies'],
+                    max_users=options.get('max_users'),
+                ).evaluate()
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(json.dumps(report, indent=2))
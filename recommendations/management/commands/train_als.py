@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from recommendations.factorization import ImplicitALSTrainer
+
+
+class Command(BaseCommand):
+    help = 'Train the implicit ALS recommendation model from user interactions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--factors', type=int)
+        parser.add_argument('--iterations', type=int)
+        parser.add_argument('--regularization', type=float)
+        parser.add_argument('--alpha', type=float)
+        parser.add_argument('--path', help='Model directory (defaults to RECOMMENDATION_ALS_MODEL_DIR)')
+
+    def handle(self, *args, **options):
+        stats = ImplicitALSTrainer(
+            factors=options.get('factors'),
+            iterations=options.get('iterations'),
+            regularization=options.get('regularization'),
+            alpha=options.get('alpha'),
+            path=options.get('path'),
+        ).train()
+
+        if not stats:
+            self.stdout.write(self.style.WARNING('No interactions to train on'))
+            return
+
+        for key, value in stats.items():
+            self.stdout.write(f'{key}: {value}')
+        self.stdout.write(self.style.SUCCESS('Model trained'))
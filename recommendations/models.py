@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 from products.models import Product
 
 class UserProductInteraction(models.Model):
@@ -15,7 +16,7 @@ class UserProductInteraction(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     interaction_type = models.CharField(max_length=20, choices=INTERACTION_TYPES)
     weight = models.FloatField(default=1.0)  # Different interactions have different weights
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now)  # Event time, kept when writes are buffered
     
     class Meta:
         ordering = ['-timestamp']
@@ -41,5 +42,58 @@ class UserPreferences(models.Model):
     favorite_categories = models.ManyToManyField('products.Category')
     price_range_min = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     price_range_max = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
-    preferred_brands = models.ManyToManyField('products.Brand')
+    last_updated = models.DateTimeField(auto_now=True)
+
+class UserRecommendation(models.Model):
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='materialized_recommendations'
+    )
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='materialized_recommendations')
+    rank = models.PositiveIntegerField()
+    computed_at = models.DateTimeField()
+    
+    class Meta:
+        unique_together = ('user', 'rank')
+        ordering = ['user', 'rank']
+
+class UserProductScore(models.Model):
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    score = models.FloatField()  # Forward-decayed: sum of weight * 2^((t - epoch) / half-life)
+    last_interaction = models.DateTimeField()
+    
+    class Meta:
+        unique_together = ('user', 'product')
+        indexes = [
+            models.Index(fields=['user', '-score']),
+        ]
+
+class CoPurchaseCount(models.Model):
+    # Upper triangle (product_a <= product_b); the diagonal holds per-product order counts
+    product_a = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='copurchases_as_a')
+    product_b = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='copurchases_as_b')
+    count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        unique_together = ('product_a', 'product_b')
+        indexes = [
+            models.Index(fields=['product_b']),
+        ]
+
+class FrequentlyBoughtTogether(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='bought_together')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='bought_together_as_related')
+    rank = models.PositiveSmallIntegerField()
+    confidence = models.FloatField()  # P(related | product)
+    lift = models.FloatField()
+    
+    class Meta:
+        unique_together = ('product', 'rank')
+
+class MiningWatermark(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+    last_id = models.BigIntegerField(default=0)  # Highest source row already processed
+    total = models.BigIntegerField(default=0)  # Source rows counted so far
     last_updated = models.DateTimeField(auto_now=True)
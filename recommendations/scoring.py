@@ -0,0 +1,168 @@
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+import logging
+
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import MiningWatermark, UserProductInteraction, UserProductScore
+
+logger = logging.getLogger(__name__)
+
+
+class InteractionScoreStore:
+    """Per-(user, product) interaction scores with exponential time decay.
+
+    Scores use forward decay: an event of weight ``w`` at time ``t`` adds
+    ``w * 2 ** ((t - EPOCH) / HALF_LIFE)``. Every row shares the same reference
+    point, so new events are plain additions (no read-modify-write), and
+    ordering by the stored value is the same as ordering by the decayed score
+    at any moment. ``decayed`` converts a stored value back to "now" units.
+
+    Raw interactions older than ``RETENTION_DAYS`` are deleted by
+    ``compact``, but only up to the ``WATERMARK`` row: ``backfill`` records
+    the last row of the history it folded in, and ``apply`` moves it forward
+    as new rows are folded. Every write path calls ``apply`` in the
+    transaction that inserts the rows, so no committed row below the
+    watermark is missing from the scores. Without a backfill nothing is
+    compacted, since older rows may never have reached the scores.
+    """
+
+    EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+    HALF_LIFE_DAYS = 30
+    RETENTION_DAYS = 180
+    COMPACT_BATCH_SIZE = 10000
+    WATERMARK = 'interaction-scores'
+
+    @classmethod
+    def forward_weight(cls, weight, timestamp):
+        age = (timestamp - cls.EPOCH).total_seconds() / (cls.HALF_LIFE_DAYS * 86400)
+        return weight * 2.0 ** age
+
+    @classmethod
+    def decayed(cls, score, now=None):
+        """Convert a stored score into its decayed value at ``now``"""
+        return score / cls.forward_weight(1.0, now or timezone.now())
+
+    @classmethod
+    def apply(cls, interactions):
+        """Fold a batch of interactions into the score table with one upsert"""
+        increments = defaultdict(float)
+        latest = {}
+        for interaction in interactions:
+            key = (interaction.user_id, interaction.product_id)
+            timestamp = interaction.timestamp or timezone.now()
+            increments[key] += cls.forward_weight(interaction.weight, timestamp)
+            if key not in latest or timestamp > latest[key]:
+                latest[key] = timestamp
+
+        if not increments:
+            return 0
+
+        table = connection.ops.quote_name(UserProductScore._meta.db_table)
+        # ON CONFLICT ... DO UPDATE is supported by both PostgreSQL and SQLite
+        sql = (
+            f"INSERT INTO {table} (user_id, product_id, score, last_interaction) "
+            f"VALUES (%s, %s, %s, %s) "
+            f"ON CONFLICT (user_id, product_id) DO UPDATE SET "
+            f"score = {table}.score + excluded.score, "
+            f"last_interaction = CASE WHEN excluded.last_interaction > {table}.last_interaction "
+            f"THEN excluded.last_interaction ELSE {table}.last_interaction END"
+        )
+        params = [
+            (
+                user_id,
+                product_id,
+                increment,
+                connection.ops.adapt_datetimefield_value(latest[(user_id, product_id)])
+            )
+            for (user_id, product_id), increment in increments.items()
+        ]
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(sql, params)
+            cls._advance_watermark(interactions)
+        return len(params)
+
+    @classmethod
+    def _advance_watermark(cls, interactions):
+        # A no-op until backfill has created the watermark
+        last_id = max((interaction.id for interaction in interactions if interaction.id), default=None)
+        if last_id is not None:
+            MiningWatermark.objects.filter(name=cls.WATERMARK, last_id__lt=last_id).update(last_id=last_id)
+
+    @classmethod
+    def top_products(cls, user, limit=5):
+        """Product ids with the highest decayed score for a user"""
+        return list(
+            UserProductScore.objects.filter(
+                user=user
+            ).order_by('-score').values_list('product_id', flat=True)[:limit]
+        )
+
+    @classmethod
+    def compact(cls, retention_days=None):
+        """Delete raw interactions older than the retention window that the scores already hold"""
+        watermark = MiningWatermark.objects.filter(name=cls.WATERMARK).first()
+        if watermark is None:
+            logger.warning("Interaction scores were never backfilled; refusing to compact")
+            return 0
+
+        cutoff = timezone.now() - timedelta(days=retention_days or cls.RETENTION_DAYS)
+        deleted = 0
+        while True:
+            ids = list(
+                UserProductInteraction.objects.filter(
+                    timestamp__lt=cutoff,
+                    id__lte=watermark.last_id
+                ).values_list('id', flat=True)[:cls.COMPACT_BATCH_SIZE]
+            )
+            if not ids:
+                break
+            UserProductInteraction.objects.filter(id__in=ids).delete()
+            deleted += len(ids)
+
+        logger.info(f"Compacted {deleted} interactions older than {cutoff}")
+        return deleted
+
+    @classmethod
+    def backfill(cls):
+        """Rebuild the scores from the raw history and record the watermark.
+
+        Meant to run once per deployment (``manage.py
+        backfill_interaction_scores``). Interactions written since the
+        scoring code went live were already folded in, so the score table is
+        cleared and rebuilt from every raw row while interaction inserts are
+        held off by a table lock; they wait until the rebuild commits. Once a
+        watermark exists ``compact`` may have removed raw rows, so a second
+        backfill is refused.
+        """
+        if MiningWatermark.objects.filter(name=cls.WATERMARK).exists():
+            logger.warning("Interaction scores were already backfilled; refusing to rebuild them")
+            return 0
+
+        applied = 0
+        folded = 0
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                table = connection.ops.quote_name(UserProductInteraction._meta.db_table)
+                with connection.cursor() as cursor:
+                    cursor.execute(f"LOCK TABLE {table} IN SHARE MODE")
+            # On SQLite the first write takes the database write lock
+            UserProductScore.objects.all().delete()
+
+            last_id = UserProductInteraction.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+            batch = []
+            for interaction in UserProductInteraction.objects.filter(id__lte=last_id).order_by('id').iterator():
+                batch.append(interaction)
+                if len(batch) >= cls.COMPACT_BATCH_SIZE:
+                    applied += cls.apply(batch)
+                    folded += len(batch)
+                    batch = []
+            if batch:
+                applied += cls.apply(batch)
+                folded += len(batch)
+
+            MiningWatermark.objects.create(name=cls.WATERMARK, last_id=last_id, total=folded)
+        logger.info(f"Backfilled interaction scores from {folded} interactions")
+        return applied
@@ -0,0 +1,123 @@
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SegmentStore:
+    """Immutable snapshot directories switched by one ``CURRENT`` pointer.
+
+    ``CURRENT`` is a small JSON document naming the live segment directory
+    and the delta logs to replay on top of it, oldest first; writers append
+    to the last one. Readers load whatever ``CURRENT`` names, so files of
+    different builds are never mixed, and reload when its contents change.
+
+    A rebuild first rotates to a fresh delta log (``rotate``), then writes
+    its segment and publishes it (``publish``) together with the log that
+    was live when it started and every later one. That log is replayed from
+    where it ended at the rotation (``offsets`` in ``CURRENT``): records a
+    slow writer still appends to it are kept, while those the build already
+    saw are not replayed twice. Logs and segments the new pointer no longer
+    needs are deleted; open memory maps of them stay valid.
+    """
+
+    POINTER = 'CURRENT'
+
+    def __init__(self, path, initial_delta='delta.log'):
+        self.path = Path(path)
+        self.initial_delta = initial_delta
+
+    @staticmethod
+    def _name(prefix):
+        # Sortable by creation time, unique across processes
+        return f'{prefix}-{time.time_ns():020d}-{os.getpid()}'
+
+    def read(self):
+        """``(raw, pointer)`` of the live ``CURRENT``; ``raw`` is None before the first write"""
+        try:
+            raw = (self.path / self.POINTER).read_text()
+        except FileNotFoundError:
+            return None, {'segment': None, 'deltas': [self.initial_delta]}
+        return raw, json.loads(raw)
+
+    def _write(self, pointer):
+        tmp_path = self.path / f'{self.POINTER}.{os.getpid()}.tmp'
+        tmp_path.write_text(json.dumps(pointer))
+        os.replace(tmp_path, self.path / self.POINTER)
+
+    def segment_path(self, pointer):
+        return self.path / pointer['segment'] if pointer.get('segment') else None
+
+    def new_segment(self):
+        """Create an empty directory for a snapshot that is not yet published"""
+        self.path.mkdir(parents=True, exist_ok=True)
+        directory = self.path / self._name('segment')
+        directory.mkdir()
+        return directory
+
+    def rotate(self):
+        """Start a fresh delta log; returns ``(name, size)`` of the one it replaces"""
+        self.path.mkdir(parents=True, exist_ok=True)
+        _, pointer = self.read()
+        previous = pointer['deltas'][-1]
+        # Measured before the switch: anything appended later is replayed
+        size = self.delta_size(previous)
+        pointer['deltas'].append(f"{self._name('delta')}{Path(self.initial_delta).suffix}")
+        self._write(pointer)
+        return previous, size
+
+    def publish(self, directory, since=None):
+        """Make ``directory`` live, replaying the delta logs from ``since`` (a ``rotate`` result) on"""
+        _, pointer = self.read()
+        deltas = pointer['deltas']
+        offsets = {}
+        if since is None:
+            keep = []
+        elif since[0] in deltas:
+            keep = deltas[deltas.index(since[0]):]
+            offsets[since[0]] = since[1]
+        else:
+            keep = deltas
+        self._write({'segment': directory.name, 'deltas': keep, 'offsets': offsets})
+
+        for name in deltas:
+            if name not in keep:
+                (self.path / name).unlink(missing_ok=True)
+        # Only older segments: a newer one may belong to a build still running
+        for old in self.path.glob('segment-*'):
+            if old.name < directory.name:
+                shutil.rmtree(old, ignore_errors=True)
+
+    def append(self, data):
+        """Append ``data`` to the live delta log in one O_APPEND write"""
+        self.path.mkdir(parents=True, exist_ok=True)
+        _, pointer = self.read()
+        with open(self.path / pointer['deltas'][-1], 'ab') as delta:
+            delta.write(data)
+
+    def delta_size(self, name):
+        try:
+            return (self.path / name).stat().st_size
+        except FileNotFoundError:
+            return 0
+
+    def pending_bytes(self, pointer):
+        """Bytes written to the delta logs since the live segment was built"""
+        offsets = pointer.get('offsets', {})
+        return sum(
+            max(self.delta_size(name) - offsets.get(name, 0), 0)
+            for name in pointer['deltas']
+        )
+
+    def read_delta(self, name, offset):
+        """Bytes of delta log ``name`` from ``offset`` on, empty if it does not exist"""
+        try:
+            with open(self.path / name, 'rb') as delta:
+                delta.seek(offset)
+                return delta.read()
+        except FileNotFoundError:
+            return b''
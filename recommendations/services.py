@@ -1,12 +1,22 @@
 from django.db.models import Sum, Count, F, Q
 from django.utils import timezone
 from datetime import timedelta
+from django.db import connection, transaction
+from django.conf import settings
 from django.core.cache import cache
-import numpy as np
-from scipy.sparse import csr_matrix
-from sklearn.metrics.pairwise import cosine_similarity
 
-from .models import UserProductInteraction, ProductSimilarity, UserPreferences
+from .models import (
+    UserProductInteraction,
+    ProductSimilarity,
+    UserPreferences,
+    UserRecommendation,
+    UserProductScore
+)
+from .similarity import ItemItemSimilarityBuilder
+from .ann import ProductVectorIndex
+from .ingestion import InteractionBuffer
+from .factorization import ALSModel
+from .scoring import InteractionScoreStore
 from products.models import Product
 
 class RecommendationService:
@@ -17,136 +27,340 @@ class RecommendationService:
         'wishlist': 1.5,
         'review': 2.5,
     }
+    SIMILARITY_TOP_K = 20  # Neighbours stored per product
+    MATERIALIZED_LIMIT = 50  # Recommendations stored per user
+    ACTIVE_USER_DAYS = 90  # Users refreshed by the nightly job
+    REFRESH_DEBOUNCE = 60  # Seconds between queued refreshes of one user
+    POPULAR_CACHE_TTL = 300  # Seconds the popular fallback list is shared between users
+    STRATEGIES = ('similarity', 'als')
     
     @classmethod
-    def record_interaction(cls, user, product, interaction_type):
-        """Record a user's interaction with a product"""
+    def record_interaction(cls, user, product, interaction_type, buffered=True):
+        """Record a user's interaction with a product.
+        
+        By default the event is queued on the per-process InteractionBuffer
+        and written in batches; pass ``buffered=False`` to insert immediately.
+        """
         weight = cls.INTERACTION_WEIGHTS.get(interaction_type, 1.0)
-        UserProductInteraction.objects.create(
-            user=user,
-            product=product,
-            interaction_type=interaction_type,
-            weight=weight
-        )
+        if buffered:
+            return InteractionBuffer.get_instance().record(
+                user.id, product.id, interaction_type, weight
+            )
+        
+        # The post_save handler folds the row into the scores in the same transaction
+        with transaction.atomic():
+            UserProductInteraction.objects.create(
+                user=user,
+                product=product,
+                interaction_type=interaction_type,
+                weight=weight
+            )
+        return True
     
     @classmethod
     def get_personalized_recommendations(cls, user, limit=10):
-        """Get personalized product recommendations for a user"""
-        cache_key = f'user_recommendations_{user.id}'
-        recommendations = cache.get(cache_key)
+        """Get personalized product recommendations for a user.
         
-        if recommendations is None:
-            # Get user's interaction history
-            interactions = UserProductInteraction.objects.filter(
-                user=user
-            ).values('product').annotate(
-                total_weight=Sum('weight')
-            ).order_by('-total_weight')
-            
-            # Get similar products
-            product_ids = [i['product'] for i in interactions[:5]]
-            similar_products = ProductSimilarity.objects.filter(
-                product_a__in=product_ids
-            ).select_related('product_b').order_by('-similarity_score')
-            
-            # Get user preferences
-            preferences = UserPreferences.objects.filter(user=user).first()
-            
-            # Build recommendations considering both similarity and preferences
-            recommendations = cls._build_recommendations(
-                similar_products, preferences, limit
-            )
-            
-            # Cache the results
-            cache.set(cache_key, recommendations, 3600)  # Cache for 1 hour
+        Served from the materialized UserRecommendation rows in one indexed
+        read. Users without rows are materialized on first request.
+        """
+        recommendations = list(
+            Product.objects.filter(
+                materialized_recommendations__user=user
+            ).order_by('materialized_recommendations__rank')[:limit]
+        )
+        
+        if not recommendations:
+            recommendations = cls.materialize_recommendations(user)[:limit]
         
         return recommendations
     
     @classmethod
-    def update_product_similarities(cls):
-        """Update product similarity scores"""
-        # Get all products and their features
-        products = Product.objects.all()
+    def materialize_recommendations(cls, user):
+        """Recompute a user's recommendations and replace the stored rows"""
+        recommendations = cls._compute_recommendations(user, cls.MATERIALIZED_LIMIT)
+        computed_at = timezone.now()
         
-        # Create feature matrix
-        features = cls._create_feature_matrix(products)
+        with transaction.atomic():
+            UserRecommendation.objects.filter(user=user).delete()
+            UserRecommendation.objects.bulk_create([
+                UserRecommendation(
+                    user=user,
+                    product=product,
+                    rank=rank,
+                    computed_at=computed_at
+                )
+                for rank, product in enumerate(recommendations)
+            ])
         
-        # Calculate similarities
-        similarities = cosine_similarity(features)
+        return recommendations
+    
+    @classmethod
+    def _compute_recommendations(cls, user, limit, strategy=None):
+        """Build a user's recommendation list with the configured strategy"""
+        strategy = strategy or getattr(settings, 'RECOMMENDATION_STRATEGY', 'similarity')
+        if strategy == 'als':
+            recommendations = cls._compute_als_recommendations(user, limit)
+            if recommendations is not None:
+                return recommendations
+        
+        return cls._compute_similarity_recommendations(user, limit)
+    
+    @classmethod
+    def _compute_als_recommendations(cls, user, limit):
+        """Rank the catalogue with the implicit ALS factors; None if the user is unknown"""
+        model = ALSModel.get_instance()
+        if not model.is_trained:
+            return None
+        
+        interacted = set(
+            UserProductScore.objects.filter(
+                user=user
+            ).values_list('product_id', flat=True)
+        )
+        ranked = model.recommend(user.id, k=limit * 3, exclude=interacted)
+        if not ranked:
+            return None
+        
+        products = Product.objects.in_bulk([product_id for product_id, _ in ranked])
+        preferences = UserPreferences.objects.filter(user=user).first()
+        return cls._build_recommendations(
+            (products[product_id] for product_id, _ in ranked if product_id in products),
+            preferences,
+            limit
+        )
+    
+    @classmethod
+    def _compute_similarity_recommendations(cls, user, limit):
+        """Build a user's recommendation list from interactions and similarities"""
+        # Get the user's highest time-decayed interaction scores
+        product_ids = InteractionScoreStore.top_products(user, limit=5)
+        
+        # Get similar products
+        similar_products = ProductSimilarity.objects.filter(
+            product_a__in=product_ids
+        ).select_related('product_b').order_by('-similarity_score')
+        
+        # Get user preferences
+        preferences = UserPreferences.objects.filter(user=user).first()
+        
+        # Build recommendations considering both similarity and preferences
+        return cls._build_recommendations(
+            (similarity.product_b for similarity in similar_products),
+            preferences,
+            limit
+        )
+    
+    @staticmethod
+    def get_similar_products(product, limit=10):
+        """Get products similar to ``product`` from the vector index"""
+        neighbors = ProductVectorIndex.get_instance().similar_to(product, k=limit)
+        products = Product.objects.in_bulk([product_id for product_id, _ in neighbors])
+        return [products[product_id] for product_id, _ in neighbors if product_id in products]
+
+    @staticmethod
+    def get_bought_together(product, limit=4):
+        """Products frequently bought with ``product``, from the mined table"""
+        return list(
+            Product.objects.filter(
+                bought_together_as_related__product=product,
+                available=True
+            ).order_by('bought_together_as_related__rank')[:limit]
+        )
+
+    @staticmethod
+    def get_bought_together_for_cart(product_ids, limit=4):
+        """Products frequently bought with any of ``product_ids``.
+
+        Candidates are ranked by their summed confidence across the cart
+        items; products already in the cart are left out.
+        """
+        product_ids = list(product_ids)
+        if not product_ids:
+            return []
+
+        return list(
+            Product.objects.filter(
+                bought_together_as_related__product_id__in=product_ids,
+                available=True
+            ).exclude(
+                id__in=product_ids
+            ).annotate(
+                cart_confidence=Sum('bought_together_as_related__confidence')
+            ).order_by('-cart_confidence')[:limit]
+        )
+
+    @classmethod
+    def update_product_similarities(cls, top_k=None, interactions=None):
+        """Refresh the top-k item-item neighbours of every product.
+        
+        ``interactions`` limits the build to part of the log; only the
+        products found in it then have their lists replaced.
+        """
+        builder = ItemItemSimilarityBuilder(top_k=top_k or cls.SIMILARITY_TOP_K)
+        refresh_started = timezone.now()
+        matrix, item_ids = builder.load_matrix(interactions)
         
-        # Update database
         batch_size = 1000
-        similarity_objects = []
-        
-        for i in range(len(products)):
-            for j in range(i + 1, len(products)):
-                if similarities[i][j] > 0.1:  # Only store significant similarities
-                    similarity_objects.append(
-                        ProductSimilarity(
-                            product_a=products[i],
-                            product_b=products[j],
-                            similarity_score=float(similarities[i][j])
-                        )
-                    )
-                
-                if len(similarity_objects) >= batch_size:
-                    ProductSimilarity.objects.bulk_create(
-                        similarity_objects,
-                        ignore_conflicts=True
-                    )
-                    similarity_objects = []
-        
-        if similarity_objects:
-            ProductSimilarity.objects.bulk_create(
-                similarity_objects,
-                ignore_conflicts=True
-            )
+        batch = {}
+        pending = 0
+        
+        for product_id, neighbors in builder.build(matrix, item_ids):
+            batch[product_id] = neighbors
+            pending += len(neighbors)
+            
+            if pending >= batch_size:
+                cls.store_product_neighbors(batch)
+                batch = {}
+                pending = 0
+        
+        if batch:
+            cls.store_product_neighbors(batch)
+        
+        # Products that no longer have any neighbour above the threshold
+        stale = ProductSimilarity.objects.filter(last_updated__lt=refresh_started)
+        if interactions is not None:
+            stale = stale.filter(product_a_id__in=item_ids.tolist())
+        stale.delete()
+    
+    @staticmethod
+    def store_product_neighbors(neighbors_by_product):
+        """Replace the stored neighbour lists of the given products.
+        
+        Scores are upserted and pairs that are no longer in a product's list
+        are removed in the same transaction, so readers never see a partial
+        list and the table holds at most top-k rows per product.
+        """
+        refreshed_at = timezone.now()
+        table = connection.ops.quote_name(ProductSimilarity._meta.db_table)
+        # ON CONFLICT ... DO UPDATE is supported by both PostgreSQL and SQLite
+        sql = (
+            f"INSERT INTO {table} (product_a_id, product_b_id, similarity_score, last_updated) "
+            f"VALUES (%s, %s, %s, %s) "
+            f"ON CONFLICT (product_a_id, product_b_id) DO UPDATE SET "
+            f"similarity_score = excluded.similarity_score, last_updated = excluded.last_updated"
+        )
+        timestamp = connection.ops.adapt_datetimefield_value(refreshed_at)
+        params = [
+            (product_id, neighbor_id, float(score), timestamp)
+            for product_id, neighbors in neighbors_by_product.items()
+            for neighbor_id, score in neighbors
+        ]
+        
+        with transaction.atomic():
+            if params:
+                with connection.cursor() as cursor:
+                    cursor.executemany(sql, params)
+            ProductSimilarity.objects.filter(
+                product_a_id__in=list(neighbors_by_product),
+                last_updated__lt=refreshed_at
+            ).delete()
+    
+    @staticmethod
+    def _load_preference_filter(preferences):
+        """Fetch a user's preference sets once so candidates are checked in memory"""
+        if not preferences:
+            return None
+        
+        return {
+            'category_ids': set(preferences.favorite_categories.values_list('id', flat=True)),
+            'price_min': preferences.price_range_min,
+            'price_max': preferences.price_range_max,
+        }
     
     @staticmethod
-    def _create_feature_matrix(products):
-        """Create a feature matrix for products"""
-        # Example features: category, price range, tags, etc.
-        features = []
-        for product in products:
-            product_features = [
-                product.category_id,
-                float(product.price),
-                product.brand_id if hasattr(product, 'brand_id') else 0,
-            ]
-            # Add tag features
-            tags = product.tags.values_list('id', flat=True)
-            product_features.extend(tags)
-            features.append(product_features)
-        
-        return csr_matrix(features)
+    def _load_preference_filters(user_ids):
+        """Preference filters of many users, keyed by user id, in two queries"""
+        filters = {
+            user_id: {'category_ids': set(), 'price_min': price_min, 'price_max': price_max}
+            for user_id, price_min, price_max in UserPreferences.objects.filter(
+                user_id__in=user_ids
+            ).values_list('user_id', 'price_range_min', 'price_range_max')
+        }
+        if filters:
+            for user_id, category_id in UserPreferences.favorite_categories.through.objects.filter(
+                userpreferences__user_id__in=list(filters)
+            ).values_list('userpreferences__user_id', 'category_id'):
+                filters[user_id]['category_ids'].add(category_id)
+        return filters
     
     @staticmethod
-    def _build_recommendations(similar_products, preferences, limit):
-        """Build final recommendations considering user preferences"""
+    def _matches_preferences(product, preference_filter):
+        if not product.available:
+            return False
+        if not preference_filter:
+            return True
+        
+        if preference_filter['price_max'] is not None and product.price > preference_filter['price_max']:
+            return False
+        if preference_filter['price_min'] is not None and product.price < preference_filter['price_min']:
+            return False
+        if preference_filter['category_ids'] and product.category_id not in preference_filter['category_ids']:
+            return False
+        return True
+    
+    @staticmethod
+    def popular_cache_key(limit, days=30):
+        return f'recommendations:popular:{days}:{limit}'
+    
+    @classmethod
+    def _get_popular_products(cls, limit, days=30):
+        """Most interacted-with products over the last ``days`` days.
+        
+        Cached for ``POPULAR_CACHE_TTL`` seconds, so a refresh filling many
+        users' lists runs the aggregate once rather than once per user.
+        """
+        cache_key = cls.popular_cache_key(limit, days)
+        popular = cache.get(cache_key)
+        if popular is None:
+            since = timezone.now() - timedelta(days=days)
+            popular = list(
+                Product.objects.filter(
+                    available=True,
+                    userproductinteraction__timestamp__gte=since
+                ).annotate(
+                    popularity=Sum('userproductinteraction__weight')
+                ).order_by('-popularity')[:limit]
+            )
+            cache.set(cache_key, popular, cls.POPULAR_CACHE_TTL)
+        return popular
+    
+    @classmethod
+    def _build_recommendations(cls, candidates, preferences, limit):
+        """Build final recommendations considering user preferences.
+        
+        ``candidates`` is an iterable of products, best first. Preference sets
+        are fetched once and candidates are filtered in a single pass. Users
+        without preferences get unfiltered candidates, and popular products
+        fill any remaining slots.
+        """
+        return cls._filter_recommendations(candidates, cls._load_preference_filter(preferences), limit)
+    
+    @classmethod
+    def _filter_recommendations(cls, candidates, preference_filter, limit):
+        """``_build_recommendations`` for a preference filter that is already loaded"""
         recommendations = []
         seen_products = set()
         
-        for similarity in similar_products:
-            product = similarity.product_b
-            
-            # Skip if we've seen this product or if it doesn't match preferences
-            if product.id in seen_products or not preferences:
+        for product in candidates:
+            if product.id in seen_products:
                 continue
+            seen_products.add(product.id)
             
-            # Apply preference filters
-            if preferences:
-                if preferences.price_range_max and product.price > preferences.price_range_max:
-                    continue
-                if preferences.price_range_min and product.price < preferences.price_range_min:
-                    continue
-                if preferences.favorite_categories.exists() and \
-                   product.category not in preferences.favorite_categories.all():
-                    continue
-            
-            recommendations.append(product)
+            if cls._matches_preferences(product, preference_filter):
+                recommendations.append(product)
+                if len(recommendations) >= limit:
+                    return recommendations
+        
+        # Fall back to popular items for the remaining slots
+        for product in cls._get_popular_products(limit * 3):
+            if product.id in seen_products:
+                continue
             seen_products.add(product.id)
             
-            if len(recommendations) >= limit:
-                break
+            if cls._matches_preferences(product, preference_filter):
+                recommendations.append(product)
+                if len(recommendations) >= limit:
+                    break
         
         return recommendations
@@ -0,0 +1,70 @@
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+import logging
+
+from products.models import Product
+from .ann import ProductVectorIndex
+from .ingestion import InteractionBuffer
+from .models import UserProductInteraction
+from .scoring import InteractionScoreStore
+
+logger = logging.getLogger(__name__)
+
+@receiver(post_save, sender=Product)
+def index_product_vector(sender, instance, **kwargs):
+    """Insert new or edited products into the vector index"""
+    try:
+        ProductVectorIndex.get_instance().add_product(instance)
+    except Exception as e:
+        logger.error(f"Error indexing product {instance.id}: {str(e)}", exc_info=True)
+
+@receiver(post_delete, sender=Product)
+def remove_product_vector(sender, instance, **kwargs):
+    try:
+        ProductVectorIndex.get_instance().remove(instance.id)
+    except Exception as e:
+        logger.error(f"Error removing product {instance.id} from index: {str(e)}", exc_info=True)
+
+def schedule_recommendation_refresh(user_ids):
+    """Queue a recommendation refresh, at most one per user per debounce window.
+    
+    The first interaction of a user claims a cache key for
+    ``REFRESH_DEBOUNCE`` seconds and schedules the refresh for the end of
+    that window, so it also covers everything the user does in between.
+    """
+    from .services import RecommendationService
+    from .tasks import refresh_user_recommendations
+    
+    debounce = RecommendationService.REFRESH_DEBOUNCE
+    keys = {user_id: f'recommendations:refresh:{user_id}' for user_id in user_ids}
+    due = [user_id for user_id, key in keys.items() if cache.add(key, True, debounce)]
+    if not due:
+        return []
+    
+    try:
+        refresh_user_recommendations.apply_async((due,), countdown=debounce)
+    except Exception as e:
+        # Release the keys so the next interaction tries again
+        cache.delete_many([keys[user_id] for user_id in due])
+        logger.error(f"Error queueing recommendation refresh for {len(due)} users: {str(e)}", exc_info=True)
+        return []
+    return due
+
+def refresh_recommendations_for_batch(interactions):
+    """Recompute recommendations of users whose interactions were just written"""
+    schedule_recommendation_refresh(sorted({interaction.user_id for interaction in interactions}))
+
+InteractionBuffer.get_instance().flush_listeners.append(refresh_recommendations_for_batch)
+
+@receiver(post_save, sender=UserProductInteraction)
+def refresh_recommendations_for_interaction(sender, instance, created, **kwargs):
+    """Fold a saved interaction into the scores.
+    
+    Runs inside the caller's transaction when there is one (as in
+    ``record_interaction``), so a failure rolls back the row too. Buffered
+    batches are folded by InteractionBuffer itself.
+    """
+    if created:
+        InteractionScoreStore.apply([instance])
+        refresh_recommendations_for_batch([instance])
@@ -0,0 +1,100 @@
+import numpy as np
+from scipy.sparse import csr_matrix, diags
+from django.db.models import Sum
+
+from .models import UserProductInteraction
+
+
+def load_interaction_matrix(interactions=None):
+    """Aggregate interaction weights into a sparse user x item matrix.
+
+    Returns ``(matrix, user_ids, item_ids)`` where ``user_ids[row]`` and
+    ``item_ids[column]`` map matrix positions back to database ids.
+    """
+    if interactions is None:
+        interactions = UserProductInteraction.objects.all()
+
+    rows = interactions.values('user_id', 'product_id').annotate(
+        total_weight=Sum('weight')
+    ).values_list('user_id', 'product_id', 'total_weight')
+
+    user_ids, product_ids, weights = [], [], []
+    for user_id, product_id, weight in rows.iterator():
+        user_ids.append(user_id)
+        product_ids.append(product_id)
+        weights.append(weight)
+
+    if not weights:
+        empty = np.array([], dtype=np.int64)
+        return csr_matrix((0, 0), dtype=np.float32), empty, empty
+
+    unique_users, user_index = np.unique(np.asarray(user_ids), return_inverse=True)
+    unique_items, item_index = np.unique(np.asarray(product_ids), return_inverse=True)
+    matrix = csr_matrix(
+        (np.asarray(weights, dtype=np.float32), (user_index, item_index)),
+        shape=(len(unique_users), len(unique_items))
+    )
+    return matrix, unique_users, unique_items
+
+
+class ItemItemSimilarityBuilder:
+    """Item-item collaborative filtering over interaction weights.
+
+    Builds a sparse user x item matrix from ``UserProductInteraction`` weights,
+    L2-normalises the item columns and computes cosine similarities one chunk
+    of items at a time (``X[:, chunk].T @ X``). Only the ``top_k`` best
+    neighbours of each item are kept, so peak memory is bounded by the chunk
+    size rather than by the square of the catalogue.
+    """
+
+    TOP_K = 50
+    CHUNK_SIZE = 256
+    MIN_SCORE = 0.1
+
+    def __init__(self, top_k=None, chunk_size=None, min_score=None):
+        self.top_k = top_k or self.TOP_K
+        self.chunk_size = chunk_size or self.CHUNK_SIZE
+        self.min_score = self.MIN_SCORE if min_score is None else min_score
+
+    def load_matrix(self, interactions=None):
+        """Return (user x item CSR matrix, product ids for each column)"""
+        matrix, _, item_ids = load_interaction_matrix(interactions)
+        return matrix, item_ids
+
+    def build(self, matrix=None, item_ids=None):
+        """Yield (product_id, [(neighbour_id, score), ...]) for every item"""
+        if matrix is None:
+            matrix, item_ids = self.load_matrix()
+        if matrix.shape[1] == 0:
+            return
+
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+        inverse_norms = np.divide(
+            1.0, norms, out=np.zeros_like(norms), where=norms > 0
+        ).astype(np.float32)
+        normalized = (matrix @ diags(inverse_norms)).tocsr()
+        item_vectors = normalized.T.tocsr()
+
+        for start in range(0, item_vectors.shape[0], self.chunk_size):
+            scores = (item_vectors[start:start + self.chunk_size] @ normalized).tocsr()
+
+            for offset in range(scores.shape[0]):
+                item = start + offset
+                row = slice(scores.indptr[offset], scores.indptr[offset + 1])
+                columns = scores.indices[row]
+                values = scores.data[row]
+
+                keep = (columns != item) & (values >= self.min_score)
+                columns, values = columns[keep], values[keep]
+                if not len(values):
+                    continue
+
+                if len(values) > self.top_k:
+                    best = np.argpartition(-values, self.top_k - 1)[:self.top_k]
+                    columns, values = columns[best], values[best]
+                order = np.argsort(-values)
+
+                yield int(item_ids[item]), [
+                    (int(item_ids[column]), float(value))
+                    for column, value in zip(columns[order], values[order])
+                ]
@@ -0,0 +1,55 @@
+from celery import shared_task
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from datetime import timedelta
+from .models import UserProductInteraction
+from .services import RecommendationService
+from .factorization import ImplicitALSTrainer
+from .scoring import InteractionScoreStore
+from .copurchase import CoPurchaseMiner
+from .ann import ProductVectorIndex
+
+@shared_task
+def refresh_all_user_recommendations():
+    """Nightly rebuild of materialized recommendations for active users"""
+    since = timezone.now() - timedelta(days=RecommendationService.ACTIVE_USER_DAYS)
+    user_ids = UserProductInteraction.objects.filter(
+        timestamp__gte=since
+    ).values_list('user_id', flat=True).distinct()
+    
+    batch = []
+    for user_id in user_ids.iterator():
+        batch.append(user_id)
+        if len(batch) >= 500:
+            refresh_user_recommendations.delay(batch)
+            batch = []
+    
+    if batch:
+        refresh_user_recommendations.delay(batch)
+
+@shared_task
+def refresh_user_recommendations(user_ids):
+    """Recompute materialized recommendations for the given users"""
+    for user in get_user_model().objects.filter(id__in=user_ids):
+        RecommendationService.materialize_recommendations(user)
+
+@shared_task
+def train_als_model():
+    """Retrain the implicit ALS factors; returns training time and memory stats"""
+    return ImplicitALSTrainer().train()
+
+@shared_task
+def compact_interactions():
+    """Drop raw interactions that are already folded into the decayed scores"""
+    return InteractionScoreStore.compact()
+
+@shared_task
+def mine_copurchases():
+    """Fold new orders into the co-purchase counts and refresh affected lists"""
+    return CoPurchaseMiner.update()
+
+@shared_task
+def compact_product_index():
+    """Fold the vector index delta log into a fresh snapshot once it grows too large"""
+    index = ProductVectorIndex.compact()
+    return len(index.ids) if index is not None else 0
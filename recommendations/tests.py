@@ -0,0 +1,652 @@
+import json
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+import numpy as np
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from scipy.sparse import csr_matrix
+
+from orders.models import Order, OrderItem
+from products.models import Category, Product
+from .ann import ProductEmbedder, ProductVectorIndex
+from .batch import BatchRecommender
+from .copurchase import CoPurchaseMiner
+from .evaluation import RecommendationBenchmark
+from .factorization import ALSModel, ImplicitALSTrainer
+from .ingestion import InteractionBuffer
+from .models import (
+    MiningWatermark,
+    ProductSimilarity,
+    UserPreferences,
+    UserProductInteraction,
+    UserProductScore,
+    UserRecommendation
+)
+from .scoring import InteractionScoreStore
+from .segments import SegmentStore
+from .services import RecommendationService
+from .similarity import ItemItemSimilarityBuilder
+
+
+@pytest.fixture(autouse=True)
+def local_cache(settings):
+    # Refresh debouncing and the popular list live in the cache
+    settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def refresh_task():
+    # New interactions enqueue a refresh; keep the broker out of the tests
+    with mock.patch('recommendations.tasks.refresh_user_recommendations') as task:
+        yield task
+
+
+@pytest.fixture
+def products(db):
+    shoes = Category.objects.create(name='Shoes', slug='shoes')
+    bags = Category.objects.create(name='Bags', slug='bags')
+    return {
+        'runner': Product.objects.create(category=shoes, name='Road Runner', slug='road-runner', price=90),
+        'trail': Product.objects.create(category=shoes, name='Trail Runner', slug='trail-runner', price=120),
+        'boot': Product.objects.create(category=shoes, name='Hiking Boot', slug='hiking-boot', price=150),
+        'backpack': Product.objects.create(category=bags, name='Day Backpack', slug='day-backpack', price=60),
+        'tote': Product.objects.create(category=bags, name='Canvas Tote', slug='canvas-tote', price=25),
+    }
+
+
+@pytest.fixture
+def users(db):
+    return [
+        get_user_model().objects.create_user(username=f'user{i}', email=f'user{i}@example.com')
+        for i in range(4)
+    ]
+
+
+def interact(user, *products, interaction_type='view', weight=1.0):
+    UserProductInteraction.objects.bulk_create([
+        UserProductInteraction(user=user, product=product, interaction_type=interaction_type, weight=weight)
+        for product in products
+    ])
+
+
+class TestItemItemSimilarityBuilder:
+    def test_cosine_of_item_columns(self):
+        # Items 10 and 20 are used by the same users; 30 by a different one
+        matrix = csr_matrix(np.array([
+            [1, 1, 0],
+            [2, 2, 0],
+            [0, 0, 3],
+        ], dtype=np.float32))
+        neighbors = dict(ItemItemSimilarityBuilder(chunk_size=2).build(matrix, np.array([10, 20, 30])))
+
+        assert [other for other, _ in neighbors[10]] == [20]
+        assert neighbors[10][0][1] == pytest.approx(1.0)
+        assert 30 not in neighbors
+
+    def test_keeps_top_k_above_min_score(self):
+        matrix = csr_matrix(np.array([
+            [5, 4, 1, 0],
+            [5, 3, 0, 1],
+            [5, 0, 0, 0],
+        ], dtype=np.float32))
+        builder = ItemItemSimilarityBuilder(top_k=2, min_score=0.2)
+        neighbors = dict(builder.build(matrix, np.array([1, 2, 3, 4])))
+
+        assert len(neighbors[1]) == 2
+        scores = [score for _, score in neighbors[1]]
+        assert scores == sorted(scores, reverse=True)
+        assert all(score >= 0.2 for _, score in neighbors[1])
+
+    @pytest.mark.django_db
+    def test_builds_from_interaction_weights(self, products, users):
+        for user in users[:3]:
+            interact(user, products['runner'], products['trail'])
+        interact(users[3], products['tote'])
+
+        neighbors = dict(ItemItemSimilarityBuilder().build())
+        assert [other for other, _ in neighbors[products['runner'].id]] == [products['trail'].id]
+        assert products['tote'].id not in neighbors
+
+
+@pytest.mark.django_db
+class TestProductNeighbors:
+    def neighbors(self, product):
+        return list(
+            ProductSimilarity.objects.filter(product_a=product).order_by('-similarity_score').values_list(
+                'product_b_id', 'similarity_score'
+            )
+        )
+
+    def test_store_replaces_the_neighbor_list(self, products):
+        runner, trail, boot, tote = products['runner'], products['trail'], products['boot'], products['tote']
+        RecommendationService.store_product_neighbors({runner.id: [(trail.id, 0.9), (boot.id, 0.5)]})
+        RecommendationService.store_product_neighbors({runner.id: [(boot.id, 0.8), (tote.id, 0.3)]})
+
+        assert self.neighbors(runner) == [(boot.id, 0.8), (tote.id, 0.3)]
+
+    def test_store_leaves_other_products_alone(self, products):
+        runner, trail, boot = products['runner'], products['trail'], products['boot']
+        RecommendationService.store_product_neighbors({trail.id: [(runner.id, 0.7)]})
+        RecommendationService.store_product_neighbors({runner.id: [(boot.id, 0.6)]})
+
+        assert self.neighbors(trail) == [(runner.id, 0.7)]
+
+    def test_update_keeps_top_k_and_drops_products_without_neighbors(self, products, users):
+        for user in users:
+            interact(user, products['runner'], products['trail'], products['boot'], products['backpack'])
+        RecommendationService.store_product_neighbors({products['tote'].id: [(products['runner'].id, 0.4)]})
+
+        RecommendationService.update_product_similarities(top_k=2)
+
+        for product in ('runner', 'trail', 'boot', 'backpack'):
+            assert len(self.neighbors(products[product])) == 2
+        assert self.neighbors(products['tote']) == []
+
+
+@pytest.mark.django_db
+class TestProductVectorIndex:
+    def test_index_lives_in_the_configured_dir(self, settings, products):
+        index = ProductVectorIndex.get_instance()
+        assert index.path == settings.RECOMMENDATION_ANN_INDEX_DIR
+        assert (index.path / 'delta.bin').exists()
+
+    def test_query_ranks_by_text_similarity(self, products):
+        index = ProductVectorIndex.build()
+        similar = [product_id for product_id, _ in index.similar_to(products['runner'], k=2)]
+
+        assert similar[0] == products['trail'].id
+        assert products['runner'].id not in similar
+
+    def test_lsh_candidates_match_exact_search(self):
+        vectors = np.random.default_rng(0).standard_normal((500, ProductEmbedder.DIMENSIONS)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        index = ProductVectorIndex()
+        index.EXACT_SEARCH_MAX = 0
+        index.ids = np.arange(500, dtype=np.int64)
+        index.vectors = vectors
+        index._id_order = np.arange(500)
+        index._build_tables()
+
+        # A slightly perturbed copy of a stored vector must find that vector first
+        query = vectors[42] + 0.05 * vectors[7]
+        assert index.query(query, k=1)[0][0] == 42
+
+    def test_delta_inserts_and_removals_are_seen_by_other_processes(self, products):
+        ProductVectorIndex.build()
+        reader = ProductVectorIndex()
+        reader.load()
+
+        jacket = Product.objects.create(
+            category=products['runner'].category, name='Runner Jacket', slug='runner-jacket', price=80
+        )
+        reader.refresh()
+        assert reader.get_vector(jacket.id) is not None
+
+        jacket_id = jacket.id
+        jacket.delete()
+        reader.refresh()
+        assert reader.get_vector(jacket_id) is None
+        assert jacket_id not in [product_id for product_id, _ in reader.similar_to(products['runner'])]
+
+    def test_compact_rebuilds_only_past_the_delta_cap(self, products):
+        store = ProductVectorIndex.get_instance().store
+        size = store.pending_bytes(store.read()[1])
+        assert size > 0
+
+        assert ProductVectorIndex.compact(max_delta_bytes=size) is None
+        assert store.pending_bytes(store.read()[1]) == size
+
+        index = ProductVectorIndex.compact(max_delta_bytes=size - 1)
+        assert sorted(index.ids) == sorted(product.id for product in products.values())
+        assert store.pending_bytes(store.read()[1]) == 0
+
+    def test_rebuild_switches_every_file_at_once(self, products):
+        ProductVectorIndex.build()
+        reader = ProductVectorIndex()
+        reader.load()
+        old_segment = reader.store.read()[1]['segment']
+
+        products['tote'].delete()
+        index = ProductVectorIndex.build()
+        assert [path.name for path in index.path.glob('segment-*')] == [index.store.read()[1]['segment']]
+        assert not (index.path / old_segment).exists()
+
+        reader.refresh()
+        assert len(reader.ids) == len(reader.vectors) == 4
+        assert products['runner'].id in [product_id for product_id, _ in reader.similar_to(products['trail'])]
+
+    def test_inserts_racing_a_rebuild_are_kept(self, products):
+        ProductVectorIndex.build()
+        embed = ProductEmbedder.embed
+        vector = np.ones(ProductEmbedder.DIMENSIONS, dtype=np.float32)
+
+        def insert_while_building(embedder, product):
+            if not ProductVectorIndex().get_vector(1001):
+                ProductVectorIndex().add(1001, vector)
+            return embed(embedder, product)
+
+        with mock.patch.object(ProductEmbedder, 'embed', insert_while_building):
+            index = ProductVectorIndex.build()
+        assert index.get_vector(1001) is not None
+
+        # A writer that read CURRENT before the switch appends to the rotated-out log
+        sealed = index.store.read()[1]['deltas'][0]
+        def append_to_sealed(data):
+            with open(index.path / sealed, 'ab') as delta:
+                delta.write(data)
+
+        with mock.patch.object(index.store, 'append', side_effect=append_to_sealed):
+            index.add(1002, vector)
+        reader = ProductVectorIndex()
+        reader.load()
+        assert reader.get_vector(1001) is not None
+        assert reader.get_vector(1002) is not None
+
+
+@pytest.mark.django_db
+class TestInteractionBuffer:
+    @pytest.fixture
+    def buffer(self):
+        # A long interval keeps the worker idle so the tests decide when to flush
+        buffer = InteractionBuffer(batch_size=1000, flush_interval=3600, max_pending=5)
+        yield buffer
+        buffer._pending.clear()
+        buffer.stop()
+
+    def test_flush_writes_in_bulk_and_notifies_listeners(self, buffer, products, users):
+        listener = mock.Mock()
+        buffer.flush_listeners.append(listener)
+        buffer.record(users[0].id, products['runner'].id, 'purchase', 3.0)
+        buffer.record(users[1].id, products['runner'].id, 'view', 1.0)
+        assert UserProductInteraction.objects.count() == 0
+
+        assert buffer.flush() == 2
+        assert UserProductInteraction.objects.count() == 2
+        [batch], _ = listener.call_args
+        assert {(row.user_id, row.interaction_type) for row in batch} == {
+            (users[0].id, 'purchase'), (users[1].id, 'view')
+        }
+
+    def test_repeated_views_are_coalesced(self, buffer, products, users):
+        assert buffer.record(users[0].id, products['runner'].id, 'view', 1.0)
+        assert not buffer.record(users[0].id, products['runner'].id, 'view', 1.0)
+        assert buffer.record(users[0].id, products['runner'].id, 'cart_add', 2.0)
+        assert buffer.record(users[0].id, products['runner'].id, 'cart_add', 2.0)
+        assert len(buffer._pending) == 3
+
+    def test_backpressure_sheds_views_and_flushes_the_rest(self, buffer, products, users):
+        # A writer that fell behind: the queue is already full
+        buffer._pending.extend(
+            UserProductInteraction(user_id=users[0].id, product_id=product.id, interaction_type='view')
+            for product in products.values()
+        )
+        assert not buffer.record(users[1].id, products['runner'].id, 'view', 1.0)
+        assert buffer.dropped == 1
+
+        # A purchase is never shed: the caller writes the backlog itself
+        assert buffer.record(users[1].id, products['runner'].id, 'purchase', 3.0)
+        assert len(buffer._pending) == 0
+        assert UserProductInteraction.objects.count() == 6
+
+    def test_rows_are_not_written_without_their_scores(self, buffer, products, users):
+        InteractionScoreStore.backfill()
+        watermark = MiningWatermark.objects.get(name=InteractionScoreStore.WATERMARK).last_id
+        buffer.record(users[0].id, products['runner'].id, 'purchase', 3.0)
+        buffer.record(users[1].id, products['trail'].id, 'purchase', 3.0)
+
+        with mock.patch.object(InteractionScoreStore, 'apply', side_effect=RuntimeError('deadlock')):
+            assert buffer.flush() == 0
+        assert buffer.failed == 2
+        assert not UserProductInteraction.objects.exists()
+        assert MiningWatermark.objects.get(name=InteractionScoreStore.WATERMARK).last_id == watermark
+
+    def test_flushed_rows_are_scored(self, buffer, products, users):
+        buffer.record(users[0].id, products['runner'].id, 'purchase', 3.0)
+        buffer.flush()
+        assert InteractionScoreStore.top_products(users[0]) == [products['runner'].id]
+
+    def test_failing_listener_does_not_lose_rows(self, buffer, products, users):
+        buffer.flush_listeners.append(mock.Mock(side_effect=RuntimeError('boom')))
+        buffer.record(users[0].id, products['runner'].id, 'purchase', 3.0)
+
+        assert buffer.flush() == 1
+        assert UserProductInteraction.objects.count() == 1
+
+
+@pytest.mark.django_db
+class TestMaterializedRecommendations:
+    def test_materialized_rows_are_served_without_recomputing(self, products, users):
+        ranked = [products['boot'], products['runner']]
+        with mock.patch.object(RecommendationService, '_compute_recommendations', return_value=ranked):
+            RecommendationService.materialize_recommendations(users[0])
+
+        assert list(
+            UserRecommendation.objects.filter(user=users[0]).values_list('product_id', 'rank')
+        ) == [(products['boot'].id, 0), (products['runner'].id, 1)]
+        with mock.patch.object(RecommendationService, '_compute_recommendations') as compute:
+            assert RecommendationService.get_personalized_recommendations(users[0]) == ranked
+            compute.assert_not_called()
+
+    def test_refreshes_are_debounced_per_user(self, refresh_task, products, users):
+        UserProductInteraction.objects.create(user=users[0], product=products['runner'], interaction_type='view')
+        UserProductInteraction.objects.create(user=users[0], product=products['trail'], interaction_type='view')
+        UserProductInteraction.objects.create(user=users[1], product=products['trail'], interaction_type='view')
+
+        assert refresh_task.apply_async.call_args_list == [
+            mock.call(([users[0].id],), countdown=RecommendationService.REFRESH_DEBOUNCE),
+            mock.call(([users[1].id],), countdown=RecommendationService.REFRESH_DEBOUNCE),
+        ]
+
+    def test_broker_errors_do_not_reach_the_request(self, refresh_task, products, users):
+        refresh_task.apply_async.side_effect = ConnectionError('broker down')
+        UserProductInteraction.objects.create(user=users[0], product=products['runner'], interaction_type='view')
+
+        # The debounce key was released, so the next interaction tries again
+        refresh_task.apply_async.side_effect = None
+        UserProductInteraction.objects.create(user=users[0], product=products['trail'], interaction_type='view')
+        assert refresh_task.apply_async.call_count == 2
+
+
+@pytest.mark.django_db
+class TestPreferenceFiltering:
+    @pytest.fixture
+    def preferences(self, products, users):
+        preferences = UserPreferences.objects.create(user=users[0], price_range_min=50, price_range_max=130)
+        preferences.favorite_categories.add(products['runner'].category)
+        return preferences
+
+    def test_candidates_outside_preferences_are_skipped(self, products, preferences):
+        products['trail'].available = False
+        products['trail'].save()
+        candidates = [products[name] for name in ('backpack', 'boot', 'trail', 'runner', 'runner')]
+
+        assert RecommendationService._build_recommendations(candidates, preferences, 5) == [products['runner']]
+
+    def test_popular_products_fill_under_filled_lists(self, products, users, preferences):
+        interact(users[1], products['tote'], interaction_type='purchase', weight=3.0)
+        interact(users[1], products['trail'], interaction_type='cart_add', weight=2.0)
+        interact(users[1], products['runner'])
+
+        recommendations = RecommendationService._build_recommendations([products['runner']], preferences, 3)
+        assert recommendations == [products['runner'], products['trail']]
+        assert RecommendationService._build_recommendations([], None, 2) == [products['tote'], products['trail']]
+
+    def test_popular_aggregate_runs_once_per_refresh(self, products, users):
+        interact(users[0], products['runner'])
+        with CaptureQueriesContext(connection) as queries:
+            for user in users:
+                RecommendationService._build_recommendations([], None, 5)
+
+        assert len([query for query in queries if 'SUM(' in query['sql'].upper()]) == 1
+
+
+@pytest.mark.django_db
+class TestImplicitALS:
+    @pytest.fixture
+    def trained(self, products, users):
+        for user in users[:3]:
+            interact(user, products['runner'], products['trail'])
+        interact(users[0], products['backpack'], products['tote'])
+        interact(users[3], products['runner'])
+        return ImplicitALSTrainer(factors=8, iterations=10).train()
+
+    def test_training_writes_factors_the_model_picks_up(self, trained):
+        assert trained['users'] == 4
+        assert trained['items'] == 4
+        model = ALSModel.get_instance()
+        assert model.is_trained
+        assert (model.store.segment_path(model.store.read()[1]) / 'item_factors.npy').exists()
+
+    def test_retraining_switches_every_file_at_once(self, products, users, trained):
+        model = ALSModel.get_instance()
+        old_segment = model.store.read()[1]['segment']
+        interact(users[3], products['boot'])
+
+        with mock.patch.object(SegmentStore, 'publish'):
+            ImplicitALSTrainer(factors=8, iterations=2).train()
+        # Nothing is visible until the new run is published
+        model.refresh()
+        assert len(model.item_ids) == 4
+
+        ImplicitALSTrainer(factors=8, iterations=2).train()
+        model.refresh()
+        assert len(model.item_ids) == len(model.item_factors) == 5
+        assert len(model.user_ids) == len(model.user_factors) == 4
+        assert not (model.path / old_segment).exists()
+
+    def test_recommends_items_of_similar_users(self, products, users, trained):
+        ranked = ALSModel.get_instance().recommend(users[3].id, k=3, exclude={products['runner'].id})
+
+        assert ranked[0][0] == products['trail'].id
+        assert products['runner'].id not in [product_id for product_id, _ in ranked]
+
+    def test_unknown_users_and_products(self, products, users, trained):
+        model = ALSModel.get_instance()
+        assert model.score(10 ** 9, [products['runner'].id]) is None
+        assert model.recommend(10 ** 9) == []
+        assert model.score(users[0].id, [products['boot'].id])[0] == -np.inf
+
+    def test_strategy_falls_back_to_similarity_until_trained(self, products, users):
+        interact(users[0], products['runner'])
+        with mock.patch.object(RecommendationService, '_compute_similarity_recommendations') as similarity:
+            RecommendationService._compute_recommendations(users[0], 5, strategy='als')
+            similarity.assert_called_once_with(users[0], 5)
+
+
+@pytest.mark.django_db
+class TestInteractionScores:
+    def old_interaction(self, user, product, days):
+        return UserProductInteraction.objects.create(
+            user=user, product=product, interaction_type='purchase', weight=3.0,
+            timestamp=timezone.now() - timedelta(days=days)
+        )
+
+    def test_scores_halve_every_half_life(self, products, users):
+        now = timezone.now()
+        InteractionScoreStore.apply([
+            UserProductInteraction(user=users[0], product=products['runner'], weight=2.0, timestamp=now),
+            UserProductInteraction(
+                user=users[0], product=products['trail'], weight=2.0,
+                timestamp=now - timedelta(days=InteractionScoreStore.HALF_LIFE_DAYS)
+            ),
+        ])
+        InteractionScoreStore.apply([
+            UserProductInteraction(user=users[0], product=products['runner'], weight=1.0, timestamp=now),
+        ])
+
+        scores = dict(UserProductScore.objects.filter(user=users[0]).values_list('product_id', 'score'))
+        assert InteractionScoreStore.decayed(scores[products['runner'].id], now) == pytest.approx(3.0)
+        assert InteractionScoreStore.decayed(scores[products['trail'].id], now) == pytest.approx(1.0)
+        assert InteractionScoreStore.top_products(users[0]) == [products['runner'].id, products['trail'].id]
+
+    def test_compact_refuses_without_a_backfill(self, products, users):
+        self.old_interaction(users[0], products['runner'], days=400)
+
+        assert InteractionScoreStore.compact() == 0
+        assert UserProductInteraction.objects.count() == 1
+
+    def test_compact_deletes_only_old_rows_the_scores_hold(self, products, users):
+        old = self.old_interaction(users[0], products['runner'], days=400)
+        recent = self.old_interaction(users[0], products['trail'], days=10)
+        UserProductScore.objects.all().delete()
+        InteractionScoreStore.backfill()
+
+        watermark = MiningWatermark.objects.get(name=InteractionScoreStore.WATERMARK)
+        assert watermark.last_id == recent.id
+
+        # Written after the backfill but never folded into the scores
+        unscored = UserProductInteraction(
+            user=users[1], product=products['boot'], interaction_type='view',
+            timestamp=timezone.now() - timedelta(days=400)
+        )
+        with mock.patch('recommendations.signals.InteractionScoreStore'):
+            unscored.save()
+
+        assert InteractionScoreStore.compact() == 1
+        assert not UserProductInteraction.objects.filter(id=old.id).exists()
+        assert set(UserProductInteraction.objects.values_list('id', flat=True)) == {recent.id, unscored.id}
+
+    def test_unbuffered_rows_are_written_with_their_scores(self, products, users):
+        with mock.patch.object(InteractionScoreStore, 'apply', side_effect=RuntimeError('deadlock')):
+            with pytest.raises(RuntimeError):
+                RecommendationService.record_interaction(users[0], products['runner'], 'purchase', buffered=False)
+        assert not UserProductInteraction.objects.exists()
+
+        RecommendationService.record_interaction(users[0], products['runner'], 'purchase', buffered=False)
+        assert InteractionScoreStore.top_products(users[0]) == [products['runner'].id]
+
+    def test_backfill_rebuilds_scores_folded_before_it_once(self, products, users):
+        # Rows written since deployment already reached the scores
+        self.old_interaction(users[0], products['runner'], days=0)
+        self.old_interaction(users[0], products['trail'], days=0)
+        call_command('backfill_interaction_scores', stdout=StringIO())
+
+        scores = dict(UserProductScore.objects.filter(user=users[0]).values_list('product_id', 'score'))
+        assert InteractionScoreStore.decayed(scores[products['runner'].id]) == pytest.approx(3.0)
+        assert MiningWatermark.objects.get(name=InteractionScoreStore.WATERMARK).total == 2
+
+        # A second run could drop compacted history, so it does nothing
+        assert InteractionScoreStore.backfill() == 0
+        assert UserProductScore.objects.count() == 2
+
+    def test_applied_rows_advance_the_watermark(self, products, users):
+        InteractionScoreStore.backfill()
+        interaction = self.old_interaction(users[0], products['runner'], days=1)
+
+        assert MiningWatermark.objects.get(name=InteractionScoreStore.WATERMARK).last_id == interaction.id
+
+
+@pytest.mark.django_db
+class TestBatchRecommender:
+    @pytest.fixture
+    def scored(self, products, users):
+        for user in users[:3]:
+            UserProductInteraction.objects.create(user=user, product=products['runner'], interaction_type='view')
+        RecommendationService.store_product_neighbors({
+            products['runner'].id: [(products['trail'].id, 0.9), (products['backpack'].id, 0.6)],
+        })
+        # users[3] has scores, but only for a product without neighbours
+        UserProductInteraction.objects.create(user=users[3], product=products['tote'], interaction_type='view')
+        return BatchRecommender(workers=1)
+
+    def test_scores_every_user_from_stored_neighbours(self, products, users, scored):
+        results = dict(scored.run())
+
+        assert results[users[0].id] == [products['trail'].id, products['backpack'].id]
+        assert results[users[3].id] == []
+
+    def test_write_jsonl_skips_users_without_products(self, tmp_path, users, scored):
+        path = tmp_path / 'recommendations.jsonl'
+        assert scored.write_jsonl(path) == 3
+        assert users[3].id not in [json.loads(line)['user_id'] for line in path.read_text().splitlines()]
+
+    def test_write_table_matches_materialized_lists(self, products, users, scored):
+        preferences = UserPreferences.objects.create(user=users[1])
+        preferences.favorite_categories.add(products['backpack'].category)
+        UserRecommendation.objects.create(user=users[2], product=products['boot'], rank=0, computed_at=timezone.now())
+
+        assert scored.write_table() == 4
+        for user in users[:3]:
+            with mock.patch.object(RecommendationService, '_compute_recommendations') as compute:
+                stored = RecommendationService.get_personalized_recommendations(user, limit=50)
+                compute.assert_not_called()
+            assert stored == RecommendationService._compute_similarity_recommendations(
+                user, RecommendationService.MATERIALIZED_LIMIT
+            )
+
+    def test_write_table_loads_preferences_once_per_batch(self, products, users, scored):
+        def queries():
+            with CaptureQueriesContext(connection) as context:
+                scored.write_table()
+            return len(context)
+
+        UserPreferences.objects.create(user=users[0]).favorite_categories.add(products['runner'].category)
+        queries()  # Caches the popular fallback
+        baseline = queries()
+        for user in users[1:]:
+            UserPreferences.objects.create(user=user).favorite_categories.add(products['backpack'].category)
+        assert queries() == baseline
+        assert list(
+            UserRecommendation.objects.filter(user=users[1]).order_by('rank').values_list('product_id', flat=True)
+        ) == [products['backpack'].id, products['tote'].id]
+
+    def test_write_table_clears_users_left_without_products(self, products, users, scored):
+        # Nothing in the catalogue is cheap enough, popular products included
+        UserPreferences.objects.create(user=users[3], price_range_max=1)
+        UserRecommendation.objects.create(user=users[3], product=products['boot'], rank=0, computed_at=timezone.now())
+
+        scored.write_table()
+        assert not UserRecommendation.objects.filter(user=users[3]).exists()
+
+
+@pytest.mark.django_db
+class TestCoPurchaseMiner:
+    def order(self, user, *products, age=3600, status='pending'):
+        order = Order.objects.create(user=user, shipping_address='Somewhere', total_amount=100, status=status)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, price=product.price) for product in products
+        ])
+        Order.objects.filter(id=order.id).update(created=timezone.now() - timedelta(seconds=age))
+        return order
+
+    def test_pairs_bought_together_more_than_chance_are_listed(self, products, users):
+        for user in users[:3]:
+            self.order(user, products['runner'], products['backpack'])
+        for user in users:
+            self.order(user, products['tote'])
+        self.order(users[3], products['runner'], products['tote'], status='cancelled')
+
+        assert CoPurchaseMiner.update() == 7
+        assert RecommendationService.get_bought_together(products['runner']) == [products['backpack']]
+        assert RecommendationService.get_bought_together(products['tote']) == []
+
+    def test_unsettled_orders_hold_back_the_watermark(self, products, users):
+        self.order(users[3], products['tote'])
+        first = self.order(users[0], products['runner'], products['backpack'])
+        unsettled = self.order(users[1], products['runner'], products['backpack'], age=0)
+        self.order(users[2], products['runner'], products['backpack'])
+
+        assert CoPurchaseMiner.update() == 2
+        assert MiningWatermark.objects.get(name=CoPurchaseMiner.WATERMARK).last_id == first.id
+
+        Order.objects.filter(id=unsettled.id).update(created=timezone.now() - timedelta(hours=1))
+        assert CoPurchaseMiner.update() == 2
+        assert RecommendationService.get_bought_together(products['runner']) == [products['backpack']]
+
+
+@pytest.mark.django_db
+class TestRecommendationBenchmark:
+    def test_benchmark_leaves_real_data_alone(self, products, users):
+        RecommendationService.store_product_neighbors({products['runner'].id: [(products['trail'].id, 0.9)]})
+        real = ProductSimilarity.objects.filter(product_a__in=products.values())
+        before = list(real.values_list('product_a_id', 'product_b_id', 'similarity_score'))
+
+        # Checked mid-run too: the final rollback would hide rewritten rows
+        during = []
+        measure_latency = RecommendationBenchmark.measure_latency
+
+        def checked_latency(benchmark):
+            during.extend(real.values_list('product_a_id', 'product_b_id', 'similarity_score'))
+            return measure_latency(benchmark)
+
+        with mock.patch.object(RecommendationBenchmark, 'measure_latency', checked_latency):
+            report = RecommendationBenchmark(
+                users=50, products=30, categories=3, interactions=1000, latency_samples=5
+            ).run()
+
+        assert report['dataset']['interactions'] == 1000
+        assert report['get_personalized_recommendations']['warm']['samples'] == 5
+        assert during == before
+        assert list(real.values_list('product_a_id', 'product_b_id', 'similarity_score')) == before
+        assert Product.objects.count() == len(products)
+        assert cache.get(RecommendationService.popular_cache_key(RecommendationService.MATERIALIZED_LIMIT * 3)) is None
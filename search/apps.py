@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+
+class SearchConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'search'
+    
+    def ready(self):
+        try:
+            import search.signals
+        except ImportError:
+            pass
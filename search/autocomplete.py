@@ -0,0 +1,267 @@
+import heapq
+import math
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+import logging
+
+from django.db import close_old_connections
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from analytics.buffers import normalize_query
+from analytics.models import SearchQueryCount
+from products.models import Category, Product
+from recommendations.models import UserProductInteraction
+
+logger = logging.getLogger(__name__)
+
+
+class AutocompleteIndex:
+    """Per-process prefix index over product names, categories and popular searches.
+
+    Normalized keys are kept in one sorted list with a parallel list of
+    entries ``(weight, type, id, text, slug)``; a prefix maps to the
+    contiguous range ``bisect_left(prefix) .. bisect_left(prefix + U+FFFF)``
+    and the heaviest entries of that range are returned. Product and
+    category names are also indexed from every word, so "iph" finds
+    "Apple iPhone". Results for prefixes of up to ``CACHED_PREFIX_LENGTH``
+    characters, whose ranges are the largest, are cached until an update
+    touches them.
+
+    Weights are ``log1p`` of recent interactions (products), product count
+    (categories) or search count (queries from ``SearchQueryCount``).
+
+    Products saved in this process are applied by signal; every
+    ``REFRESH_INTERVAL`` seconds a lookup also applies products other
+    processes changed since the last check (``Product.updated``). A full
+    rebuild, which refreshes weights and drops deleted products, runs in a
+    background thread every ``REBUILD_INTERVAL`` seconds while lookups keep
+    using the previous arrays.
+    """
+
+    LIMIT = 10
+    MAX_LIMIT = 20
+    CACHED_PREFIX_LENGTH = 2
+    MAX_WORD_KEYS = 6  # Words of a name indexed as separate starting points
+    POPULARITY_DAYS = 30
+    MIN_QUERY_COUNT = 3
+    MAX_QUERIES = 20000
+    CATEGORY_BOOST = 0.5
+    REFRESH_INTERVAL = 30
+    REBUILD_INTERVAL = 3600
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = []
+        self._entries = []
+        self._cache = {}
+        self._product_keys = {}
+        self._product_weights = {}
+        self._watermark = None
+        self._checked = 0.0
+        self._built = 0.0
+        self._rebuilding = False
+
+    @classmethod
+    def get_instance(cls):
+        """Per-process index, built on first use"""
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    instance = cls()
+                    instance.build()
+                    cls._instance = instance
+        return cls._instance
+
+    @classmethod
+    def get_loaded_instance(cls):
+        """The index if this process has built one, without building it"""
+        return cls._instance
+
+    @classmethod
+    def _keys_for(cls, text):
+        words = normalize_query(text).split(' ')
+        keys = []
+        for start in range(min(len(words), cls.MAX_WORD_KEYS)):
+            key = ' '.join(words[start:])
+            if key and key not in keys:
+                keys.append(key)
+        return keys
+
+    # Building
+
+    def build(self):
+        """Rebuild every key from the database and swap it in"""
+        started = time.perf_counter()
+        watermark = timezone.now()
+        since = watermark - timedelta(days=self.POPULARITY_DAYS)
+
+        product_weights = {
+            product_id: math.log1p(count)
+            for product_id, count in UserProductInteraction.objects.filter(
+                timestamp__gte=since
+            ).values('product_id').annotate(
+                count=Count('id')
+            ).values_list('product_id', 'count').iterator()
+        }
+
+        items = []
+        product_keys = {}
+        for product_id, name, slug in Product.objects.filter(
+            available=True
+        ).values_list('id', 'name', 'slug').iterator():
+            entry = (product_weights.get(product_id, 0.0), 'product', product_id, name, slug)
+            product_keys[product_id] = self._keys_for(name)
+            items.extend((key, entry) for key in product_keys[product_id])
+
+        for category_id, name, slug, products in Category.objects.annotate(
+            product_count=Count('products')
+        ).values_list('id', 'name', 'slug', 'product_count').iterator():
+            entry = (math.log1p(products) + self.CATEGORY_BOOST, 'category', category_id, name, slug)
+            items.extend((key, entry) for key in self._keys_for(name))
+
+        for query, count in SearchQueryCount.objects.filter(
+            hour__gte=since
+        ).values('query').annotate(
+            total=Sum('count')
+        ).filter(
+            total__gte=self.MIN_QUERY_COUNT
+        ).order_by('-total').values_list('query', 'total')[:self.MAX_QUERIES]:
+            items.append((query, (math.log1p(count), 'query', None, query, None)))
+
+        items.sort(key=lambda item: item[0])
+        keys = [key for key, _ in items]
+        entries = [entry for _, entry in items]
+
+        with self._lock:
+            self._keys, self._entries = keys, entries
+            self._product_keys = product_keys
+            self._product_weights = product_weights
+            self._cache = {}
+            self._watermark = watermark
+            self._built = self._checked = time.monotonic()
+
+        logger.info(f"Built autocomplete index with {len(keys)} keys in {time.perf_counter() - started:.2f}s")
+
+    def _rebuild_in_background(self):
+        def run():
+            try:
+                self.build()
+            except Exception as e:
+                logger.error(f"Error rebuilding autocomplete index: {str(e)}", exc_info=True)
+            finally:
+                self._rebuilding = False
+                close_old_connections()
+
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+        threading.Thread(target=run, name='autocomplete-rebuild', daemon=True).start()
+
+    # Incremental updates
+
+    def update_product(self, product_id, name, slug, available=True):
+        with self._lock:
+            self._remove_product_locked(product_id)
+            if not available:
+                return
+            entry = (self._product_weights.get(product_id, 0.0), 'product', product_id, name, slug)
+            keys = self._keys_for(name)
+            for key in keys:
+                position = bisect_right(self._keys, key)
+                self._keys.insert(position, key)
+                self._entries.insert(position, entry)
+                self._invalidate(key)
+            self._product_keys[product_id] = keys
+
+    def remove_product(self, product_id):
+        with self._lock:
+            self._remove_product_locked(product_id)
+
+    def _remove_product_locked(self, product_id):
+        for key in self._product_keys.pop(product_id, ()):
+            position = bisect_left(self._keys, key)
+            while position < len(self._keys) and self._keys[position] == key:
+                entry = self._entries[position]
+                if entry[1] == 'product' and entry[2] == product_id:
+                    del self._keys[position]
+                    del self._entries[position]
+                    break
+                position += 1
+            self._invalidate(key)
+
+    def _invalidate(self, key):
+        for length in range(1, self.CACHED_PREFIX_LENGTH + 1):
+            self._cache.pop(key[:length], None)
+
+    def _refresh(self):
+        """Apply products changed by other processes; start a rebuild when due"""
+        now = time.monotonic()
+        if now - self._built > self.REBUILD_INTERVAL:
+            self._rebuild_in_background()
+        if now - self._checked < self.REFRESH_INTERVAL:
+            return
+
+        with self._lock:
+            if now - self._checked < self.REFRESH_INTERVAL:
+                return
+            self._checked = now
+            watermark = self._watermark
+
+        checked_at = timezone.now()
+        changed = Product.objects.filter(
+            updated__gt=watermark
+        ).values_list('id', 'name', 'slug', 'available')
+        for product_id, name, slug, available in changed:
+            self.update_product(product_id, name, slug, available)
+        self._watermark = checked_at
+
+    # Lookups
+
+    def lookup(self, prefix, limit=None):
+        """Up to ``limit`` suggestions for ``prefix``, most popular first"""
+        limit = min(limit or self.LIMIT, self.MAX_LIMIT)
+        prefix = normalize_query(prefix)
+        if not prefix:
+            return []
+
+        try:
+            self._refresh()
+        except Exception as e:
+            logger.error(f"Error refreshing autocomplete index: {str(e)}", exc_info=True)
+
+        cacheable = len(prefix) <= self.CACHED_PREFIX_LENGTH
+        wanted = self.MAX_LIMIT if cacheable else limit
+        with self._lock:
+            if cacheable and prefix in self._cache:
+                return self._cache[prefix][:limit]
+
+            low = bisect_left(self._keys, prefix)
+            high = bisect_left(self._keys, prefix + '\uffff', low)
+            # Heaviest first, then shorter text; extra candidates cover duplicates
+            best = heapq.nsmallest(
+                wanted * 3,
+                self._entries[low:high],
+                key=lambda entry: (-entry[0], len(entry[3]))
+            )
+
+            suggestions = []
+            seen = set()
+            for weight, kind, object_id, text, slug in best:
+                identity = (kind, object_id if object_id is not None else text)
+                if identity in seen:
+                    continue
+                seen.add(identity)
+                suggestions.append({'text': text, 'type': kind, 'id': object_id, 'slug': slug})
+                if len(suggestions) >= wanted:
+                    break
+
+            if cacheable:
+                self._cache[prefix] = suggestions
+        return suggestions[:limit]
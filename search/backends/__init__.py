@@ -0,0 +1,40 @@
+import threading
+
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+
+from .base import SearchBackend, SearchHits
+
+BACKENDS = {
+    'postgres': 'search.backends.postgres.PostgresSearchBackend',
+    'bm25': 'search.backends.bm25.BM25SearchBackend',
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """The per-process search backend named by ``SEARCH_BACKEND``.
+
+    The setting takes a key of ``BACKENDS`` or a dotted class path. When it
+    is empty, PostgreSQL databases use full-text search and everything else
+    (e.g. SQLite development setups) the built-in BM25 index.
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                name = getattr(settings, 'SEARCH_BACKEND', '') or (
+                    'postgres' if connection.vendor == 'postgresql' else 'bm25'
+                )
+                _backend = import_string(BACKENDS.get(name, name))()
+    return _backend
+
+
+def reset_backend():
+    """Forget the current backend so the next call re-reads the settings"""
+    global _backend
+    with _backend_lock:
+        _backend = None
@@ -0,0 +1,46 @@
+from collections import namedtuple
+
+# One page of ranked product ids and the total number of matches. Backends
+# that already loaded the Product rows pass them in ``products`` (else None);
+# ``total_is_estimate`` is True when the backend stopped counting matches
+# early, so ``total`` is only a lower bound.
+SearchHits = namedtuple('SearchHits', ['ids', 'total', 'products', 'total_is_estimate'], defaults=(False,))
+
+
+class SearchBackend:
+    """Interface implemented by the product search backends.
+
+    ``terms`` are the normalized query words (see
+    ``SearchService.normalize_terms``). Every term must match, and a term
+    matches any indexed word it is a prefix of. ``filter_q`` is a Q object
+    over Product that the matches must also satisfy.
+    """
+
+    name = None
+
+    def search(self, terms, filter_q, offset, limit):
+        """Return SearchHits for matches ``[offset, offset + limit)`` in rank order"""
+        raise NotImplementedError
+
+    def matching(self, terms):
+        """Queryset of the products matching ``terms`` (used for facet counts)"""
+        raise NotImplementedError
+
+    def index_product(self, product):
+        """Make a created or edited product searchable"""
+        raise NotImplementedError
+
+    def index_category(self, category):
+        """Re-index the products of a category whose name may have changed"""
+        raise NotImplementedError
+
+    def remove_product(self, product_id):
+        raise NotImplementedError
+
+    def rebuild(self):
+        """Re-index every product; returns the number indexed"""
+        raise NotImplementedError
+
+    def compact(self):
+        """Fold pending updates into the index if they grew too large; returns the number indexed or None"""
+        return None
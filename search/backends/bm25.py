@@ -0,0 +1,363 @@
+import json
+import re
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from pathlib import Path
+import logging
+
+import numpy as np
+from django.conf import settings
+
+from products.models import Product
+from recommendations.segments import SegmentStore
+from .base import SearchBackend, SearchHits
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+class BM25SearchBackend(SearchBackend):
+    """Built-in BM25 inverted index for databases without full-text search.
+
+    On-disk layout (``SEARCH_BM25_INDEX_DIR``)::
+
+        CURRENT                  live segment and delta logs to replay
+        <segment>/terms.txt      sorted vocabulary, one term per line
+        <segment>/offsets.npy    int64; postings of term i are [offsets[i], offsets[i + 1])
+        <segment>/docs.npy       uint32 row numbers, memory-mapped
+        <segment>/tfs.npy        uint16 field-weighted term frequencies, memory-mapped
+        <segment>/ids.npy        int64 product id of each row, ascending
+        <segment>/lengths.npy    float32 field-weighted document lengths
+        delta*.jsonl             append-only updates and deletions since the build
+
+    Term frequencies are weighted by field like the Postgres vector (name,
+    then category, then description). As in the Postgres backend every
+    query term must match and matches by prefix: a term scores a document
+    with the best of its (at most ``MAX_EXPANSIONS`` most common) expansions.
+
+    Products changed since the build are kept in memory from the delta and
+    scored by a scan while their base rows are masked; ``rebuild`` writes a
+    new segment and switches ``CURRENT`` (SegmentStore), which other
+    processes notice on their next query. ``compact`` rebuilds once the
+    delta outgrows ``DELTA_COMPACT_BYTES``.
+
+    Ranking keeps the ``MAX_CANDIDATES`` best matches, so the total of a
+    broader query is a lower bound and is flagged with ``total_is_estimate``.
+    """
+
+    name = 'bm25'
+    FIELD_WEIGHTS = (
+        ('name', 3),
+        ('category', 2),
+        ('description', 1),
+    )
+    K1 = 1.2
+    B = 0.75
+    MAX_EXPANSIONS = 50
+    MAX_CANDIDATES = 5000  # Ranked matches kept for filtering, paging and facets
+    DELTA_COMPACT_BYTES = 2 * 1024 * 1024  # A few thousand records, each scanned on every query
+    FILTER_BATCH_SIZE = 900  # Below SQLite's default bound-parameter limit
+
+    def __init__(self, path=None):
+        self.path = Path(path or getattr(
+            settings,
+            'SEARCH_BM25_INDEX_DIR',
+            Path(settings.BASE_DIR) / 'var' / 'search_index'
+        ))
+        self.store = SegmentStore(self.path, initial_delta='delta.jsonl')
+        self._lock = threading.RLock()
+        self.load()
+
+    def _reset(self):
+        self.terms = []
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.docs = np.empty(0, dtype=np.uint32)
+        self.tfs = np.empty(0, dtype=np.uint16)
+        self.ids = np.empty(0, dtype=np.int64)
+        self.lengths = np.empty(0, dtype=np.float32)
+        self._live = np.ones(0, dtype=bool)
+        self._delta = {}
+        self._delta_df = Counter()
+        self._deltas = []
+        self._delta_offsets = {}
+        self._pointer = None
+        self._update_stats()
+
+    # Analysis
+
+    @classmethod
+    def analyze(cls, name, category_name, description):
+        """Field-weighted term counts and length of one product"""
+        counts = Counter()
+        texts = {'name': name, 'category': category_name, 'description': description}
+        for field, weight in cls.FIELD_WEIGHTS:
+            for token in TOKEN_RE.findall((texts[field] or '').lower()):
+                counts[token] += weight
+        return counts, sum(counts.values())
+
+    # Building and persistence
+
+    def rebuild(self):
+        # Updates made from here on go to a new delta log, replayed on top of the segment
+        since = self.store.rotate()
+
+        ids, lengths = array('q'), array('f')
+        postings = defaultdict(lambda: (array('I'), array('H')))
+        rows = Product.objects.order_by('id').values_list('id', 'name', 'description', 'category__name')
+        for row, (product_id, name, description, category_name) in enumerate(rows.iterator()):
+            counts, length = self.analyze(name, category_name, description)
+            ids.append(product_id)
+            lengths.append(length)
+            for term, tf in counts.items():
+                docs, tfs = postings[term]
+                docs.append(row)
+                tfs.append(min(tf, 65535))
+
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(postings[term][0]) for term in terms])
+
+        directory = self.store.new_segment()
+        (directory / 'terms.txt').write_text('\n'.join(terms), encoding='utf-8')
+        arrays = {
+            'offsets.npy': offsets,
+            'docs.npy': np.frombuffer(b''.join(postings[term][0].tobytes() for term in terms), dtype=np.uint32),
+            'tfs.npy': np.frombuffer(b''.join(postings[term][1].tobytes() for term in terms), dtype=np.uint16),
+            'ids.npy': np.frombuffer(ids, dtype=np.int64),
+            'lengths.npy': np.frombuffer(lengths, dtype=np.float32),
+        }
+        for name, values in arrays.items():
+            with open(directory / name, 'wb') as f:
+                np.save(f, values)
+        self.store.publish(directory, since)
+
+        self.load()
+        logger.info(f"Built BM25 search index with {len(ids)} products and {len(terms)} terms")
+        return len(ids)
+
+    def compact(self, max_delta_bytes=None):
+        """Rebuild if the delta logs have outgrown their cap; returns the number indexed or None"""
+        _, pointer = self.store.read()
+        size = self.store.pending_bytes(pointer)
+        if size <= (max_delta_bytes or self.DELTA_COMPACT_BYTES):
+            return None
+
+        logger.info(f"Compacting BM25 search index: delta logs hold {size} bytes")
+        return self.rebuild()
+
+    def load(self):
+        """Load the live segment and replay its delta logs"""
+        with self._lock:
+            self._reset()
+            self._pointer, pointer = self.store.read()
+            self._deltas = pointer['deltas']
+            self._delta_offsets = dict(pointer.get('offsets', {}))
+            directory = self.store.segment_path(pointer)
+            if directory is not None:
+                vocabulary = (directory / 'terms.txt').read_text(encoding='utf-8')
+                self.terms = vocabulary.split('\n') if vocabulary else []
+                self.offsets = np.load(directory / 'offsets.npy')
+                if self.offsets[-1]:
+                    self.docs = np.load(directory / 'docs.npy', mmap_mode='r')
+                    self.tfs = np.load(directory / 'tfs.npy', mmap_mode='r')
+                self.ids = np.load(directory / 'ids.npy')
+                self.lengths = np.load(directory / 'lengths.npy')
+                self._live = np.ones(len(self.ids), dtype=bool)
+            self._replay_delta()
+            self._update_stats()
+
+    def refresh(self):
+        """Pick up a rebuilt segment or delta records written by other processes"""
+        if self.store.read()[0] != self._pointer:
+            self.load()
+            return
+        with self._lock:
+            self._replay_delta()
+
+    def _row(self, product_id):
+        position = np.searchsorted(self.ids, product_id)
+        if position < len(self.ids) and self.ids[position] == product_id:
+            return int(position)
+        return None
+
+    def _replay_delta(self):
+        replayed = False
+        for name in self._deltas:
+            offset = self._delta_offsets.get(name, 0)
+            data = self.store.read_delta(name, offset)
+            # Ignore a line that is still being written
+            usable = data.rfind(b'\n') + 1
+            if usable:
+                self._apply_records(data[:usable])
+                self._delta_offsets[name] = offset + usable
+                replayed = True
+        if replayed:
+            self._update_stats()
+
+    def _apply_records(self, data):
+        for line in data.splitlines():
+            record = json.loads(line)
+            product_id = record['id']
+            row = self._row(product_id)
+            if row is not None:
+                self._live[row] = False
+            previous = self._delta.pop(product_id, None)
+            if previous is not None:
+                self._delta_df.subtract(previous[0].keys())
+            if not record.get('deleted'):
+                self._delta[product_id] = (record['terms'], record['length'])
+                self._delta_df.update(record['terms'].keys())
+
+    def _update_stats(self):
+        live_lengths = float(self.lengths[self._live].sum()) if len(self.lengths) else 0.0
+        delta_lengths = sum(length for _, length in self._delta.values())
+        self._doc_count = int(self._live.sum()) + len(self._delta)
+        self._avg_length = (live_lengths + delta_lengths) / self._doc_count if self._doc_count else 1.0
+
+    def _append(self, records):
+        # One O_APPEND write, so concurrent writers do not interleave records
+        self.store.append(b''.join(
+            json.dumps(record, separators=(',', ':')).encode() + b'\n'
+            for record in records
+        ))
+        self.refresh()
+
+    def index_product(self, product):
+        counts, length = self.analyze(
+            product.name,
+            product.category.name if product.category_id else '',
+            product.description
+        )
+        self._append([{'id': product.id, 'terms': counts, 'length': length}])
+
+    def index_category(self, category):
+        records = []
+        for product_id, name, description in Product.objects.filter(
+            category_id=category.id
+        ).values_list('id', 'name', 'description').iterator():
+            counts, length = self.analyze(name, category.name, description)
+            records.append({'id': product_id, 'terms': counts, 'length': length})
+        if records:
+            self._append(records)
+
+    def remove_product(self, product_id):
+        self._append([{'id': product_id, 'deleted': True}])
+
+    # Scoring
+
+    def _idf(self, df):
+        return np.log(1.0 + (self._doc_count - df + 0.5) / (df + 0.5))
+
+    def _base_df(self, term):
+        index = bisect_left(self.terms, term)
+        if index < len(self.terms) and self.terms[index] == term:
+            return int(self.offsets[index + 1] - self.offsets[index])
+        return 0
+
+    def _expansions(self, term):
+        low = bisect_left(self.terms, term)
+        high = bisect_left(self.terms, term + '\uffff', low)
+        indices = np.arange(low, high)
+        if len(indices) > self.MAX_EXPANSIONS:
+            frequencies = self.offsets[indices + 1] - self.offsets[indices]
+            indices = indices[np.argsort(-frequencies, kind='stable')[:self.MAX_EXPANSIONS]]
+        return indices
+
+    def _score_base(self, term):
+        """Best expansion score of one query term per live base row, as sorted (rows, scores)"""
+        row_parts, score_parts = [], []
+        for index in self._expansions(term):
+            start, end = self.offsets[index], self.offsets[index + 1]
+            rows = np.asarray(self.docs[start:end], dtype=np.int64)
+            tf = np.asarray(self.tfs[start:end], dtype=np.float32)
+            df = end - start + self._delta_df[self.terms[index]]
+            norm = self.K1 * (1 - self.B + self.B * self.lengths[rows] / self._avg_length)
+            row_parts.append(rows)
+            score_parts.append(self._idf(df) * tf * (self.K1 + 1) / (tf + norm))
+
+        if not row_parts:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        rows = np.concatenate(row_parts)
+        scores = np.concatenate(score_parts)
+        live = self._live[rows]
+        rows, scores = rows[live], scores[live]
+
+        order = np.lexsort((-scores, rows))
+        rows, scores = rows[order], scores[order]
+        first = np.ones(len(rows), dtype=bool)
+        first[1:] = rows[1:] != rows[:-1]
+        return rows[first], scores[first]
+
+    def _score_delta(self, terms):
+        results = {}
+        for product_id, (doc_terms, length) in self._delta.items():
+            norm = self.K1 * (1 - self.B + self.B * length / self._avg_length)
+            total = 0.0
+            for term in terms:
+                best = 0.0
+                for doc_term, tf in doc_terms.items():
+                    if doc_term.startswith(term):
+                        df = self._base_df(doc_term) + self._delta_df[doc_term]
+                        best = max(best, float(self._idf(df)) * tf * (self.K1 + 1) / (tf + norm))
+                if not best:
+                    break
+                total += best
+            else:
+                results[product_id] = total
+        return results
+
+    def rank(self, terms):
+        """Ids of matching products, best first, at most MAX_CANDIDATES.
+
+        Returns ``(ids, capped)``; ``capped`` is True when more products
+        matched and only the best MAX_CANDIDATES were kept.
+        """
+        if not terms:
+            return [], False
+
+        with self._lock:
+            self.refresh()
+            rows = scores = None
+            for term in terms:
+                term_rows, term_scores = self._score_base(term)
+                if rows is None:
+                    rows, scores = term_rows, term_scores
+                else:
+                    rows, left, right = np.intersect1d(rows, term_rows, assume_unique=True, return_indices=True)
+                    scores = scores[left] + term_scores[right]
+                if not len(rows):
+                    break
+            ids = self.ids[rows]
+            delta = self._score_delta(terms)
+
+        if delta:
+            ids = np.concatenate((ids, np.fromiter(delta.keys(), dtype=np.int64, count=len(delta))))
+            scores = np.concatenate((scores, np.fromiter(delta.values(), dtype=np.float32, count=len(delta))))
+        capped = len(ids) > self.MAX_CANDIDATES
+        if capped:
+            best = np.argpartition(-scores, self.MAX_CANDIDATES - 1)[:self.MAX_CANDIDATES]
+            ids, scores = ids[best], scores[best]
+        # Highest score first, ties by id like the Postgres backend
+        order = np.lexsort((ids, -scores))
+        return ids[order].tolist(), capped
+
+    def search(self, terms, filter_q, offset, limit):
+        ranked, capped = self.rank(terms)
+        if ranked and filter_q:
+            allowed = set()
+            for start in range(0, len(ranked), self.FILTER_BATCH_SIZE):
+                allowed.update(
+                    Product.objects.filter(
+                        filter_q,
+                        id__in=ranked[start:start + self.FILTER_BATCH_SIZE]
+                    ).values_list('id', flat=True)
+                )
+            ranked = [product_id for product_id in ranked if product_id in allowed]
+        return SearchHits(ranked[offset:offset + limit], len(ranked), None, capped)
+
+    def matching(self, terms):
+        # Bounded by MAX_CANDIDATES, which fits SQLite's parameter limit since 3.32
+        return Product.objects.filter(id__in=self.rank(terms)[0])
@@ -0,0 +1,67 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import Count, F, Window
+
+from products.models import Product
+from ..indexing import ProductSearchIndexer
+from .base import SearchBackend, SearchHits
+
+
+class PostgresSearchBackend(SearchBackend):
+    """PostgreSQL full-text search over the stored ``Product.search_vector``.
+
+    Matches use the GIN index; the page and the total (``COUNT(*) OVER ()``)
+    come from one query.
+    """
+
+    name = 'postgres'
+
+    @staticmethod
+    def build_query(terms):
+        """Prefix-matching tsquery: every word of the query must start a word in the product.
+        
+        Terms are restricted to word characters, so the raw query syntax
+        cannot be injected from user input.
+        """
+        if not terms:
+            return None
+        return SearchQuery(' & '.join(f'{term}:*' for term in terms), search_type='raw')
+
+    def search(self, terms, filter_q, offset, limit):
+        search_query = self.build_query(terms)
+        if search_query is None:
+            return SearchHits([], 0, [])
+
+        matches = Product.objects.filter(search_vector=search_query).filter(filter_q)
+        products = list(
+            matches.annotate(
+                rank=SearchRank(F('search_vector'), search_query),
+                total_count=Window(expression=Count('id'))
+            ).order_by('-rank', 'id')[offset:offset + limit]
+        )
+        if products:
+            total = products[0].total_count
+        elif offset:
+            # A page past the end has no row to carry the window count
+            total = matches.count()
+        else:
+            total = 0
+        return SearchHits([product.id for product in products], total, products)
+
+    def matching(self, terms):
+        search_query = self.build_query(terms)
+        if search_query is None:
+            return Product.objects.none()
+        return Product.objects.filter(search_vector=search_query)
+
+    def index_product(self, product):
+        ProductSearchIndexer.update_product(product)
+
+    def index_category(self, category):
+        ProductSearchIndexer.update_category(category)
+
+    def remove_product(self, product_id):
+        # The vector is stored on the row, so it goes with it
+        pass
+
+    def rebuild(self):
+        return ProductSearchIndexer.rebuild()
@@ -0,0 +1,84 @@
+import hashlib
+import json
+import time
+import uuid
+import logging
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+class SearchResultCache:
+    """Shared cache of ranked search result pages.
+
+    Entries hold only the ranked product ids of one page and the total
+    count. Keys hash the normalized query, the filters, the page and the
+    current catalog version; product and category writes bump the version
+    (``bump_catalog_version``), so stale pages are never read again and
+    simply expire.
+
+    Misses are single-flight across processes: the first caller takes a
+    short lock with ``cache.add`` and computes, others poll for its result
+    for up to ``WAIT_TIMEOUT`` seconds before computing themselves.
+    """
+
+    VERSION_KEY = 'search:catalog_version'
+    KEY_PREFIX = 'search:results'
+    TTL = 600
+    LOCK_TTL = 10
+    WAIT_TIMEOUT = 2.0
+    POLL_INTERVAL = 0.05
+
+    @classmethod
+    def catalog_version(cls):
+        version = cache.get(cls.VERSION_KEY)
+        if version is None:
+            cache.add(cls.VERSION_KEY, 1, None)
+            version = cache.get(cls.VERSION_KEY, 1)
+        return version
+
+    @classmethod
+    def bump_catalog_version(cls):
+        try:
+            return cache.incr(cls.VERSION_KEY)
+        except ValueError:
+            # Key missing (e.g. evicted): any fresh value differs from the old keys
+            cache.add(cls.VERSION_KEY, int(time.time()), None)
+            return cache.get(cls.VERSION_KEY)
+
+    @classmethod
+    def make_key(cls, query, filters, page, page_size):
+        payload = json.dumps(
+            [cls.catalog_version(), query, filters or {}, page, page_size],
+            sort_keys=True,
+            default=str
+        )
+        return f'{cls.KEY_PREFIX}:{hashlib.md5(payload.encode()).hexdigest()}'
+
+    @classmethod
+    def get_or_compute(cls, key, compute):
+        """Return the cached ``{'ids', 'total'}`` for ``key``, computing it once on a miss"""
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+        lock_key = f'{key}:lock'
+        token = uuid.uuid4().hex
+        if not cache.add(lock_key, token, cls.LOCK_TTL):
+            deadline = time.monotonic() + cls.WAIT_TIMEOUT
+            while time.monotonic() < deadline:
+                time.sleep(cls.POLL_INTERVAL)
+                cached = cache.get(key)
+                if cached is not None:
+                    return cached
+            logger.warning(f"Timed out waiting for search result {key}; computing it")
+            return compute()
+
+        try:
+            result = compute()
+            cache.set(key, result, cls.TTL)
+            return result
+        finally:
+            if cache.get(lock_key) == token:
+                cache.delete(lock_key)
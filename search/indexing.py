@@ -0,0 +1,83 @@
+from django.contrib.postgres.search import SearchVector
+from django.db import connection
+from django.db.models import CharField, Value
+import logging
+
+from products.models import Category, Product
+
+logger = logging.getLogger(__name__)
+
+
+class ProductSearchIndexer:
+    """Keeps ``Product.search_vector`` in sync with the searchable fields.
+
+    The stored vector is ``name`` (weight A) + ``description`` (B) +
+    category name (C), computed by the database in a single UPDATE. An
+    UPDATE cannot reference a joined column, so the category name is passed
+    in as a value and products are updated one category at a time.
+
+    Vectors are only maintained on PostgreSQL; on other databases every
+    method is a no-op.
+    """
+
+    WEIGHTS = (
+        ('name', 'A'),
+        ('description', 'B'),
+    )
+    CATEGORY_WEIGHT = 'C'
+    BATCH_SIZE = 5000
+
+    @staticmethod
+    def is_supported():
+        return connection.vendor == 'postgresql'
+
+    @classmethod
+    def vector(cls, category_name):
+        vector = SearchVector(Value(category_name or '', output_field=CharField()), weight=cls.CATEGORY_WEIGHT)
+        for field, weight in cls.WEIGHTS:
+            vector = SearchVector(field, weight=weight) + vector
+        return vector
+
+    @classmethod
+    def update_product(cls, product):
+        if not cls.is_supported():
+            return 0
+        category_name = Category.objects.filter(
+            id=product.category_id
+        ).values_list('name', flat=True).first()
+        return Product.objects.filter(id=product.id).update(search_vector=cls.vector(category_name))
+
+    @classmethod
+    def update_category(cls, category):
+        """Re-vector every product of a category, in id-range batches"""
+        if not cls.is_supported():
+            return 0
+        products = Product.objects.filter(category_id=category.id)
+        vector = cls.vector(category.name)
+        updated = 0
+        last_id = 0
+        while True:
+            ids = list(
+                products.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:cls.BATCH_SIZE]
+            )
+            if not ids:
+                break
+            updated += Product.objects.filter(
+                category_id=category.id,
+                id__gte=ids[0],
+                id__lte=ids[-1]
+            ).update(search_vector=vector)
+            last_id = ids[-1]
+        return updated
+
+    @classmethod
+    def rebuild(cls):
+        """Recompute the vector of every product; returns the number updated"""
+        if not cls.is_supported():
+            logger.warning("Stored search vectors need PostgreSQL; nothing rebuilt")
+            return 0
+        updated = 0
+        for category in Category.objects.only('id', 'name').iterator():
+            updated += cls.update_category(category)
+        logger.info(f"Rebuilt search vectors for {updated} products")
+        return updated
@@ -0,0 +1,31 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+
+from search.backends import BACKENDS, get_backend
+
+
+class Command(BaseCommand):
+    help = 'Re-index every product in the configured search backend'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--backend',
+            choices=sorted(BACKENDS),
+            help='Rebuild this backend instead of the one named by SEARCH_BACKEND'
+        )
+
+    def handle(self, *args, **options):
+        if options['backend']:
+            backend = import_string(BACKENDS[options['backend']])()
+        else:
+            backend = get_backend()
+
+        started = time.perf_counter()
+        try:
+            indexed = backend.rebuild()
+        except Exception as e:
+            raise CommandError(f'Error rebuilding the {backend.name} search index: {str(e)}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt the {backend.name} search index for {indexed} products in {time.perf_counter() - started:.1f}s'
+        ))
@@ -0,0 +1,18 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+
+from search.indexing import ProductSearchIndexer
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stored full-text search vector of every product'
+
+    def handle(self, *args, **options):
+        if not ProductSearchIndexer.is_supported():
+            raise CommandError('Stored search vectors require a PostgreSQL database')
+
+        started = time.perf_counter()
+        updated = ProductSearchIndexer.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt search vectors for {updated} products in {time.perf_counter() - started:.1f}s'
+        ))
@@ -2,9 +2,39 @@ from django.db import models
 from django.contrib.postgres.search import SearchVectorField
 from django.contrib.postgres.indexes import GinIndex
 
+
+class PortableGinIndex(GinIndex):
+    """GIN index on PostgreSQL, a plain index elsewhere.
+    
+    ``USING gin`` is rejected by SQLite, which would otherwise fail to
+    create the table (tests run without migrations) when the BM25 backend
+    is used on a development database.
+    """
+    
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        if schema_editor.connection.vendor != 'postgresql':
+            return models.Index.create_sql(self, model, schema_editor, using=using, **kwargs)
+        return super().create_sql(model, schema_editor, using=using, **kwargs)
+
+
 class SearchableModel(models.Model):
     search_vector = SearchVectorField(null=True, blank=True)
     
     class Meta:
         abstract = True
-        indexes = [GinIndex(fields=['search_vector'])]
+        indexes = [PortableGinIndex(fields=['search_vector'])]
+
+
+class RelatedProduct(models.Model):
+    """Precomputed "related products" list of a product, maintained by RelatedProductsBuilder"""
+    product = models.ForeignKey('products.Product', on_delete=models.CASCADE, related_name='related_products')
+    related = models.ForeignKey(
+        'products.Product',
+        on_delete=models.CASCADE,
+        related_name='related_products_as_related'
+    )
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    
+    class Meta:
+        unique_together = ('product', 'rank')
@@ -0,0 +1,196 @@
+from collections import defaultdict
+from datetime import timedelta
+import logging
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from products.models import Product
+from recommendations.ann import ProductVectorIndex
+from recommendations.models import MiningWatermark, UserProductInteraction
+from .models import RelatedProduct
+
+logger = logging.getLogger(__name__)
+
+
+class RelatedProductsBuilder:
+    """Maintains the precomputed ``RelatedProduct`` lists shown on product pages.
+
+    Candidates of a product are its nearest neighbours in the text vector
+    index, the products co-viewed with it and the newest products of its
+    category. Each available candidate is scored as
+
+    * ``TEXT_WEIGHT`` x cosine of the name/category/description vectors
+    * + ``COVIEW_WEIGHT`` x n_ab / sqrt(n_a * n_b), n counting distinct
+      users who viewed in the last ``COVIEW_DAYS`` days
+    * + ``CATEGORY_WEIGHT`` if it is in the same category
+
+    and the best ``TOP_K`` are stored, so a product page reads its list with
+    one indexed join. Products carry no tags; the text similarity stands in
+    for tag overlap.
+
+    Saving a product refreshes its own list and the lists that contain it;
+    ``update`` refreshes products viewed since its last run and ``rebuild``
+    recomputes every list.
+    """
+
+    WATERMARK = 'related-products'
+    TOP_K = 10
+    TEXT_WEIGHT = 0.3
+    COVIEW_WEIGHT = 0.4
+    CATEGORY_WEIGHT = 0.3
+    TEXT_CANDIDATES = 30
+    CATEGORY_CANDIDATES = 20
+    COVIEW_DAYS = 30
+    MIN_COVIEWS = 2
+    BATCH_SIZE = 200
+
+    @classmethod
+    def refresh_products(cls, product_ids):
+        """Recompute and store the lists of the given products; returns rows written"""
+        targets = {
+            product.id: product
+            for product in Product.objects.filter(id__in=list(product_ids)).select_related('category')
+        }
+        if not targets:
+            return 0
+
+        scores = {product_id: defaultdict(float) for product_id in targets}
+        index = ProductVectorIndex.get_instance()
+        for product_id, product in targets.items():
+            for other, similarity in index.similar_to(product, k=cls.TEXT_CANDIDATES):
+                if similarity > 0:
+                    scores[product_id][other] += cls.TEXT_WEIGHT * float(similarity)
+
+        for product_id, other, similarity in cls._coviews(list(targets)):
+            scores[product_id][other] += cls.COVIEW_WEIGHT * similarity
+
+        for category_id in {product.category_id for product in targets.values()}:
+            newest = list(
+                Product.objects.filter(
+                    category_id=category_id,
+                    available=True
+                ).order_by('-created').values_list('id', flat=True)[:cls.CATEGORY_CANDIDATES]
+            )
+            for product_id, product in targets.items():
+                if product.category_id == category_id:
+                    for other in newest:
+                        scores[product_id].setdefault(other, 0.0)
+
+        candidates = set().union(*(candidate.keys() for candidate in scores.values()))
+        categories = dict(
+            Product.objects.filter(
+                id__in=candidates,
+                available=True
+            ).values_list('id', 'category_id')
+        )
+
+        rows = []
+        for product_id, product in targets.items():
+            scored = []
+            for other, score in scores[product_id].items():
+                if other == product_id or other not in categories:
+                    continue
+                if categories[other] == product.category_id:
+                    score += cls.CATEGORY_WEIGHT
+                scored.append((score, other))
+            scored.sort(key=lambda item: (-item[0], item[1]))
+            rows.extend(
+                RelatedProduct(product_id=product_id, related_id=other, rank=rank, score=score)
+                for rank, (score, other) in enumerate(scored[:cls.TOP_K])
+            )
+
+        with transaction.atomic():
+            RelatedProduct.objects.filter(product_id__in=list(targets)).delete()
+            RelatedProduct.objects.bulk_create(rows)
+        return len(rows)
+
+    @classmethod
+    def _coviews(cls, product_ids):
+        """Yield ``(product, other, cosine)`` for products co-viewed with ``product_ids``"""
+        views = UserProductInteraction.objects.filter(
+            interaction_type='view',
+            timestamp__gte=timezone.now() - timedelta(days=cls.COVIEW_DAYS)
+        )
+        pairs = list(
+            views.filter(
+                user_id__in=views.filter(product_id__in=product_ids).values('user_id')
+            ).values_list('user_id', 'product_id').order_by().distinct()
+        )
+        if not pairs:
+            return
+
+        users = np.fromiter((user_id for user_id, _ in pairs), dtype=np.int64, count=len(pairs))
+        products = np.fromiter((product_id for _, product_id in pairs), dtype=np.int64, count=len(pairs))
+        _, user_index = np.unique(users, return_inverse=True)
+        columns, product_index = np.unique(products, return_inverse=True)
+        viewed = csr_matrix(
+            (np.ones(len(pairs), dtype=np.int32), (user_index, product_index)),
+            shape=(user_index.max() + 1, len(columns))
+        )
+
+        # Every viewer of a target is in the matrix, so its column sums are exact
+        viewed_targets = np.intersect1d(product_ids, columns)
+        target_columns = np.searchsorted(columns, viewed_targets)
+        target_viewers = np.asarray(viewed[:, target_columns].sum(axis=0)).ravel()
+        counts = (viewed[:, target_columns].T @ viewed).tocoo()
+        keep = counts.data >= cls.MIN_COVIEWS
+        rows, cols, data = counts.row[keep], counts.col[keep], counts.data[keep]
+        if not len(data):
+            return
+
+        viewers = dict(
+            views.filter(product_id__in=columns[np.unique(cols)].tolist()).values('product_id').annotate(
+                users=Count('user_id', distinct=True)
+            ).values_list('product_id', 'users')
+        )
+        for row, col, count in zip(rows, cols, data):
+            product_id, other = int(viewed_targets[row]), int(columns[col])
+            if product_id != other and viewers.get(other):
+                yield product_id, other, float(count / np.sqrt(target_viewers[row] * viewers[other]))
+
+    @classmethod
+    def refresh_for_product(cls, product_id):
+        """Refresh after a product changed: its own list and every list it appears in"""
+        affected = {product_id}
+        affected.update(
+            RelatedProduct.objects.filter(related_id=product_id).values_list('product_id', flat=True)
+        )
+        affected = sorted(affected)
+        written = 0
+        for start in range(0, len(affected), cls.BATCH_SIZE):
+            written += cls.refresh_products(affected[start:start + cls.BATCH_SIZE])
+        return written
+
+    @classmethod
+    def update(cls):
+        """Refresh the lists of products viewed since the last run; returns products refreshed"""
+        watermark, _ = MiningWatermark.objects.get_or_create(name=cls.WATERMARK)
+        new_views = UserProductInteraction.objects.filter(id__gt=watermark.last_id, interaction_type='view')
+        last_id = new_views.aggregate(last_id=Max('id'))['last_id']
+        if last_id is None:
+            return 0
+
+        product_ids = sorted(
+            new_views.filter(id__lte=last_id).values_list('product_id', flat=True).order_by().distinct()
+        )
+        for start in range(0, len(product_ids), cls.BATCH_SIZE):
+            cls.refresh_products(product_ids[start:start + cls.BATCH_SIZE])
+
+        watermark.last_id = last_id
+        watermark.total += len(product_ids)
+        watermark.save()
+        logger.info(f"Refreshed related products of {len(product_ids)} recently viewed products")
+        return len(product_ids)
+
+    @classmethod
+    def rebuild(cls):
+        """Recompute the list of every product; returns products processed"""
+        product_ids = list(Product.objects.order_by('id').values_list('id', flat=True))
+        for start in range(0, len(product_ids), cls.BATCH_SIZE):
+            cls.refresh_products(product_ids[start:start + cls.BATCH_SIZE])
+        logger.info(f"Rebuilt related products of {len(product_ids)} products")
+        return len(product_ids)
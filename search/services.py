@@ -1,56 +1,210 @@
-from django.contrib.postgres.search import SearchVector, SearchQuery, SearchRank
-from django.db.models import Q
+import re
+
+from django.db.models import Count, Q
 from products.models import Product
-from analytics.models import SearchQuery as SearchQueryLog
+from analytics.buffers import SearchLogBuffer
+from analytics.trending import TrendingSearches
+from .backends import get_backend
+from .cache import SearchResultCache
+from .spelling import SpellingCorrector
+
+TOKEN_RE = re.compile(r'\w+')
 
 class SearchService:
+    DEFAULT_PAGE_SIZE = 20
+    MAX_PAGE_SIZE = 100
+    FILTERS = ('category', 'min_price', 'max_price', 'available')
+    PRICE_BUCKETS = (0, 25, 50, 100, 250, 500, 1000)  # Lower bounds; the last bucket is open
+    
     @staticmethod
-    def search_products(query_text, user=None):
-        # Create search vector
-        search_vector = (
-            SearchVector('name', weight='A') +
-            SearchVector('description', weight='B') +
-            SearchVector('category__name', weight='C')
-        )
+    def normalize_terms(query_text):
+        """Lower-cased word terms of a query; equal term lists mean equal results"""
+        return TOKEN_RE.findall((query_text or '').lower())
+    
+    @classmethod
+    def search_terms(cls, query_text):
+        """Normalized terms with misspellings replaced by their likely corrections"""
+        return SpellingCorrector.get_instance().correct_terms(cls.normalize_terms(query_text))
+    
+    @classmethod
+    def normalize_filters(cls, filters):
+        """Keep the supported, non-empty filters as strings so equal filters share a cache key"""
+        return {
+            name: str(value)
+            for name, value in (filters or {}).items()
+            if name in cls.FILTERS and value not in (None, '')
+        }
+    
+    @staticmethod
+    def filter_q(filters, names=None):
+        """Q object for the given normalized filters, optionally only those in ``names``"""
+        filters = {name: value for name, value in filters.items() if names is None or name in names}
+        q = Q()
+        if 'category' in filters:
+            q &= Q(category__slug=filters['category'])
+        if 'min_price' in filters:
+            q &= Q(price__gte=filters['min_price'])
+        if 'max_price' in filters:
+            q &= Q(price__lte=filters['max_price'])
+        if 'available' in filters:
+            q &= Q(available=filters['available'].lower() in ('1', 'true', 'yes'))
+        return q
+    
+    @classmethod
+    def apply_filters(cls, queryset, filters):
+        return queryset.filter(cls.filter_q(filters))
+    
+    @classmethod
+    def search_products(cls, query_text, user=None, page=1, page_size=None, filters=None):
+        """Search products and return one ranked page together with the total.
+        
+        Matching and ranking are done by the configured search backend
+        (PostgreSQL full-text search or the built-in BM25 index); every query
+        word must match, by prefix. Ties in rank are broken by id to keep
+        pages stable. Misspelled terms are corrected first (SpellingCorrector)
+        and the corrected query is returned in ``corrected_query``.
+        
+        Pages are cached as ranked ids in SearchResultCache, keyed by the
+        normalized terms, filters and page; a hit costs one primary-key
+        lookup instead of the ranking query.
+        
+        ``total_is_estimate`` is True when the backend caps the matches it
+        ranks (BM25 keeps ``MAX_CANDIDATES``) and the query reached the cap;
+        ``total`` and ``num_pages`` are then lower bounds.
+        """
+        page_size = min(max(int(page_size or cls.DEFAULT_PAGE_SIZE), 1), cls.MAX_PAGE_SIZE)
+        page = max(int(page), 1)
+        offset = (page - 1) * page_size
+        filters = cls.normalize_filters(filters)
+        
+        terms = cls.search_terms(query_text)
+        results = None
+        
+        def rank_page():
+            nonlocal results
+            hits = get_backend().search(terms, cls.filter_q(filters), offset, page_size)
+            results = hits.products
+            return {'ids': hits.ids, 'total': hits.total, 'total_is_estimate': hits.total_is_estimate}
         
-        # Create search query
-        search_query = SearchQuery(query_text)
-        
-        # Get results with ranking
-        results = Product.objects.annotate(
-            rank=SearchRank(search_vector, search_query)
-        ).filter(
-            Q(rank__gte=0.1) |  # Matches from full-text search
-            Q(name__icontains=query_text) |  # Direct matches in name
-            Q(tags__name__icontains=query_text)  # Matches in tags
-        ).order_by('-rank')
-        
-        # Log the search query
-        SearchQueryLog.objects.create(
-            user=user,
-            query=query_text,
-            results_count=results.count()
+        key = SearchResultCache.make_key(terms, filters, page, page_size)
+        ranked = SearchResultCache.get_or_compute(key, rank_page)
+        total = ranked['total']
+        if results is None:
+            # Served from the cache, or the backend only ranks ids: fetch the products in order
+            products = Product.objects.in_bulk(ranked['ids'])
+            results = [products[product_id] for product_id in ranked['ids'] if product_id in products]
+        
+        # Log the search query off the request path
+        SearchLogBuffer.get_instance().log(
+            user.id if user is not None and user.is_authenticated else None,
+            query_text,
+            total
         )
         
-        return results
+        return {
+            'results': results,
+            'total': total,
+            'total_is_estimate': ranked.get('total_is_estimate', False),
+            'page': page,
+            'page_size': page_size,
+            'num_pages': -(-total // page_size),
+            'corrected_query': ' '.join(terms) if terms != cls.normalize_terms(query_text) else None,
+        }
+    
+    @classmethod
+    def get_facets(cls, query_text, filters=None):
+        """Category, price-bucket and availability counts for a search, in one grouped query.
+        
+        Matches are grouped by category and every other count is a
+        conditional aggregate of the same pass, so the cost is one query
+        returning one row per matching category. As usual for facets, each
+        facet ignores its own filter (the category facet still lists the
+        other categories) but applies all others; the category filter is
+        applied while summing the grouped rows. Cached like result pages.
+        """
+        filters = cls.normalize_filters(filters)
+        key = SearchResultCache.make_key(cls.search_terms(query_text), filters, 'facets', None)
+        return SearchResultCache.get_or_compute(key, lambda: cls._count_facets(query_text, filters))
+    
+    @classmethod
+    def _count_facets(cls, query_text, filters):
+        matches = get_backend().matching(cls.search_terms(query_text))
+        
+        price_q = cls.filter_q(filters, ('min_price', 'max_price'))
+        availability_q = cls.filter_q(filters, ('available',))
+        
+        aggregates = {
+            'matches': Count('id', filter=(price_q & availability_q) or None),
+            'available_count': Count('id', filter=price_q & Q(available=True)),
+            'unavailable_count': Count('id', filter=price_q & Q(available=False)),
+        }
+        buckets = list(zip(cls.PRICE_BUCKETS, cls.PRICE_BUCKETS[1:] + (None,)))
+        for index, (low, high) in enumerate(buckets):
+            bucket_q = Q(price__gte=low)
+            if high is not None:
+                bucket_q &= Q(price__lt=high)
+            aggregates[f'price_{index}'] = Count('id', filter=availability_q & bucket_q)
+        
+        rows = matches.values(
+            'category_id', 'category__name', 'category__slug'
+        ).annotate(**aggregates).order_by()
+        
+        categories = []
+        prices = [0] * len(buckets)
+        availability = {'available': 0, 'unavailable': 0}
+        for row in rows:
+            if row['matches']:
+                categories.append({
+                    'id': row['category_id'],
+                    'name': row['category__name'],
+                    'slug': row['category__slug'],
+                    'count': row['matches'],
+                })
+            if 'category' in filters and row['category__slug'] != filters['category']:
+                continue
+            for index in range(len(buckets)):
+                prices[index] += row[f'price_{index}']
+            availability['available'] += row['available_count']
+            availability['unavailable'] += row['unavailable_count']
+        
+        categories.sort(key=lambda category: (-category['count'], category['name']))
+        return {
+            'categories': categories,
+            'price': [
+                {'min': low, 'max': high, 'count': count}
+                for (low, high), count in zip(buckets, prices)
+            ],
+            'availability': availability,
+        }
     
     @staticmethod
-    def get_related_products(product):
-        """Get related products based on categories and tags"""
-        return Product.objects.filter(
-            Q(category=product.category) |
-            Q(tags__in=product.tags.all())
-        ).exclude(id=product.id).distinct()[:5]
+    def get_related_products(product, limit=5):
+        """Get related products from the precomputed table, falling back to the category.
+        
+        Lists are maintained by RelatedProductsBuilder; the fallback only
+        covers products saved since the last refresh ran.
+        """
+        related = list(
+            Product.objects.filter(
+                related_products_as_related__product=product,
+                available=True
+            ).order_by('related_products_as_related__rank')[:limit]
+        )
+        if related:
+            return related
+        
+        return list(
+            Product.objects.filter(
+                category_id=product.category_id,
+                available=True
+            ).exclude(id=product.id).order_by('-created')[:limit]
+        )
     
     @staticmethod
-    def get_trending_searches(days=7):
-        """Get trending search queries from the past n days"""
-        from django.utils import timezone
-        from django.db.models import Count
-        from datetime import timedelta
-        
-        return SearchQueryLog.objects.filter(
-            timestamp__gte=timezone.now() - timedelta(days=days)
-        ).values('query').annotate(
-            count=Count('query')
-        ).order_by('-count')[:10]
+    def get_trending_searches(window='7d', limit=10):
+        """Get trending search queries for a window ('1h', '24h' or '7d').
+        
+        Reads the streaming heavy-hitters summaries of TrendingSearches; each
+        result carries its ``count`` and the maximum overcount ``error``.
+        """
+        return TrendingSearches.top(window, limit)
@@ -0,0 +1,79 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+import logging
+
+from products.models import Category, Product
+from .autocomplete import AutocompleteIndex
+from .backends import get_backend
+from .cache import SearchResultCache
+from .spelling import SpellingCorrector
+from .tasks import refresh_related_products
+
+logger = logging.getLogger(__name__)
+
+@receiver(post_save, sender=Product)
+def update_product_search_index(sender, instance, **kwargs):
+    """Re-index a product in the search backend after it is saved"""
+    update_fields = kwargs.get('update_fields')
+    if update_fields and not {'name', 'description', 'category'} & set(update_fields):
+        return
+    try:
+        get_backend().index_product(instance)
+    except Exception as e:
+        logger.error(f"Error indexing product {instance.id} for search: {str(e)}", exc_info=True)
+
+@receiver(post_delete, sender=Product)
+def remove_product_search_index(sender, instance, **kwargs):
+    try:
+        get_backend().remove_product(instance.id)
+    except Exception as e:
+        logger.error(f"Error removing product {instance.id} from search: {str(e)}", exc_info=True)
+
+@receiver(post_save, sender=Category)
+def update_category_search_index(sender, instance, created, **kwargs):
+    """A renamed category changes the indexed text of all of its products"""
+    if created:
+        return
+    try:
+        get_backend().index_category(instance)
+    except Exception as e:
+        logger.error(f"Error re-indexing category {instance.id} for search: {str(e)}", exc_info=True)
+
+@receiver(post_save, sender=Product)
+def update_product_autocomplete(sender, instance, **kwargs):
+    """Apply the change to this process's autocomplete index, if it has one"""
+    index = AutocompleteIndex.get_loaded_instance()
+    if index is not None:
+        index.update_product(instance.id, instance.name, instance.slug, instance.available)
+
+@receiver(post_save, sender=Product)
+def update_spelling_vocabulary(sender, instance, **kwargs):
+    """Make the words of a saved product known to this process's spelling index"""
+    corrector = SpellingCorrector.get_loaded_instance()
+    if corrector is not None:
+        corrector.add_product(instance)
+
+@receiver(post_delete, sender=Product)
+def remove_product_autocomplete(sender, instance, **kwargs):
+    index = AutocompleteIndex.get_loaded_instance()
+    if index is not None:
+        index.remove_product(instance.id)
+
+@receiver(post_save, sender=Product)
+def schedule_related_products_refresh(sender, instance, **kwargs):
+    """Recompute related lists once the change is committed and visible to the worker"""
+    update_fields = kwargs.get('update_fields')
+    if update_fields and not {'name', 'description', 'category', 'available'} & set(update_fields):
+        return
+    product_id = instance.id
+    transaction.on_commit(lambda: refresh_related_products.delay(product_id))
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Category)
+def bump_catalog_version(sender, **kwargs):
+    """Any catalog write invalidates every cached search result page"""
+    try:
+        SearchResultCache.bump_catalog_version()
+    except Exception as e:
+        logger.error(f"Error bumping search catalog version: {str(e)}", exc_info=True)
@@ -0,0 +1,271 @@
+import re
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+import logging
+
+from django.db import close_old_connections
+
+from products.models import Product
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def edit_distance(source, target, max_distance):
+    """Optimal string alignment distance, or ``max_distance + 1`` once it is exceeded"""
+    if abs(len(source) - len(target)) > max_distance:
+        return max_distance + 1
+    previous2 = None
+    previous = list(range(len(target) + 1))
+    for i in range(1, len(source) + 1):
+        current = [i] + [0] * len(target)
+        for j in range(1, len(target) + 1):
+            cost = source[i - 1] != target[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (i > 1 and j > 1 and source[i - 1] == target[j - 2]
+                    and source[i - 2] == target[j - 1]):
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class SpellingCorrector:
+    """Per-process symmetric-delete (SymSpell) index of the catalogue vocabulary.
+
+    Every word of product names, category names and descriptions (what the
+    search backends match) is indexed under all strings obtained by deleting
+    up to ``MAX_EDIT_DISTANCE`` characters from its first ``PREFIX_LENGTH``
+    characters. A misspelled term generates its own deletes, and words
+    sharing one are candidates; the closest by edit distance (with
+    transpositions) wins, then the one in most products. A lookup is a few
+    dozen dict probes, so no query ever scans the product table.
+
+    Terms that are vocabulary words, or prefixes of one (still being typed),
+    are left as they are. Terms shorter than ``MIN_TERM_LENGTH`` are never
+    corrected and terms shorter than ``LONG_TERM_LENGTH`` only by one edit.
+
+    The index is built most frequent words first and stops taking words once
+    its estimated size reaches ``MAX_MEMORY_BYTES``; the measured size is
+    kept in ``memory_bytes`` and the words left out in ``truncated``. It is
+    rebuilt in a background thread every ``REBUILD_INTERVAL`` seconds and
+    products saved in this process add their words by signal.
+    """
+
+    MAX_EDIT_DISTANCE = 2
+    PREFIX_LENGTH = 7
+    MIN_TERM_LENGTH = 3
+    LONG_TERM_LENGTH = 6
+    MAX_MEMORY_BYTES = 32 * 1024 * 1024
+    CACHE_SIZE = 10000
+    REBUILD_INTERVAL = 3600
+
+    # Per-entry overhead used for the running estimate: a dict slot, plus a list for new keys
+    DICT_ENTRY_BYTES = 3 * 8
+    LIST_BYTES = sys.getsizeof([]) + 4 * 8
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, max_memory_bytes=None):
+        self.max_memory_bytes = max_memory_bytes or self.MAX_MEMORY_BYTES
+        self._lock = threading.Lock()
+        self._reset()
+        self._built = 0.0
+        self._rebuilding = False
+
+    def _reset(self):
+        self._words = {}  # word -> number of products containing it
+        self._sorted_words = []
+        self._deletes = {}  # delete -> words indexed under it
+        self._cache = {}
+        self._estimate = 0
+        self.memory_bytes = 0
+        self.truncated = 0
+
+    @classmethod
+    def get_instance(cls):
+        """Per-process index, built on first use"""
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    instance = cls()
+                    instance.build()
+                    cls._instance = instance
+        return cls._instance
+
+    @classmethod
+    def get_loaded_instance(cls):
+        """The index if this process has built one, without building it"""
+        return cls._instance
+
+    @classmethod
+    def _deletes_of(cls, word, max_distance):
+        key = word[:cls.PREFIX_LENGTH]
+        deletes = {key}
+        frontier = [key]
+        for _ in range(max_distance):
+            next_frontier = []
+            for item in frontier:
+                if len(item) <= 1:
+                    continue
+                for position in range(len(item)):
+                    delete = item[:position] + item[position + 1:]
+                    if delete not in deletes:
+                        deletes.add(delete)
+                        next_frontier.append(delete)
+            frontier = next_frontier
+        return deletes
+
+    @staticmethod
+    def tokenize(*texts):
+        return set(TOKEN_RE.findall(' '.join(text or '' for text in texts).lower()))
+
+    # Building
+
+    def build(self):
+        """Rebuild the index from the catalogue and swap it in"""
+        started = time.perf_counter()
+        frequencies = Counter()
+        for name, category, description in Product.objects.filter(
+            available=True
+        ).values_list('name', 'category__name', 'description').iterator():
+            frequencies.update(self.tokenize(name, category, description))
+
+        built = SpellingCorrector(self.max_memory_bytes)
+        by_frequency = sorted(frequencies.items(), key=lambda item: (-item[1], item[0]))
+        for position, (word, count) in enumerate(by_frequency):
+            if not built._add_word(word, count):
+                built.truncated = len(frequencies) - position
+                logger.warning(
+                    f"Spelling index reached its {self.max_memory_bytes} byte cap; "
+                    f"left out {built.truncated} rare words"
+                )
+                break
+        built._sorted_words = sorted(built._words)
+        built.memory_bytes = built.measure()
+
+        with self._lock:
+            self._words, self._sorted_words = built._words, built._sorted_words
+            self._deletes = built._deletes
+            self._estimate, self.memory_bytes = built._estimate, built.memory_bytes
+            self.truncated = built.truncated
+            self._cache = {}
+            self._built = time.monotonic()
+
+        logger.info(
+            f"Built spelling index of {len(self._words)} words and {len(self._deletes)} deletes "
+            f"({self.memory_bytes / 1024 / 1024:.1f} MiB) in {time.perf_counter() - started:.2f}s"
+        )
+
+    def _add_word(self, word, count):
+        """Index a word; returns False when the memory cap does not allow it"""
+        if word in self._words:
+            self._words[word] += count
+            return True
+        if word.isdigit() or len(word) < self.MIN_TERM_LENGTH:
+            return True
+
+        deletes = self._deletes_of(word, self.MAX_EDIT_DISTANCE)
+        size = sys.getsizeof(word) + self.DICT_ENTRY_BYTES + 8 * len(deletes) + sum(
+            sys.getsizeof(delete) + self.DICT_ENTRY_BYTES + self.LIST_BYTES
+            for delete in deletes
+            if delete not in self._deletes
+        )
+        if self._estimate + size > self.max_memory_bytes:
+            return False
+
+        self._estimate += size
+        self._words[word] = count
+        for delete in deletes:
+            self._deletes.setdefault(delete, []).append(word)
+        return True
+
+    def measure(self):
+        """Bytes held by the index structures (strings, lists and dicts)"""
+        words = sys.getsizeof(self._words) + sum(sys.getsizeof(word) for word in self._words)
+        deletes = sys.getsizeof(self._deletes) + sum(
+            sys.getsizeof(delete) + sys.getsizeof(candidates)
+            for delete, candidates in self._deletes.items()
+        )
+        return words + deletes + sys.getsizeof(self._sorted_words)
+
+    def _rebuild_in_background(self):
+        def run():
+            try:
+                self.build()
+            except Exception as e:
+                logger.error(f"Error rebuilding spelling index: {str(e)}", exc_info=True)
+            finally:
+                self._rebuilding = False
+                close_old_connections()
+
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+        threading.Thread(target=run, name='spelling-rebuild', daemon=True).start()
+
+    def add_product(self, product):
+        """Add the words of a saved product; rare words are skipped once the cap is reached"""
+        words = self.tokenize(
+            product.name,
+            product.category.name if product.category_id else '',
+            product.description
+        )
+        with self._lock:
+            added = [word for word in words if word not in self._words and self._add_word(word, 1)]
+            if added:
+                self._sorted_words = sorted(self._words)
+                self._cache = {}
+
+    # Lookups
+
+    def _is_known(self, term):
+        """A vocabulary word or the prefix of one"""
+        if term in self._words:
+            return True
+        position = bisect_left(self._sorted_words, term)
+        return position < len(self._sorted_words) and self._sorted_words[position].startswith(term)
+
+    def correct(self, term):
+        """The most likely intended vocabulary word for ``term``, or ``term`` itself"""
+        if len(term) < self.MIN_TERM_LENGTH or term.isdigit():
+            return term
+        if time.monotonic() - self._built > self.REBUILD_INTERVAL:
+            self._rebuild_in_background()
+
+        with self._lock:
+            cached = self._cache.get(term)
+            if cached is not None:
+                return cached
+            if self._is_known(term):
+                return term
+
+            max_distance = self.MAX_EDIT_DISTANCE if len(term) >= self.LONG_TERM_LENGTH else 1
+            best = None
+            seen = set()
+            for delete in self._deletes_of(term, max_distance):
+                for word in self._deletes.get(delete, ()):
+                    if word in seen:
+                        continue
+                    seen.add(word)
+                    distance = edit_distance(term, word, max_distance)
+                    if distance <= max_distance:
+                        candidate = (distance, -self._words[word], word)
+                        if best is None or candidate < best:
+                            best = candidate
+
+            correction = best[2] if best is not None else term
+            if len(self._cache) >= self.CACHE_SIZE:
+                self._cache = {}
+            self._cache[term] = correction
+        return correction
+
+    def correct_terms(self, terms):
+        return [self.correct(term) for term in terms]
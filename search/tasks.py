@@ -0,0 +1,23 @@
+from celery import shared_task
+from .backends import get_backend
+from .related import RelatedProductsBuilder
+
+@shared_task
+def refresh_related_products(product_id):
+    """Recompute the related lists affected by a product change"""
+    return RelatedProductsBuilder.refresh_for_product(product_id)
+
+@shared_task
+def update_related_products():
+    """Refresh the related lists of recently viewed products"""
+    return RelatedProductsBuilder.update()
+
+@shared_task
+def rebuild_related_products():
+    """Recompute every related-products list"""
+    return RelatedProductsBuilder.rebuild()
+
+@shared_task
+def compact_search_index():
+    """Fold the search index delta log into a fresh segment once it grows too large"""
+    return get_backend().compact() or 0
@@ -0,0 +1,657 @@
+import threading
+import time
+from unittest import mock
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import F, Q
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory
+
+from analytics.models import SearchQueryCount
+from products.models import Category, Product
+from recommendations.models import UserProductInteraction
+from .autocomplete import AutocompleteIndex
+from .backends import get_backend, reset_backend
+from .backends.bm25 import BM25SearchBackend
+from .cache import SearchResultCache
+from .indexing import ProductSearchIndexer
+from .related import RelatedProductsBuilder
+from .services import SearchService
+from .views import search
+from .spelling import SpellingCorrector, edit_distance
+from .tasks import compact_search_index
+
+
+@pytest.fixture(params=['bm25', 'postgres'])
+def backend(request, db, settings, tmp_path):
+    """Every test runs against each backend the database supports"""
+    if request.param == 'postgres' and connection.vendor != 'postgresql':
+        pytest.skip('PostgreSQL full-text search needs a PostgreSQL database')
+    settings.SEARCH_BACKEND = request.param
+    settings.SEARCH_BM25_INDEX_DIR = tmp_path / 'search_index'
+    settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+    reset_backend()
+    SpellingCorrector._instance = None
+    yield get_backend()
+    reset_backend()
+    SpellingCorrector._instance = None
+
+
+@pytest.fixture
+def catalog(backend):
+    phones = Category.objects.create(name='Phones', slug='phones')
+    kitchen = Category.objects.create(name='Kitchen', slug='kitchen')
+    products = {
+        'phone': Product.objects.create(
+            category=phones, name='Android Phone', slug='android-phone',
+            description='Large screen and a long lasting battery', price=300
+        ),
+        'case': Product.objects.create(
+            category=phones, name='Leather Case', slug='leather-case',
+            description='Fits most android phone models', price=20
+        ),
+        'charger': Product.objects.create(
+            category=phones, name='Battery Charger', slug='battery-charger',
+            description='Charges a phone battery in an hour', price=25, available=False
+        ),
+        'kettle': Product.objects.create(
+            category=kitchen, name='Electric Kettle', slug='electric-kettle',
+            description='Boils water quickly', price=40
+        ),
+    }
+    backend.rebuild()
+    return products
+
+
+def ids(*products):
+    return [product.id for product in products]
+
+
+@pytest.mark.django_db
+class TestSearchBackends:
+    def test_name_match_outranks_description_match(self, backend, catalog):
+        hits = backend.search(['android'], Q(), 0, 10)
+        assert hits.ids == ids(catalog['phone'], catalog['case'])
+        assert hits.total == 2
+
+    def test_terms_match_by_prefix(self, backend, catalog):
+        hits = backend.search(['kett'], Q(), 0, 10)
+        assert hits.ids == ids(catalog['kettle'])
+
+    def test_every_term_must_match(self, backend, catalog):
+        assert set(backend.search(['phone', 'battery'], Q(), 0, 10).ids) == {
+            catalog['phone'].id, catalog['charger'].id
+        }
+        assert backend.search(['phone', 'water'], Q(), 0, 10).ids == []
+
+    def test_category_name_is_searchable(self, backend, catalog):
+        assert backend.search(['kitchen'], Q(), 0, 10).ids == ids(catalog['kettle'])
+
+    def test_filters_apply_to_results_and_total(self, backend, catalog):
+        hits = backend.search(['phone'], Q(available=True, price__lte=100), 0, 10)
+        assert hits.ids == ids(catalog['case'])
+        assert hits.total == 1
+
+    def test_pages_are_stable_slices(self, backend, catalog):
+        everything = backend.search(['phone'], Q(), 0, 10).ids
+        pages = backend.search(['phone'], Q(), 0, 2).ids + backend.search(['phone'], Q(), 2, 2).ids
+        assert pages == everything
+        assert backend.search(['phone'], Q(), 10, 2).ids == []
+
+    def test_edits_are_searchable(self, backend, catalog):
+        kettle = catalog['kettle']
+        kettle.name = 'Gooseneck Kettle'
+        kettle.save()
+        assert backend.search(['gooseneck'], Q(), 0, 10).ids == ids(kettle)
+        assert backend.search(['electric'], Q(), 0, 10).ids == []
+
+    def test_new_products_are_searchable(self, backend, catalog):
+        toaster = Product.objects.create(
+            category=catalog['kettle'].category, name='Toaster', slug='toaster', price=30
+        )
+        assert backend.search(['toast'], Q(), 0, 10).ids == ids(toaster)
+
+    def test_deleted_products_disappear(self, backend, catalog):
+        case_id = catalog['case'].id
+        catalog['case'].delete()
+        assert case_id not in backend.search(['android'], Q(), 0, 10).ids
+
+    def test_renamed_category_is_reindexed(self, backend, catalog):
+        category = catalog['kettle'].category
+        category.name = 'Appliances'
+        category.save()
+        assert backend.search(['appliances'], Q(), 0, 10).ids == ids(catalog['kettle'])
+
+    def test_matching_feeds_facets(self, backend, catalog):
+        assert set(backend.matching(['phone']).values_list('id', flat=True)) == {
+            catalog['phone'].id, catalog['case'].id, catalog['charger'].id
+        }
+
+    def test_search_service_uses_backend(self, backend, catalog):
+        with mock.patch('search.services.SearchLogBuffer'):
+            page = SearchService.search_products('android', page_size=1)
+        assert page['results'] == [catalog['phone']]
+        assert page['total'] == 2
+        assert page['num_pages'] == 2
+
+    def test_page_size_is_clamped(self, backend, catalog):
+        with mock.patch('search.services.SearchLogBuffer'):
+            page = SearchService.search_products('android', page_size=-5)
+        assert page['page_size'] == 1
+        assert page['results'] == [catalog['phone']]
+        assert page['num_pages'] == 2
+
+    def test_misspelled_terms_are_corrected_before_searching(self, backend, catalog):
+        page = SearchService.search_products('andriod phnoe')
+        assert page['corrected_query'] == 'android phone'
+        assert page['results'][0] == catalog['phone']
+
+
+@pytest.mark.django_db
+class TestBM25Index:
+    @pytest.fixture
+    def bm25(self, settings, tmp_path):
+        settings.SEARCH_BACKEND = 'bm25'
+        settings.SEARCH_BM25_INDEX_DIR = tmp_path / 'search_index'
+        settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        reset_backend()
+        SpellingCorrector._instance = None
+        yield get_backend()
+        reset_backend()
+        SpellingCorrector._instance = None
+
+    def test_compact_rebuilds_only_past_the_delta_cap(self, bm25, catalog, monkeypatch):
+        catalog['kettle'].name = 'Gooseneck Kettle'
+        catalog['kettle'].save()
+        size = bm25.store.pending_bytes(bm25.store.read()[1])
+        assert size > 0
+
+        assert bm25.compact(max_delta_bytes=size) is None
+        assert bm25.store.pending_bytes(bm25.store.read()[1]) == size
+
+        monkeypatch.setattr(BM25SearchBackend, 'DELTA_COMPACT_BYTES', size - 1)
+        assert compact_search_index() == 4
+        assert bm25.store.pending_bytes(bm25.store.read()[1]) == 0
+        assert bm25._delta == {}
+        assert bm25.search(['gooseneck'], Q(), 0, 10).ids == ids(catalog['kettle'])
+
+    def test_rebuild_switches_every_file_at_once(self, bm25, catalog):
+        reader = BM25SearchBackend(bm25.path)
+        old_segment = bm25.store.read()[1]['segment']
+
+        catalog['case'].delete()
+        bm25.rebuild()
+        assert [path.name for path in bm25.path.glob('segment-*')] == [bm25.store.read()[1]['segment']]
+        assert not (bm25.path / old_segment).exists()
+
+        assert reader.search(['android'], Q(), 0, 10).ids == ids(catalog['phone'])
+        assert len(reader.ids) == len(reader.lengths) == 3
+
+    def test_updates_racing_a_rebuild_are_kept(self, bm25, catalog):
+        kettle_id = catalog['kettle'].id
+        analyze = BM25SearchBackend.analyze.__func__
+        removed = []
+
+        def remove_while_building(cls, name, category_name, description):
+            if not removed:
+                removed.append(kettle_id)
+                BM25SearchBackend(bm25.path).remove_product(kettle_id)
+            return analyze(cls, name, category_name, description)
+
+        with mock.patch.object(BM25SearchBackend, 'analyze', classmethod(remove_while_building)):
+            bm25.rebuild()
+        assert bm25.search(['kettle'], Q(), 0, 10).ids == []
+
+        # A writer that read CURRENT before the switch appends to the rotated-out log
+        sealed = bm25.store.read()[1]['deltas'][0]
+        def append_to_sealed(data):
+            with open(bm25.path / sealed, 'ab') as delta:
+                delta.write(data)
+
+        with mock.patch.object(bm25.store, 'append', side_effect=append_to_sealed):
+            bm25.remove_product(catalog['case'].id)
+        reader = BM25SearchBackend(bm25.path)
+        assert reader.search(['android'], Q(), 0, 10).ids == ids(catalog['phone'])
+        assert reader.search(['kettle'], Q(), 0, 10).ids == []
+
+    def test_capped_totals_are_flagged_as_estimates(self, bm25, catalog, monkeypatch):
+        assert not bm25.search(['phone'], Q(), 0, 10).total_is_estimate
+
+        monkeypatch.setattr(BM25SearchBackend, 'MAX_CANDIDATES', 2)
+        hits = bm25.search(['phone'], Q(), 0, 10)
+        assert hits.total == 2
+        assert hits.total_is_estimate
+        with mock.patch('search.services.SearchLogBuffer'):
+            response = search(APIRequestFactory().get('/api/search/', {'q': 'phone'}))
+        assert response.data['total_is_estimate'] is True
+
+
+@pytest.mark.django_db
+class TestProductSearchIndexer:
+    @pytest.fixture
+    def postgres(self, db):
+        if connection.vendor != 'postgresql':
+            pytest.skip('Stored search vectors need a PostgreSQL database')
+
+    @pytest.fixture
+    def products(self, db):
+        audio = Category.objects.create(name='Audio', slug='audio')
+        return {
+            'speaker': Product.objects.create(
+                category=audio, name='Bluetooth Speaker', slug='bluetooth-speaker',
+                description='Pairs with any phone', price=60
+            ),
+            'headphones': Product.objects.create(
+                category=audio, name='Wired Headphones', slug='wired-headphones',
+                description='Sounds better than a bluetooth pair', price=40
+            ),
+        }
+
+    def matching(self, term):
+        return set(Product.objects.filter(search_vector=term).values_list('id', flat=True))
+
+    def test_fields_are_weighted_name_first(self, postgres, products):
+        ProductSearchIndexer.rebuild()
+        ranked = Product.objects.filter(search_vector='bluetooth').annotate(
+            rank=SearchRank(F('search_vector'), SearchQuery('bluetooth'))
+        ).order_by('-rank')
+        assert list(ranked) == [products['speaker'], products['headphones']]
+
+    def test_update_product_stores_its_vector(self, postgres, products):
+        speaker = products['speaker']
+        Product.objects.filter(id=speaker.id).update(name='Portable Radio', search_vector=None)
+        speaker.refresh_from_db()
+        assert ProductSearchIndexer.update_product(speaker) == 1
+        assert self.matching('radio') == {speaker.id}
+        assert self.matching('audio') >= {speaker.id}
+
+    def test_update_category_revectors_every_batch(self, postgres, products):
+        category = products['speaker'].category
+        Category.objects.filter(id=category.id).update(name='Sound')
+        category.refresh_from_db()
+        with mock.patch.object(ProductSearchIndexer, 'BATCH_SIZE', 1):
+            assert ProductSearchIndexer.update_category(category) == 2
+        assert self.matching('sound') == {products['speaker'].id, products['headphones'].id}
+        assert self.matching('audio') == set()
+
+    def test_other_databases_are_left_alone(self, products):
+        if ProductSearchIndexer.is_supported():
+            pytest.skip('Runs only where stored vectors are unsupported')
+        assert ProductSearchIndexer.update_product(products['speaker']) == 0
+        assert ProductSearchIndexer.update_category(products['speaker'].category) == 0
+        assert ProductSearchIndexer.rebuild() == 0
+
+
+@pytest.mark.django_db
+class TestAutocompleteIndex:
+    @pytest.fixture
+    def index(self, db):
+        phones = Category.objects.create(name='Phones', slug='phones')
+        self.iphone = Product.objects.create(category=phones, name='Apple iPhone', slug='apple-iphone', price=900)
+        self.pixel = Product.objects.create(category=phones, name='Pixel Phone', slug='pixel-phone', price=600)
+        self.retired = Product.objects.create(
+            category=phones, name='Phone Classic', slug='phone-classic', price=100, available=False
+        )
+        user = get_user_model().objects.create_user(username='shopper', email='shopper@example.com')
+        UserProductInteraction.objects.bulk_create([
+            UserProductInteraction(user=user, product=self.pixel, interaction_type='view') for _ in range(10)
+        ])
+        hour = timezone.now().replace(minute=0, second=0, microsecond=0)
+        SearchQueryCount.objects.create(query='phone case', hour=hour, count=50)
+        SearchQueryCount.objects.create(query='phablet', hour=hour, count=1)  # Too rare to suggest
+
+        index = AutocompleteIndex()
+        index.build()
+        AutocompleteIndex._instance = index
+        yield index
+        AutocompleteIndex._instance = None
+
+    def texts(self, suggestions):
+        return [suggestion['text'] for suggestion in suggestions]
+
+    def test_every_word_of_a_name_is_a_prefix(self, index):
+        assert self.texts(index.lookup('iph')) == ['Apple iPhone']
+        assert self.texts(index.lookup('APPLE  i')) == ['Apple iPhone']
+
+    def test_suggestions_are_ranked_by_popularity(self, index):
+        suggestions = index.lookup('ph')
+        assert self.texts(suggestions) == ['phone case', 'Pixel Phone', 'Phones']
+        assert [suggestion['type'] for suggestion in suggestions] == ['query', 'product', 'category']
+        assert suggestions[1]['slug'] == 'pixel-phone'
+
+    def test_limit_applies_to_cached_prefixes(self, index):
+        assert self.texts(index.lookup('ph', limit=1)) == ['phone case']
+        assert len(index.lookup('ph')) == 3
+
+    def test_saved_products_update_the_loaded_index(self, index):
+        assert index.lookup('ph')  # Caches the short prefix
+        self.iphone.name = 'Phone Mini'
+        self.iphone.save()
+        assert 'Phone Mini' in self.texts(index.lookup('ph'))
+        assert index.lookup('iph') == []
+
+        self.pixel.available = False
+        self.pixel.save()
+        assert 'Pixel Phone' not in self.texts(index.lookup('ph'))
+
+    def test_deleted_products_disappear(self, index):
+        self.iphone.delete()
+        assert index.lookup('apple') == []
+
+    def test_changes_from_other_processes_are_picked_up(self, index):
+        index.lookup('ph')
+        # Written without signals, as another process would
+        Product.objects.filter(id=self.retired.id).update(available=True, updated=timezone.now())
+        index._checked -= AutocompleteIndex.REFRESH_INTERVAL
+        assert 'Phone Classic' in self.texts(index.lookup('ph'))
+
+    def test_empty_prefix_has_no_suggestions(self, index):
+        assert index.lookup('  ') == []
+
+
+class TestSearchResultCache:
+    @pytest.fixture(autouse=True)
+    def local_cache(self, settings):
+        settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        cache.clear()
+        yield
+        cache.clear()
+
+    def key(self, query='shoes'):
+        return SearchResultCache.make_key([query], {}, 1, 20)
+
+    def test_hits_do_not_recompute(self):
+        compute = mock.Mock(return_value={'ids': [1, 2], 'total': 2})
+        assert SearchResultCache.get_or_compute(self.key(), compute) == {'ids': [1, 2], 'total': 2}
+        assert SearchResultCache.get_or_compute(self.key(), compute) == {'ids': [1, 2], 'total': 2}
+        compute.assert_called_once()
+
+    def test_catalog_version_is_part_of_the_key(self):
+        key = self.key()
+        assert self.key() == key
+        assert self.key('boots') != key
+        SearchResultCache.bump_catalog_version()
+        assert self.key() != key
+
+    def test_lost_version_key_still_invalidates(self):
+        key = self.key()
+        cache.delete(SearchResultCache.VERSION_KEY)
+        SearchResultCache.bump_catalog_version()
+        assert self.key() != key
+
+    @pytest.mark.django_db
+    def test_catalog_writes_bump_the_version(self):
+        version = SearchResultCache.catalog_version()
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        Product.objects.create(category=category, name='Runner', slug='runner', price=80)
+        assert SearchResultCache.catalog_version() == version + 2
+
+    def test_concurrent_misses_compute_once(self):
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return {'ids': [7], 'total': 1}
+
+        results = []
+        first = threading.Thread(target=lambda: results.append(SearchResultCache.get_or_compute(self.key(), compute)))
+        first.start()
+        started.wait(5)
+        waiter = threading.Thread(target=lambda: results.append(SearchResultCache.get_or_compute(self.key(), compute)))
+        waiter.start()
+        time.sleep(SearchResultCache.POLL_INTERVAL * 2)
+        release.set()
+        first.join(5)
+        waiter.join(5)
+
+        assert len(calls) == 1
+        assert results == [{'ids': [7], 'total': 1}] * 2
+        assert cache.get(f'{self.key()}:lock') is None
+
+    def test_waiter_computes_itself_after_the_timeout(self):
+        cache.add(f'{self.key()}:lock', 'another-process', SearchResultCache.LOCK_TTL)
+        compute = mock.Mock(return_value={'ids': [], 'total': 0})
+        with mock.patch.object(SearchResultCache, 'WAIT_TIMEOUT', 0.1):
+            assert SearchResultCache.get_or_compute(self.key(), compute) == {'ids': [], 'total': 0}
+        compute.assert_called_once()
+
+    def test_failed_compute_releases_the_lock(self):
+        with pytest.raises(RuntimeError):
+            SearchResultCache.get_or_compute(self.key(), mock.Mock(side_effect=RuntimeError('boom')))
+        assert cache.get(f'{self.key()}:lock') is None
+        assert cache.get(self.key()) is None
+
+    def test_search_pages_are_served_from_the_cache(self, backend, catalog):
+        with mock.patch('search.services.SearchLogBuffer'), \
+                mock.patch.object(backend, 'search', wraps=backend.search) as search:
+            first = SearchService.search_products('android')
+            second = SearchService.search_products('Android!')
+        search.assert_called_once()
+        assert second['results'] == first['results'] == [catalog['phone'], catalog['case']]
+        assert second['total'] == 2
+
+
+@pytest.mark.django_db
+class TestSearchFacets:
+    @pytest.fixture
+    def stand(self, catalog):
+        return Product.objects.create(
+            category=catalog['kettle'].category, name='Phone Stand', slug='phone-stand', price=15
+        )
+
+    def categories(self, facets):
+        return [(category['slug'], category['count']) for category in facets['categories']]
+
+    def prices(self, facets):
+        return {bucket['min']: bucket['count'] for bucket in facets['price'] if bucket['count']}
+
+    def test_counts_of_every_facet(self, backend, catalog):
+        facets = SearchService.get_facets('phone')
+        assert self.categories(facets) == [('phones', 3)]
+        assert self.prices(facets) == {0: 1, 25: 1, 250: 1}
+        assert facets['availability'] == {'available': 2, 'unavailable': 1}
+        assert [bucket['max'] for bucket in facets['price']] == [25, 50, 100, 250, 500, 1000, None]
+
+    def test_category_facet_ignores_the_category_filter(self, backend, catalog, stand):
+        facets = SearchService.get_facets('phone', {'category': 'kitchen'})
+        assert self.categories(facets) == [('phones', 3), ('kitchen', 1)]
+        assert self.prices(facets) == {0: 1}
+        assert facets['availability'] == {'available': 1, 'unavailable': 0}
+
+    def test_price_facet_ignores_the_price_filter(self, backend, catalog, stand):
+        facets = SearchService.get_facets('phone', {'max_price': 25})
+        assert self.categories(facets) == [('phones', 2), ('kitchen', 1)]
+        assert self.prices(facets) == {0: 2, 25: 1, 250: 1}
+        assert facets['availability'] == {'available': 2, 'unavailable': 1}
+
+    def test_availability_facet_ignores_the_availability_filter(self, backend, catalog, stand):
+        facets = SearchService.get_facets('phone', {'available': 'true'})
+        assert self.categories(facets) == [('phones', 2), ('kitchen', 1)]
+        assert self.prices(facets) == {0: 2, 250: 1}
+        assert facets['availability'] == {'available': 3, 'unavailable': 1}
+
+    @pytest.mark.parametrize('params', [{'min_price': 'abc'}, {'max_price': 'NaN'}, {'max_price': 'inf'}])
+    def test_invalid_price_filters_are_rejected(self, backend, catalog, params):
+        response = search(APIRequestFactory().get('/api/search/', {'q': 'phone', **params}))
+        assert response.status_code == 400
+
+    def test_price_filters_reach_results_and_facets(self, backend, catalog):
+        with mock.patch('search.services.SearchLogBuffer'):
+            response = search(APIRequestFactory().get('/api/search/', {'q': 'phone', 'max_price': '25.00'}))
+        assert response.status_code == 200
+        assert {product['id'] for product in response.data['results']} == {
+            catalog['case'].id, catalog['charger'].id
+        }
+        assert self.categories(response.data['facets']) == [('phones', 2)]
+
+    def test_counts_come_from_one_query(self, backend, catalog, django_assert_num_queries):
+        SpellingCorrector.get_instance()
+        with django_assert_num_queries(1):
+            SearchService._count_facets('phone', {})
+
+    def test_facets_are_cached_until_the_catalog_changes(self, backend, catalog, stand):
+        with mock.patch.object(SearchService, '_count_facets', wraps=SearchService._count_facets) as count:
+            SearchService.get_facets('phone')
+            assert SearchService.get_facets('phone')['availability']['available'] == 3
+            assert count.call_count == 1
+
+            stand.available = False
+            stand.save()
+            assert SearchService.get_facets('phone')['availability']['available'] == 2
+            assert count.call_count == 2
+
+
+@pytest.mark.django_db
+class TestSpellingCorrector:
+    @pytest.fixture
+    def corrector(self, db):
+        category = Category.objects.create(name='Audio', slug='audio')
+        for name, description in (
+            ('Wireless Headphones', 'Noise cancelling'),
+            ('Wired Headphones', 'Studio monitor'),
+            ('Bluetooth Speaker', 'Waterproof bottle shaped speaker'),
+        ):
+            Product.objects.create(category=category, name=name, slug=name.lower().replace(' ', '-'),
+                                   description=description, price=50)
+        corrector = SpellingCorrector()
+        corrector.build()
+        return corrector
+
+    def test_edit_distance_counts_transpositions(self):
+        assert edit_distance('speaekr', 'speaker', 2) == 1
+        assert edit_distance('kitten', 'sitting', 2) == 3
+
+    @pytest.mark.parametrize('term, expected', [
+        ('headphoens', 'headphones'),
+        ('wirless', 'wireless'),
+        ('bluetoth', 'bluetooth'),
+        ('speakr', 'speaker'),
+        ('bottle', 'bottle'),  # Description words are known too
+        ('head', 'head'),  # A prefix is still being typed
+        ('zzzzzz', 'zzzzzz'),  # Nothing close enough
+        ('xq', 'xq'),  # Too short to correct
+    ])
+    def test_corrections(self, corrector, term, expected):
+        assert corrector.correct(term) == expected
+
+    def test_closest_word_wins(self, corrector):
+        assert corrector.correct('wires') == 'wired'
+        assert corrector.correct('headphonez') == 'headphones'
+
+    def test_saved_products_extend_the_vocabulary(self, corrector):
+        Product.objects.create(category=Category.objects.first(), name='Turntable', slug='turntable', price=200)
+        corrector.add_product(Product.objects.get(slug='turntable'))
+        assert corrector.correct('turntabel') == 'turntable'
+
+    def test_memory_cap_drops_rare_words(self, corrector):
+        capped = SpellingCorrector(max_memory_bytes=corrector.memory_bytes // 2)
+        capped.build()
+        assert 0 < len(capped._words) < len(corrector._words)
+        assert capped.truncated == len(corrector._words) - len(capped._words)
+        assert capped.memory_bytes < corrector.memory_bytes
+
+    def test_lookups_take_microseconds(self, corrector):
+        terms = ['headphoens', 'wirless', 'speakr', 'bluetoth', 'zzzzzz'] * 200
+        started = time.perf_counter()
+        for term in terms:
+            corrector._cache = {}
+            corrector.correct(term)
+        assert (time.perf_counter() - started) / len(terms) < 0.001
+
+
+@pytest.mark.django_db
+class TestRelatedProducts:
+    @pytest.fixture
+    def products(self, db):
+        shoes = Category.objects.create(name='Shoes', slug='shoes')
+        bags = Category.objects.create(name='Bags', slug='bags')
+        return {
+            'runner': Product.objects.create(category=shoes, name='Runner', slug='runner', price=80),
+            'trail': Product.objects.create(category=shoes, name='Trail', slug='trail', price=90),
+            'boot': Product.objects.create(category=shoes, name='Boot', slug='boot', price=120),
+            'backpack': Product.objects.create(category=bags, name='Backpack', slug='backpack', price=60),
+            'tote': Product.objects.create(category=bags, name='Tote', slug='tote', price=30),
+        }
+
+    @pytest.fixture(autouse=True)
+    def no_text_neighbors(self):
+        with mock.patch('search.related.ProductVectorIndex') as index:
+            index.get_instance.return_value.similar_to.return_value = []
+            yield
+
+    def view(self, users, *products):
+        UserProductInteraction.objects.bulk_create([
+            UserProductInteraction(user=user, product=product, interaction_type='view')
+            for user in users
+            for product in products
+        ])
+
+    def test_coviews_rank_above_category(self, products):
+        users = [
+            get_user_model().objects.create_user(username=f'user{i}', email=f'user{i}@example.com', password='x')
+            for i in range(3)
+        ]
+        self.view(users, products['runner'], products['backpack'])
+
+        RelatedProductsBuilder.refresh_products([products['runner'].id])
+        related = SearchService.get_related_products(products['runner'])
+        assert related[0] == products['backpack']
+        assert set(related[1:]) == {products['trail'], products['boot']}
+
+    def test_unavailable_products_are_left_out(self, products):
+        products['trail'].available = False
+        products['trail'].save()
+
+        RelatedProductsBuilder.refresh_products([products['runner'].id])
+        assert SearchService.get_related_products(products['runner']) == [products['boot']]
+
+    def test_product_change_refreshes_lists_containing_it(self, products):
+        RelatedProductsBuilder.refresh_products([products['runner'].id])
+        boot = products['boot']
+        boot.category = products['tote'].category
+        boot.save()
+
+        RelatedProductsBuilder.refresh_for_product(boot.id)
+        assert SearchService.get_related_products(products['runner']) == [products['trail']]
+        assert SearchService.get_related_products(boot) == [products['backpack'], products['tote']]
+
+
+@pytest.mark.django_db
+class TestSearchLatency:
+    PRODUCTS = 1000
+    QUERIES = ('red', 'shoe', 'red shoe', 'ca', 'blue cotton', 'leather bag')
+    P99_BUDGET = 0.1  # Seconds per ranked page
+
+    def test_p99_within_budget(self, backend):
+        category = Category.objects.create(name='Apparel', slug='apparel')
+        colors = ('red', 'blue', 'green', 'black', 'white')
+        kinds = ('shoe', 'shirt', 'cap', 'bag', 'coat')
+        materials = ('cotton', 'leather', 'wool', 'canvas')
+        Product.objects.bulk_create([
+            Product(
+                category=category,
+                name=f'{colors[i % 5]} {kinds[i // 5 % 5]} {i}',
+                slug=f'product-{i}',
+                description=f'{materials[i % 4]} {kinds[i % 5]} in {colors[i // 5 % 5]}',
+                price=10 + i % 90
+            )
+            for i in range(self.PRODUCTS)
+        ])
+        backend.rebuild()
+
+        timings = []
+        for _ in range(10):
+            for query in self.QUERIES:
+                started = time.perf_counter()
+                hits = backend.search(query.split(), Q(available=True), 0, 20)
+                timings.append(time.perf_counter() - started)
+                assert hits.total > 0
+        timings.sort()
+        assert timings[int(len(timings) * 0.99) - 1] < self.P99_BUDGET
@@ -0,0 +1,85 @@
+from decimal import Decimal, InvalidOperation
+
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework import status
+
+from .autocomplete import AutocompleteIndex
+from .services import SearchService
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def autocomplete(request):
+    """Suggest products, categories and popular searches for a typed prefix"""
+    prefix = request.GET.get('q', '')
+    try:
+        limit = int(request.GET.get('limit', AutocompleteIndex.LIMIT))
+    except ValueError:
+        return Response(
+            {"error": "limit must be an integer"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    suggestions = AutocompleteIndex.get_instance().lookup(prefix, max(limit, 1))
+    return Response({
+        'query': prefix,
+        'suggestions': suggestions,
+    })
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def search(request):
+    """Ranked product search with category, price and availability facets.
+    
+    ``total_is_estimate`` is true when the search backend stopped ranking at
+    its candidate cap (5000 matches for BM25); ``total`` and ``num_pages``
+    are then lower bounds.
+    """
+    query = request.GET.get('q', '')
+    try:
+        page = int(request.GET.get('page', 1))
+        page_size = int(request.GET.get('page_size', SearchService.DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return Response(
+            {"error": "page and page_size must be integers"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    filters = {name: request.GET.get(name) for name in SearchService.FILTERS}
+    try:
+        for name in ('min_price', 'max_price'):
+            if filters[name] not in (None, ''):
+                filters[name] = Decimal(filters[name])
+                if not filters[name].is_finite():
+                    raise InvalidOperation
+    except InvalidOperation:
+        return Response(
+            {"error": "min_price and max_price must be numbers"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    user = request.user if request.user.is_authenticated else None
+    results = SearchService.search_products(query, user=user, page=page, page_size=page_size, filters=filters)
+    
+    return Response({
+        'query': query,
+        'corrected_query': results['corrected_query'],
+        'total': results['total'],
+        'total_is_estimate': results['total_is_estimate'],
+        'page': results['page'],
+        'page_size': results['page_size'],
+        'num_pages': results['num_pages'],
+        'results': [
+            {
+                'id': product.id,
+                'name': product.name,
+                'slug': product.slug,
+                'price': product.price,
+                'available': product.available,
+                'category_id': product.category_id,
+            }
+            for product in results['results']
+        ],
+        'facets': SearchService.get_facets(query, filters),
+    })